@@ -0,0 +1,121 @@
+"""Compare event-loop occupancy with and without the decode worker.
+
+Feeds bursts of plugMetering messages through the message router and
+measures how long the event loop spends in router code per message.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/decode_worker.py [devices] [bursts]
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.qubo_local import router as router_module  # noqa: E402
+
+LOOP_METHODS = ("_async_message_received", "_async_submit_batch", "_async_deliver_batch")
+
+
+def metering_payload(device_uuid: str, sample: int) -> bytes:
+    """Build a plugMetering monitor payload like the ones devices send."""
+    return json.dumps(
+        {
+            "devices": {
+                "deviceUUID": device_uuid,
+                "entityUUID": f"{device_uuid}-entity",
+                "unitUUID": "4f1e7c7e-2d4b-4d52-9a53-0f4c2f0b6a11",
+                "services": {
+                    "plugMetering": {
+                        "events": {
+                            "stateChanged": {
+                                "power": str(100 + sample % 50),
+                                "voltage": "231.4",
+                                "current": "452",
+                                "consumption": str(12.5 + sample / 1000),
+                            }
+                        },
+                        "instanceId": "0",
+                    }
+                },
+            }
+        }
+    ).encode()
+
+
+async def run(devices: int, bursts: int, worker: bool) -> tuple[float, float]:
+    """Return (loop µs per message, wall seconds) for one configuration."""
+    loop = asyncio.get_running_loop()
+    handlers = {}
+
+    async def fake_subscribe(topic, payload_callback, qos):
+        handlers[topic] = payload_callback
+        return lambda: None
+
+    router = router_module.QuboMessageRouter(SimpleNamespace(loop=loop, data={}))
+    await router.async_set_transport(
+        SimpleNamespace(name="fake", connected=False, async_subscribe=fake_subscribe)
+    )
+    # Keep overload merging out of the way so every message is decoded
+    router.async_configure(10**9, 10**9)
+    router.async_set_decode_worker(worker)
+
+    loop_time = 0.0
+    for name in LOOP_METHODS:
+        method = getattr(router, name)
+
+        def timed(*args, _method=method):
+            nonlocal loop_time
+            start = time.perf_counter()
+            _method(*args)
+            loop_time += time.perf_counter() - start
+
+        setattr(router, name, timed)
+
+    delivered = 0
+
+    def handler(state):
+        nonlocal delivered
+        delivered += 1
+
+    topics = [f"/monitor/unit/device-{index:04d}/plugMetering" for index in range(devices)]
+    for topic in topics:
+        # Four sensors share each metering topic, like a real plug
+        for _ in range(4):
+            await router.async_subscribe(topic, handler)
+
+    total = devices * bursts
+    started = time.perf_counter()
+    for burst in range(bursts):
+        for index, topic in enumerate(topics):
+            handlers[topic](metering_payload(f"device-{index:04d}", burst))
+        await asyncio.sleep(0)
+
+    while delivered < total * 4:
+        await asyncio.sleep(0.001)
+    wall = time.perf_counter() - started
+
+    router.async_set_decode_worker(False)
+    return loop_time / total * 1_000_000, wall
+
+
+async def main() -> None:
+    """Run both configurations and print a comparison."""
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    bursts = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print(f"{devices} devices x {bursts} bursts, 4 handlers per topic")
+    for worker in (False, True):
+        per_message, wall = await run(devices, bursts, worker)
+        label = "worker" if worker else "inline"
+        print(f"{label:>7}: {per_message:6.2f} µs loop time/message, {wall:6.3f} s wall")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,228 @@
+"""Compare device-to-router delivery through the embedded broker and a broker hop.
+
+Simulated devices connect over TLS with a throwaway self-signed
+certificate and publish plugMetering messages. With the embedded broker,
+the messages go straight to the transport's callbacks. For the hop, the
+same broker code only routes between clients, like a separate Mosquitto,
+and a direct transport connection subscribes the topics on it, so every
+message is encoded and sent a second time. Both brokers run on the
+benchmark's event loop, and the hop's connection uses TLS as well.
+
+Measures the round trip of single messages and the throughput of a burst
+from every device.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/embedded_broker.py [devices] [messages]
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+import json
+from pathlib import Path
+import ssl
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from homeassistant.util.ssl import get_default_no_verify_context
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.qubo_local import packets  # noqa: E402
+from custom_components.qubo_local.broker import (  # noqa: E402
+    QuboBrokerTransport,
+    server_ssl_context,
+)
+from custom_components.qubo_local.transport import QuboDirectTransport  # noqa: E402
+
+HOSTNAME = "mqtt.platform.quboworld.com"
+
+
+def write_certificate(directory: str) -> tuple[str, str]:
+    """Write a self-signed certificate and its key, return their paths."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, HOSTNAME)])
+    now = datetime.now(UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(HOSTNAME)]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    certfile = str(Path(directory, "server.crt"))
+    keyfile = str(Path(directory, "server.key"))
+    Path(certfile).write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    Path(keyfile).write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return certfile, keyfile
+
+
+def metering(sample: int) -> bytes:
+    """Return a metering message."""
+    return json.dumps(
+        {
+            "devices": {
+                "services": {
+                    "plugMetering": {
+                        "events": {
+                            "stateChanged": {
+                                "power": str(100 + sample % 50),
+                                "voltage": "231.4",
+                                "current": "452",
+                                "consumption": "12.531",
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    ).encode()
+
+
+class Device:
+    """A simulated QUBO device connected over TLS."""
+
+    def __init__(self, index: int) -> None:
+        """Initialize the device."""
+        self.client_id = f"device-{index:04d}"
+        self.topic = f"/monitor/unit-{index // 4:04d}/{self.client_id}/plugMetering"
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def connect(self, port: int, context: ssl.SSLContext) -> None:
+        """Connect to the broker."""
+        reader, self.writer = await asyncio.open_connection(
+            "127.0.0.1", port, ssl=context, server_hostname=HOSTNAME
+        )
+        self.writer.write(packets.connect(self.client_id, 60))
+        await packets.read_packet(reader)
+
+    def publish(self, payload: bytes) -> None:
+        """Publish a QoS 0 message."""
+        self.writer.write(packets.publish(self.topic, payload, 0))
+
+
+async def measure(
+    name: str,
+    transport: QuboBrokerTransport | QuboDirectTransport,
+    port: int,
+    context: ssl.SSLContext,
+    devices: int,
+    messages: int,
+) -> None:
+    """Print round trip and burst throughput from the devices to the callbacks."""
+    loop = asyncio.get_running_loop()
+    fleet = [Device(index) for index in range(devices)]
+    await asyncio.gather(*(device.connect(port, context) for device in fleet))
+    received = 0
+    done = loop.create_future()
+    expected = 0
+
+    def message_received(payload: str | bytes) -> None:
+        nonlocal received
+        received += 1
+        if received == expected and not done.done():
+            done.set_result(None)
+
+    for device in fleet:
+        await transport.async_subscribe(device.topic, message_received, 0)
+    # Let the subscriptions reach the broker
+    await asyncio.sleep(0.5)
+
+    payload = metering(0)
+    round_trips = []
+    for sample in range(200):
+        received, expected = 0, 1
+        done = loop.create_future()
+        started = time.perf_counter()
+        fleet[sample % devices].publish(payload)
+        await done
+        round_trips.append(time.perf_counter() - started)
+
+    received, expected = 0, devices * messages
+    done = loop.create_future()
+    started = time.perf_counter()
+    for sample in range(messages):
+        for device in fleet:
+            device.publish(metering(sample))
+    await done
+    elapsed = time.perf_counter() - started
+
+    print(f"  {name}")
+    print(f"    device to callback: {statistics.median(round_trips) * 1_000_000:7.0f} µs (p50)")
+    print(f"    burst:              {expected / elapsed:7,.0f} messages/s")
+    for device in fleet:
+        device.writer.close()
+
+
+async def main() -> None:
+    """Compare the embedded broker with a separate broker hop."""
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    loop = asyncio.get_running_loop()
+    hass = SimpleNamespace(
+        loop=loop,
+        async_create_background_task=lambda target, name: loop.create_task(target),
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = write_certificate(directory)
+        client_context = ssl.create_default_context(cafile=certfile)
+        server_context = server_ssl_context(certfile, keyfile)
+
+    print(f"{devices} devices over TLS, {messages} messages each")
+
+    embedded = QuboBrokerTransport(hass, 0, server_context)
+    embedded.async_start()
+    while not embedded.connected:
+        await asyncio.sleep(0.01)
+    port = embedded._server.sockets[0].getsockname()[1]
+    await measure("embedded broker", embedded, port, client_context, devices, messages)
+    await embedded.async_stop()
+
+    broker = QuboBrokerTransport(hass, 0, server_context)
+    broker.async_start()
+    while not broker.connected:
+        await asyncio.sleep(0.01)
+    port = broker._server.sockets[0].getsockname()[1]
+    direct = QuboDirectTransport(
+        hass,
+        {
+            "host": "127.0.0.1",
+            "port": port,
+            "username": None,
+            "password": None,
+            "tls": "insecure",
+            "ssl": get_default_no_verify_context(),
+            "protocol": packets.PROTOCOL_LEVEL_311,
+            "share_group": None,
+        },
+        1,
+    )
+    direct.async_start()
+    while not direct.connected:
+        await asyncio.sleep(0.01)
+    await measure("separate broker hop", direct, port, client_context, devices, messages)
+    await direct.async_stop()
+    await broker.async_stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
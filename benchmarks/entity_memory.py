@@ -0,0 +1,242 @@
+"""Measure the memory each QUBO device's entities take.
+
+Sets up smart plug and air purifier entries, half of each, on a Home
+Assistant core with real entity platforms, then delivers one metering or
+AQI message to every device. tracemalloc counts what the setup and the
+first messages allocated and stayed allocated, per device. The share
+allocated by the integration's own modules is shown separately from the
+part Home Assistant allocates for every entity, such as its registry
+entry and state.
+
+Also times delivering a plugMetering message from the transport to the
+sensors, including writing their states.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/entity_memory.py [devices]
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+import gc
+import importlib
+import json
+import logging
+from pathlib import Path
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+from unittest.mock import patch
+import uuid
+
+from homeassistant import config_entries
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import (
+    area_registry,
+    device_registry,
+    entity_registry,
+    floor_registry,
+    label_registry,
+    restore_state,
+)
+from homeassistant.helpers.entity_platform import EntityPlatform
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import custom_components.qubo_local as integration  # noqa: E402
+from custom_components.qubo_local.const import (  # noqa: E402
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_TYPE,
+    CONF_DEVICE_UUID,
+    CONF_ENTITY_UUID,
+    CONF_HANDLE_NAME,
+    CONF_UNIT_UUID,
+    DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_SMART_PLUG,
+    DOMAIN,
+)
+from custom_components.qubo_local.router import async_get_router  # noqa: E402
+from custom_components.qubo_local.transport import QuboTransport  # noqa: E402
+
+_LOGGER = logging.getLogger(__name__)
+
+INTEGRATION_PATH = str(Path(integration.__file__).parent)
+
+
+class RecordingTransport(QuboTransport):
+    """A broker that keeps the subscribed callbacks to deliver messages to."""
+
+    name = "benchmark"
+
+    def __init__(self) -> None:
+        """Initialize the transport."""
+        self.callbacks: dict[str, Any] = {}
+
+    @property
+    def connected(self) -> bool:
+        """Return True, the broker is always there."""
+        return True
+
+    async def async_subscribe(self, topic: str, payload_callback: Any, qos: int) -> Any:
+        """Keep the callback of the topic."""
+        self.callbacks[topic] = payload_callback
+        return lambda: None
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Drop the command."""
+
+    @callback
+    def async_subscribe_connection_status(self, status_callback: Any) -> Any:
+        """Never call back."""
+        return lambda: None
+
+
+def message(service: str, state: dict[str, str]) -> bytes:
+    """Return a monitor payload that reports a state change of a service."""
+    return json.dumps(
+        {"devices": {"services": {service: {"events": {"stateChanged": state}}}}}
+    ).encode()
+
+
+def metering(sample: int) -> bytes:
+    """Return a plugMetering message."""
+    return message(
+        "plugMetering",
+        {
+            "power": str(100 + sample % 50),
+            "voltage": "231.4",
+            "current": "452",
+            "consumption": str(12.5 + sample / 1000),
+        },
+    )
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Return a Home Assistant core with the registries entities need."""
+    hass = HomeAssistant(config_dir)
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    for registry in (area_registry, floor_registry, label_registry):
+        await registry.async_load(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+    await restore_state.async_load(hass)
+    return hass
+
+
+def create_entries(hass: HomeAssistant, devices: int) -> list[config_entries.ConfigEntry]:
+    """Add plug and purifier entries, half of each, four devices per unit."""
+    entries = []
+    unit_uuid = ""
+    for index in range(devices):
+        if index % 4 == 0:
+            unit_uuid = str(uuid.uuid4())
+        device_uuid = str(uuid.uuid4())
+        device_type = DEVICE_TYPE_AIR_PURIFIER if index % 2 else DEVICE_TYPE_SMART_PLUG
+        entry = config_entries.ConfigEntry(
+            data={
+                CONF_DEVICE_TYPE: device_type,
+                CONF_DEVICE_UUID: device_uuid,
+                CONF_ENTITY_UUID: str(uuid.uuid4()),
+                CONF_UNIT_UUID: unit_uuid,
+                CONF_HANDLE_NAME: f"handle-{index}",
+                CONF_DEVICE_NAME: f"Device {index}",
+            },
+            discovery_keys={},
+            domain=DOMAIN,
+            minor_version=1,
+            options={},
+            source=config_entries.SOURCE_USER,
+            title=f"Device {index}",
+            unique_id=device_uuid,
+            version=1,
+        )
+        hass.config_entries._entries[entry.entry_id] = entry
+        entries.append(entry)
+    return entries
+
+
+async def main() -> None:
+    """Print the memory per device and the metering delivery time."""
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        transport = RecordingTransport()
+        router = async_get_router(hass)
+        await router.async_set_transport(transport)
+        # Deliver every message right away instead of merging the bursts
+        router.async_configure(1_000_000_000, 1_000_000_000)
+        entries = create_entries(hass, devices)
+        # Import the platforms before measuring
+        modules = {
+            platform: importlib.import_module(f"custom_components.qubo_local.{platform}")
+            for platform in ("fan", "sensor", "switch")
+        }
+
+        async def async_forward_entry_setups(entry: Any, platforms: Any) -> None:
+            """Set up the entity platforms of an entry."""
+            await asyncio.gather(
+                *(
+                    EntityPlatform(
+                        hass=hass,
+                        logger=_LOGGER,
+                        domain=platform,
+                        platform_name=DOMAIN,
+                        platform=modules[platform],
+                        scan_interval=timedelta(seconds=30),
+                        entity_namespace=None,
+                    ).async_setup_entry(entry)
+                    for platform in platforms
+                )
+            )
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        with patch.object(
+            hass.config_entries, "async_forward_entry_setups", async_forward_entry_setups
+        ):
+            for entry in entries:
+                await integration.async_setup_entry(hass, entry)
+        aqi = message("aqiStatus", {"PM25": "37"})
+        for topic, payload_callback in transport.callbacks.items():
+            if topic.endswith("/plugMetering"):
+                payload_callback(metering(0))
+            elif topic.endswith("/aqiStatus"):
+                payload_callback(aqi)
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        total = own = 0
+        for stat in after.compare_to(before, "filename"):
+            total += stat.size_diff
+            if stat.traceback[0].filename.startswith(INTEGRATION_PATH):
+                own += stat.size_diff
+        print(f"{devices} devices, {hass.states.async_entity_ids_count()} entities")
+        print(f"  memory per device:       {total / devices / 1024:6.1f} KiB")
+        print(f"    integration modules:   {own / devices / 1024:6.1f} KiB")
+        print(f"    Home Assistant:        {(total - own) / devices / 1024:6.1f} KiB")
+
+        plugs = [
+            payload_callback
+            for topic, payload_callback in transport.callbacks.items()
+            if topic.endswith("/plugMetering")
+        ]
+        payloads = [metering(sample) for sample in range(1, 21)]
+        started = time.perf_counter()
+        for payload in payloads:
+            for payload_callback in plugs:
+                payload_callback(payload)
+        elapsed = time.perf_counter() - started
+        print(
+            f"  plugMetering delivery:   {elapsed / len(payloads) / len(plugs) * 1_000_000:6.1f}"
+            " µs/message"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
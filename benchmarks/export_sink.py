@@ -0,0 +1,92 @@
+"""Measure the event-loop cost and writer throughput of the metering export.
+
+Queues raw plugMetering payloads into the export sink, times the calls on
+the event loop and then the writer thread draining them into rotating,
+compressed line protocol files in a temporary directory.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/export_sink.py [samples]
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.qubo_local import export as export_module  # noqa: E402
+
+DEVICES = 1000
+
+
+def payload(sample: int) -> str:
+    """Return a raw metering message."""
+    return json.dumps(
+        {
+            "devices": {
+                "services": {
+                    "plugMetering": {
+                        "events": {
+                            "stateChanged": {
+                                "power": str(100 + sample % 50),
+                                "voltage": "231.4",
+                                "current": "452",
+                                "consumption": str(12.5 + sample / 1000),
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    )
+
+
+async def main() -> None:
+    """Time queueing and writing the samples."""
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    samples = min(samples, export_module.QUEUE_SIZE)
+    loop = asyncio.get_running_loop()
+    messages = [(f"device-{sample % DEVICES:04d}", payload(sample)) for sample in range(samples)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        hass = SimpleNamespace(
+            loop=loop,
+            config=SimpleNamespace(path=lambda *parts: str(Path(directory, *parts))),
+            async_add_executor_job=lambda target, *args: loop.run_in_executor(
+                None, target, *args
+            ),
+        )
+        sink = export_module.QuboExportSink(hass, 8 * 1024 * 1024, 3600)
+
+        started = time.perf_counter()
+        for device_uuid, message in messages:
+            sink.async_add(device_uuid, "plugMetering", message)
+        queued = time.perf_counter() - started
+
+        # Start the writer only now so it drains one large backlog
+        started = time.perf_counter()
+        sink.async_start()
+        await sink.async_stop()
+        written = time.perf_counter() - started
+        stats = sink.as_dict()
+        size = sum(
+            path.stat().st_size
+            for path in Path(directory, export_module.EXPORT_DIRECTORY).iterdir()
+        )
+
+    print(f"{samples} samples, {stats['files']} files, {size / 1024:.0f} KiB compressed")
+    print(f"  event loop: {queued / samples * 1_000_000:5.2f} µs/sample")
+    print(
+        f"      writer: {written / samples * 1_000_000:5.2f} µs/sample, "
+        f"{samples / written:,.0f} samples/s, {stats['dropped']} dropped"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
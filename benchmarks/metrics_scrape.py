@@ -0,0 +1,113 @@
+"""Measure the cost of an OpenMetrics scrape of a large fleet.
+
+Registers plugs and purifiers in the device state store, feeds one
+metering or AQI message to a share of them between scrapes, and times the
+rendering with the per-device line cache against rebuilding every line.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/metrics_scrape.py [devices] [updated_share]
+"""
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.qubo_local import (  # noqa: E402
+    devicestate as devicestate_module,
+    metrics as metrics_module,
+)
+from custom_components.qubo_local.const import (  # noqa: E402
+    DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_SMART_PLUG,
+)
+from custom_components.qubo_local.router import QuboMessageRouter  # noqa: E402
+
+SCRAPES = 50
+
+
+async def main() -> None:
+    """Time scrapes with and without the line cache."""
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    share = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    loop = asyncio.get_running_loop()
+    handlers = {}
+
+    async def fake_subscribe(topic, msg_callback, qos):
+        handlers[topic] = msg_callback
+        return lambda: None
+
+    hass = SimpleNamespace(loop=loop, data={})
+    router = QuboMessageRouter(hass)
+    fake_router = SimpleNamespace(
+        async_subscribe=fake_subscribe,
+        async_subscribe_connection_status=lambda status_callback: lambda: None,
+        as_metrics=router.as_metrics,
+    )
+    devicestate_module.async_get_router = lambda hass: fake_router
+    devicestate_module.async_track_time_interval = lambda *args: lambda: None
+    metrics_module.async_get_router = lambda hass: fake_router
+
+    store = devicestate_module.async_get_device_states(hass)
+    feeds = []
+    for index in range(devices):
+        device_uuid = f"device-{index:04d}"
+        purifier = index % 10 == 0
+        await store.async_register(
+            device_uuid,
+            f"unit-{index % 20}",
+            f"Device {index}",
+            DEVICE_TYPE_AIR_PURIFIER if purifier else DEVICE_TYPE_SMART_PLUG,
+            180,
+        )
+        if purifier:
+            topic = f"/monitor/unit-{index % 20}/{device_uuid}/aqiStatus"
+            feeds.append((handlers[topic], lambda sample: {"PM25": str(sample % 80)}))
+        else:
+            topic = f"/monitor/unit-{index % 20}/{device_uuid}/plugMetering"
+            feeds.append(
+                (
+                    handlers[topic],
+                    lambda sample: {
+                        "power": str(100 + sample % 50),
+                        "voltage": "231.4",
+                        "current": "452",
+                        "consumption": str(12.5 + sample / 1000),
+                    },
+                )
+            )
+    for handler, payload in feeds:
+        handler(payload(0))
+
+    renderer = metrics_module.QuboMetricsRenderer(hass)
+    size = len(renderer.async_render())
+    rng = random.Random(1)
+    updated = max(1, int(devices * share))
+    timings = {True: 0.0, False: 0.0}
+    for sample in range(1, SCRAPES + 1):
+        for handler, payload in rng.sample(feeds, updated):
+            handler(payload(sample))
+        for cached in (True, False):
+            if not cached:
+                renderer._cache.clear()
+            started = time.perf_counter()
+            renderer.async_render()
+            timings[cached] += time.perf_counter() - started
+
+    print(f"{devices} devices, {updated} updated between scrapes, {size / 1024:.0f} KiB")
+    for cached, label in ((True, "cached"), (False, "rebuilt")):
+        per_scrape = timings[cached] / SCRAPES
+        print(
+            f"{label:>8}: {per_scrape * 1000:6.2f} ms/scrape, "
+            f"{per_scrape / devices * 1_000_000:5.2f} µs/device"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
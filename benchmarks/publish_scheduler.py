@@ -0,0 +1,101 @@
+"""Measure switch command latency during a refresh storm.
+
+A simulated broker connection sends one message per millisecond in FIFO
+order. A storm of metering refreshes is published at once while a switch
+command is issued every 50 ms while the storm is sent. The latency of each switch command is
+measured from the call to the moment the broker connection sends it, once
+with every publish sent directly (the previous behaviour) and once
+through the priority scheduler.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/publish_scheduler.py [refreshes]
+"""
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.qubo_local import router as router_module  # noqa: E402
+from custom_components.qubo_local.scheduler import (  # noqa: E402
+    PRIORITY_INTERACTIVE,
+    PRIORITY_REFRESH,
+)
+
+BROKER_INTERVAL = 0.001  # seconds per message on the broker connection
+PUBLISH_RATE = 500  # scheduler limit, below the broker capacity
+PRESS_INTERVAL = 0.05
+PRESSES = 30
+
+
+async def run(refreshes: int, scheduled: bool) -> list[float]:
+    """Return the switch command latencies in milliseconds."""
+    loop = asyncio.get_running_loop()
+    connection = asyncio.Lock()
+
+    async def broker_publish(topic, payload, qos):
+        async with connection:
+            await asyncio.sleep(BROKER_INTERVAL)
+
+    hass = SimpleNamespace(
+        loop=loop,
+        data={},
+        async_create_background_task=lambda coro, name: loop.create_task(coro),
+    )
+    router = router_module.QuboMessageRouter(hass)
+    await router.async_set_transport(
+        SimpleNamespace(name="fake", connected=False, async_publish=broker_publish)
+    )
+    router.async_set_publish_rate(PUBLISH_RATE)
+
+    async def publish(topic: str, priority: int) -> None:
+        if scheduled:
+            await router.async_publish(topic, "{}", priority=priority)
+        else:
+            await router._async_send(topic, "{}", 1)
+
+    storm = [
+        loop.create_task(
+            publish(f"/control/unit/device-{index:04d}/meteringRefresh", PRIORITY_REFRESH)
+        )
+        for index in range(refreshes)
+    ]
+
+    async def press() -> float:
+        started = time.perf_counter()
+        await publish("/control/unit/device-0000/lcSwitchControl", PRIORITY_INTERACTIVE)
+        return (time.perf_counter() - started) * 1000
+
+    presses = []
+    for _ in range(PRESSES):
+        await asyncio.sleep(PRESS_INTERVAL)
+        presses.append(loop.create_task(press()))
+
+    await asyncio.gather(*storm)
+    return list(await asyncio.gather(*presses))
+
+
+async def main() -> None:
+    """Run both configurations and print the latency distribution."""
+    refreshes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(
+        f"{refreshes} refreshes, broker sends {1 / BROKER_INTERVAL:.0f}/s, "
+        f"scheduler limit {PUBLISH_RATE}/s, {PRESSES} switch presses"
+    )
+    for scheduled in (False, True):
+        latencies = await run(refreshes, scheduled)
+        label = "scheduled" if scheduled else "direct"
+        print(
+            f"{label:>9}: switch latency p50 {statistics.median(latencies):7.1f} ms, "
+            f"max {max(latencies):7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
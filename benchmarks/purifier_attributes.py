@@ -0,0 +1,259 @@
+"""Count the state attribute rows the recorder writes for the purifier fan.
+
+Sets up air purifier entries on a Home Assistant core with real entity
+platforms and replays a simulated day: a PM2.5 reading every 30 seconds
+and a filter life reading every hour. Every state the fan entity writes
+is reduced to its recorded attributes the way the recorder does it, and
+each distinct set counts as a new state_attributes row.
+
+The run before marks none of the integration's attributes as unrecorded,
+like the fan entity did before speed_list and the PM2.5/filter attributes
+were excluded. The current run uses the entity as it is.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/purifier_attributes.py [purifiers]
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+import importlib
+import json
+import logging
+from pathlib import Path
+import random
+import sys
+import tempfile
+from typing import Any
+from unittest.mock import patch
+import uuid
+
+from homeassistant import config_entries
+from homeassistant.components.fan import FanEntity
+from homeassistant.components.recorder.db_schema import StateAttributes
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import (
+    area_registry,
+    device_registry,
+    entity_registry,
+    floor_registry,
+    label_registry,
+    restore_state,
+)
+from homeassistant.helpers.entity_platform import EntityPlatform
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import custom_components.qubo_local as integration  # noqa: E402
+from custom_components.qubo_local.const import (  # noqa: E402
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_TYPE,
+    CONF_DEVICE_UUID,
+    CONF_ENTITY_UUID,
+    CONF_HANDLE_NAME,
+    CONF_UNIT_UUID,
+    DEVICE_TYPE_AIR_PURIFIER,
+    DOMAIN,
+)
+from custom_components.qubo_local.fan import QuboAirPurifier  # noqa: E402
+from custom_components.qubo_local.router import async_get_router  # noqa: E402
+from custom_components.qubo_local.transport import QuboTransport  # noqa: E402
+
+_LOGGER = logging.getLogger(__name__)
+
+AQI_INTERVAL = 30  # seconds
+FILTER_INTERVAL = 3600  # seconds
+DAY = 86400  # seconds
+
+
+class RecordingTransport(QuboTransport):
+    """A broker that keeps the subscribed callbacks to deliver messages to."""
+
+    name = "benchmark"
+
+    def __init__(self) -> None:
+        """Initialize the transport."""
+        self.callbacks: dict[str, Any] = {}
+
+    @property
+    def connected(self) -> bool:
+        """Return True, the broker is always there."""
+        return True
+
+    async def async_subscribe(self, topic: str, payload_callback: Any, qos: int) -> Any:
+        """Keep the callback of the topic."""
+        self.callbacks[topic] = payload_callback
+        return lambda: None
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Drop the command."""
+
+    @callback
+    def async_subscribe_connection_status(self, status_callback: Any) -> Any:
+        """Never call back."""
+        return lambda: None
+
+
+def message(service: str, state: dict[str, str]) -> bytes:
+    """Return a monitor payload that reports a state change of a service."""
+    return json.dumps(
+        {"devices": {"services": {service: {"events": {"stateChanged": state}}}}}
+    ).encode()
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Return a Home Assistant core with the registries entities need."""
+    hass = HomeAssistant(config_dir)
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    for registry in (area_registry, floor_registry, label_registry):
+        await registry.async_load(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+    await restore_state.async_load(hass)
+    return hass
+
+
+def create_entries(hass: HomeAssistant, purifiers: int) -> list[config_entries.ConfigEntry]:
+    """Add an air purifier entry per device, four devices per unit."""
+    entries = []
+    unit_uuid = ""
+    for index in range(purifiers):
+        if index % 4 == 0:
+            unit_uuid = str(uuid.uuid4())
+        device_uuid = str(uuid.uuid4())
+        entry = config_entries.ConfigEntry(
+            data={
+                CONF_DEVICE_TYPE: DEVICE_TYPE_AIR_PURIFIER,
+                CONF_DEVICE_UUID: device_uuid,
+                CONF_ENTITY_UUID: str(uuid.uuid4()),
+                CONF_UNIT_UUID: unit_uuid,
+                CONF_HANDLE_NAME: f"handle-{index}",
+                CONF_DEVICE_NAME: f"Purifier {index}",
+            },
+            discovery_keys={},
+            domain=DOMAIN,
+            minor_version=1,
+            options={},
+            source=config_entries.SOURCE_USER,
+            title=f"Purifier {index}",
+            unique_id=device_uuid,
+            version=1,
+        )
+        hass.config_entries._entries[entry.entry_id] = entry
+        entries.append(entry)
+    return entries
+
+
+async def run(purifiers: int, before: bool) -> None:
+    """Replay a day of readings and print the recorded attribute rows."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        transport = RecordingTransport()
+        router = async_get_router(hass)
+        await router.async_set_transport(transport)
+        # Deliver every message right away instead of merging the bursts
+        router.async_configure(1_000_000_000, 1_000_000_000)
+        entries = create_entries(hass, purifiers)
+        modules = {
+            platform: importlib.import_module(f"custom_components.qubo_local.{platform}")
+            for platform in ("fan", "sensor")
+        }
+
+        async def async_forward_entry_setups(entry: Any, platforms: Any) -> None:
+            """Set up the entity platforms of an entry."""
+            await asyncio.gather(
+                *(
+                    EntityPlatform(
+                        hass=hass,
+                        logger=_LOGGER,
+                        domain=platform,
+                        platform_name=DOMAIN,
+                        platform=modules[platform],
+                        scan_interval=timedelta(seconds=30),
+                        entity_namespace=None,
+                    ).async_setup_entry(entry)
+                    for platform in platforms
+                )
+            )
+
+        attribute_sets: dict[str, set[bytes]] = {}
+        writes = 0
+        recorded_bytes = 0
+
+        @callback
+        def async_state_changed(event: Event) -> None:
+            """Reduce a fan state to the attributes the recorder keeps."""
+            nonlocal writes, recorded_bytes
+            entity_id = event.data["entity_id"]
+            if not entity_id.startswith("fan."):
+                return
+            shared_attrs = StateAttributes.shared_attrs_bytes_from_event(event, None)
+            attribute_sets.setdefault(entity_id, set()).add(shared_attrs)
+            writes += 1
+            recorded_bytes += len(shared_attrs)
+
+        unrecorded = (
+            FanEntity._entity_component_unrecorded_attributes  # noqa: SLF001
+            if before
+            else QuboAirPurifier._Entity__combined_unrecorded_attributes  # noqa: SLF001
+        )
+        with (
+            patch.object(
+                hass.config_entries, "async_forward_entry_setups", async_forward_entry_setups
+            ),
+            patch.object(
+                QuboAirPurifier, "_Entity__combined_unrecorded_attributes", unrecorded
+            ),
+        ):
+            for entry in entries:
+                await integration.async_setup_entry(hass, entry)
+            hass.bus.async_listen(EVENT_STATE_CHANGED, async_state_changed)
+
+            aqi_callbacks = [
+                payload_callback
+                for topic, payload_callback in transport.callbacks.items()
+                if topic.endswith("/aqiStatus")
+            ]
+            filter_callbacks = [
+                payload_callback
+                for topic, payload_callback in transport.callbacks.items()
+                if topic.endswith("/filterReset")
+            ]
+            # The same day for both runs, PM2.5 wanders between 5 and 80
+            rng = random.Random(27)
+            pm25 = [rng.randint(5, 80) for _ in aqi_callbacks]
+            filter_life = 2000
+            for second in range(0, DAY, AQI_INTERVAL):
+                for index, payload_callback in enumerate(aqi_callbacks):
+                    pm25[index] = min(80, max(5, pm25[index] + rng.randint(-3, 3)))
+                    payload_callback(message("aqiStatus", {"PM25": str(pm25[index])}))
+                if second % FILTER_INTERVAL == 0:
+                    filter_life -= 1
+                    payload = message("filterReset", {"timeRemaining": str(filter_life)})
+                    for payload_callback in filter_callbacks:
+                        payload_callback(payload)
+            await hass.async_block_till_done()
+
+        rows = sum(len(sets) for sets in attribute_sets.values())
+        print(f"  {'before' if before else 'current'}")
+        print(f"    fan state writes:        {writes / purifiers:8.0f} per purifier")
+        print(f"    state_attributes rows:   {rows / purifiers:8.0f} per purifier")
+        print(f"    recorded attributes:     {recorded_bytes / max(writes, 1):8.0f} bytes per state")
+        await hass.async_stop()
+
+
+async def main() -> None:
+    """Run the day with and without the unrecorded attributes."""
+    purifiers = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(
+        f"{purifiers} purifiers, PM2.5 every {AQI_INTERVAL} s, "
+        f"filter life every {FILTER_INTERVAL // 60} min, one day"
+    )
+    await run(purifiers, before=True)
+    await run(purifiers, before=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
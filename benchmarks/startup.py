@@ -0,0 +1,244 @@
+"""Measure how long a fleet of QUBO entries takes to set up.
+
+Sets up smart plug and air purifier entries at the same time, like Home
+Assistant does at startup, on a Home Assistant core with real entity
+platforms. The broker is a transport that answers each subscribe and
+publish after a fixed latency, standing for the SUBACK and PUBACK round
+trip, and commands go through the router's scheduler limited to 50/s.
+
+The sequential run reproduces how setup worked before: every
+subscription awaited in turn and each purifier's setup waiting for its
+first filter poll to be acknowledged. The concurrent run is the current
+code. Both print the time until every entry finished setting up, until
+the first publishes of every device were acknowledged, and the phase
+summary the fleet diagnostics show.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/startup.py [devices] [latency_ms]
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+import importlib
+import logging
+from pathlib import Path
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+import uuid
+
+from homeassistant import config_entries
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import (
+    area_registry,
+    device_registry,
+    entity_registry,
+    floor_registry,
+    label_registry,
+    restore_state,
+)
+from homeassistant.helpers.entity_platform import EntityPlatform
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import custom_components.qubo_local as integration  # noqa: E402
+from custom_components.qubo_local import devicestate, fan  # noqa: E402
+from custom_components.qubo_local.const import (  # noqa: E402
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_TYPE,
+    CONF_DEVICE_UUID,
+    CONF_ENTITY_UUID,
+    CONF_HANDLE_NAME,
+    CONF_UNIT_UUID,
+    DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_SMART_PLUG,
+    DOMAIN,
+    TOPIC_CONTROL_FILTER_STATUS,
+)
+from custom_components.qubo_local.router import async_get_router  # noqa: E402
+from custom_components.qubo_local.startup import async_get_startup_timings  # noqa: E402
+from custom_components.qubo_local.transport import QuboTransport  # noqa: E402
+
+_LOGGER = logging.getLogger(__name__)
+
+PUBLISH_RATE = 50  # scheduler limit in commands per second
+
+
+class AckingTransport(QuboTransport):
+    """A broker that acknowledges subscribes and publishes after a delay."""
+
+    name = "benchmark"
+
+    def __init__(self, latency: float) -> None:
+        """Initialize the transport."""
+        self._latency = latency
+        self.acked: defaultdict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self.last_ack = 0.0
+
+    @property
+    def connected(self) -> bool:
+        """Return True, the broker is always there."""
+        return True
+
+    async def async_subscribe(self, topic: str, payload_callback: Any, qos: int) -> Any:
+        """Subscribe after the SUBACK round trip."""
+        await asyncio.sleep(self._latency)
+        return lambda: None
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Publish after the PUBACK round trip."""
+        await asyncio.sleep(self._latency)
+        self.acked[topic].set()
+        self.last_ack = time.perf_counter()
+
+    @callback
+    def async_subscribe_connection_status(self, status_callback: Any) -> Any:
+        """Never call back."""
+        return lambda: None
+
+
+async def sequential_gather(*aws: Any, return_exceptions: bool = False) -> list[Any]:
+    """Await the steps one after another, as setup did before."""
+    results = []
+    for awaitable in aws:
+        try:
+            results.append(await awaitable)
+        except Exception as err:  # noqa: BLE001
+            if not return_exceptions:
+                raise
+            results.append(err)
+    return results
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Return a Home Assistant core with the registries entities need."""
+    hass = HomeAssistant(config_dir)
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    for registry in (area_registry, floor_registry, label_registry):
+        await registry.async_load(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+    await restore_state.async_load(hass)
+    return hass
+
+
+def create_entries(hass: HomeAssistant, devices: int) -> list[config_entries.ConfigEntry]:
+    """Add plug and purifier entries, half of each, four devices per unit."""
+    entries = []
+    unit_uuid = ""
+    for index in range(devices):
+        if index % 4 == 0:
+            unit_uuid = str(uuid.uuid4())
+        device_uuid = str(uuid.uuid4())
+        device_type = DEVICE_TYPE_AIR_PURIFIER if index % 2 else DEVICE_TYPE_SMART_PLUG
+        entry = config_entries.ConfigEntry(
+            data={
+                CONF_DEVICE_TYPE: device_type,
+                CONF_DEVICE_UUID: device_uuid,
+                CONF_ENTITY_UUID: str(uuid.uuid4()),
+                CONF_UNIT_UUID: unit_uuid,
+                CONF_HANDLE_NAME: f"handle-{index}",
+                CONF_DEVICE_NAME: f"Device {index}",
+            },
+            discovery_keys={},
+            domain=DOMAIN,
+            minor_version=1,
+            options={},
+            source=config_entries.SOURCE_USER,
+            title=f"Device {index}",
+            unique_id=device_uuid,
+            version=1,
+        )
+        hass.config_entries._entries[entry.entry_id] = entry
+        entries.append(entry)
+    return entries
+
+
+async def run(devices: int, latency: float, sequential: bool) -> None:
+    """Set up the fleet and print the timings."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        transport = AckingTransport(latency)
+        router = async_get_router(hass)
+        await router.async_set_transport(transport)
+        router.async_set_publish_rate(PUBLISH_RATE)
+        entries = create_entries(hass, devices)
+
+        async def async_forward_entry_setups(entry: Any, platforms: Any) -> None:
+            """Set up the entity platforms of an entry."""
+            await asyncio.gather(
+                *(
+                    EntityPlatform(
+                        hass=hass,
+                        logger=_LOGGER,
+                        domain=platform,
+                        platform_name=DOMAIN,
+                        platform=importlib.import_module(
+                            f"custom_components.qubo_local.{platform}"
+                        ),
+                        scan_interval=timedelta(seconds=30),
+                        entity_namespace=None,
+                    ).async_setup_entry(entry)
+                    for platform in platforms
+                )
+            )
+
+        async def async_setup(entry: config_entries.ConfigEntry) -> None:
+            """Set up an entry, waiting for the first filter poll when sequential."""
+            await integration.async_setup_entry(hass, entry)
+            if sequential and entry.data[CONF_DEVICE_TYPE] == DEVICE_TYPE_AIR_PURIFIER:
+                topic = TOPIC_CONTROL_FILTER_STATUS.format(
+                    unit_uuid=entry.data[CONF_UNIT_UUID],
+                    device_uuid=entry.data[CONF_DEVICE_UUID],
+                )
+                await transport.acked[topic].wait()
+
+        gather = sequential_gather if sequential else asyncio.gather
+        steps = SimpleNamespace(gather=gather, create_task=asyncio.create_task)
+        with (
+            patch.object(
+                hass.config_entries, "async_forward_entry_setups", async_forward_entry_setups
+            ),
+            patch.object(integration, "asyncio", steps),
+            patch.object(devicestate, "asyncio", steps),
+            patch.object(fan, "asyncio", steps),
+        ):
+            started = time.perf_counter()
+            await asyncio.gather(*(async_setup(entry) for entry in entries))
+            setup = time.perf_counter() - started
+
+            # Every device sends a refresh 5 seconds in, then the filter polls
+            # and refreshes drain at the publish rate
+            refreshes = len(entries) + devices // 2
+            while sum(event.is_set() for event in transport.acked.values()) < refreshes:
+                await asyncio.sleep(0.1)
+            published = transport.last_ack - started
+
+        summary = async_get_startup_timings(hass).as_dict()
+        print(f"  {'sequential (before)' if sequential else 'concurrent'}")
+        print(f"    setup finished:        {setup * 1_000:8.0f} ms")
+        print(f"    first publishes acked: {published * 1_000:8.0f} ms")
+        for phase, values in summary["phases"].items():
+            print(
+                f"    {phase + ' done:':<22} {values['end_p50_ms']:8.0f} ms p50"
+                f" {values['end_max_ms']:8.0f} ms max"
+            )
+
+
+def main() -> None:
+    """Compare sequential and concurrent setup of the fleet."""
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) / 1_000 if len(sys.argv) > 2 else 0.002
+    print(f"{devices} devices, {latency * 1_000:.0f} ms broker round trip")
+    for sequential in (True, False):
+        asyncio.run(run(devices, latency, sequential))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Measure the bytes MQTT 5 topic aliases save on direct broker connections.
+
+Encodes the metering messages a fleet receives and the refresh commands it
+sends, once with MQTT 3.1.1 and once with MQTT 5 topic aliases, and counts
+the bytes on the wire. Inbound, the broker is assumed to alias every topic
+up to the limit the integration announces. Outbound, commands get aliases
+with the connection's own policy for a broker that allows 10 aliases (the
+Mosquitto default) and for one that allows the maximum. Also times parsing
+the inbound messages.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/topic_aliases.py [devices] [rounds]
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import sys
+import time
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.qubo_local import packets  # noqa: E402
+from custom_components.qubo_local.const import (  # noqa: E402
+    TOPIC_CONTROL_METERING_REFRESH,
+    TOPIC_MONITOR_ENERGY,
+)
+from custom_components.qubo_local.transport import (  # noqa: E402
+    TOPIC_ALIAS_MAXIMUM,
+    _QuboMqttConnection,
+)
+
+V5 = packets.PROTOCOL_LEVEL_5
+V311 = packets.PROTOCOL_LEVEL_311
+
+
+def metering(sample: int) -> bytes:
+    """Return a compact metering message."""
+    return json.dumps(
+        {
+            "devices": {
+                "services": {
+                    "plugMetering": {
+                        "events": {
+                            "stateChanged": {
+                                "power": str(100 + sample % 50),
+                                "voltage": "231.4",
+                                "current": "452",
+                                "consumption": "12.531",
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        separators=(",", ":"),
+    ).encode()
+
+
+def inbound(topics: list[str], rounds: int) -> tuple[list[bytes], list[bytes]]:
+    """Return the metering PUBLISH packets without and with broker aliases."""
+    plain, aliased = [], []
+    aliases: dict[str, int] = {}
+    for sample in range(rounds):
+        payload = metering(sample)
+        for topic in topics:
+            plain.append(packets.publish(topic, payload, 0))
+            if (alias := aliases.get(topic)) is not None:
+                aliased.append(packets.publish("", payload, 0, 0, V5, alias))
+            elif len(aliases) < TOPIC_ALIAS_MAXIMUM:
+                alias = aliases[topic] = len(aliases) + 1
+                aliased.append(packets.publish(topic, payload, 0, 0, V5, alias))
+            else:
+                aliased.append(packets.publish(topic, payload, 0, 0, V5))
+    return plain, aliased
+
+
+def outbound(topics: list[str], rounds: int, alias_maximum: int) -> int:
+    """Return the bytes of the refresh commands with the connection's aliases."""
+    connection = _QuboMqttConnection(None, {"protocol": V5}, "benchmark", lambda: None)
+    connection._alias_maximum = alias_maximum
+    size = 0
+    for _ in range(rounds):
+        for topic in topics:
+            topic_name, alias = connection._async_alias(topic)
+            size += len(packets.publish(topic_name, b"{}", 1, 1, V5, alias))
+    return size
+
+
+def parse_time(messages: list[bytes], protocol: int) -> float:
+    """Return the µs per message to parse the PUBLISH packets."""
+    bodies = []
+    for message in messages:
+        # Skip the fixed header, the remaining length is at most two bytes here
+        offset = 2 if message[1] < 0x80 else 3
+        bodies.append((message[0], message[offset:]))
+    aliases: dict[int, str] = {}
+    started = time.perf_counter()
+    if protocol == V311:
+        for header, body in bodies:
+            packets.parse_publish(header, body)
+    else:
+        for header, body in bodies:
+            topic, _, _, alias = packets.parse_publish_v5(header, body)
+            if alias:
+                if topic:
+                    aliases[alias] = topic
+                else:
+                    topic = aliases[alias]
+    return (time.perf_counter() - started) / len(bodies) * 1_000_000
+
+
+def main() -> None:
+    """Print the bytes per message with and without aliases."""
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    units = [str(uuid.uuid4()) for _ in range(max(1, devices // 4))]
+    pairs = [(units[index % len(units)], str(uuid.uuid4())) for index in range(devices)]
+    monitor = [TOPIC_MONITOR_ENERGY.format(unit_uuid=u, device_uuid=d) for u, d in pairs]
+    control = [TOPIC_CONTROL_METERING_REFRESH.format(unit_uuid=u, device_uuid=d) for u, d in pairs]
+    count = devices * rounds
+
+    plain, aliased = inbound(monitor, rounds)
+    plain_size = sum(map(len, plain))
+    aliased_size = sum(map(len, aliased))
+    print(f"{devices} devices, {rounds} rounds")
+    print("  inbound plugMetering")
+    print(f"    MQTT 3.1.1:         {plain_size / count:6.1f} bytes/message")
+    print(
+        f"    MQTT 5, aliases:    {aliased_size / count:6.1f} bytes/message "
+        f"({aliased_size / plain_size - 1:+.0%})"
+    )
+    print(f"    parse 3.1.1:        {parse_time(plain, V311):6.2f} µs/message")
+    print(f"    parse 5, aliases:   {parse_time(aliased, V5):6.2f} µs/message")
+
+    plain_size = sum(len(packets.publish(topic, b"{}", 1, 1)) for topic in control) * rounds
+    print("  outbound meteringRefresh")
+    print(f"    MQTT 3.1.1:         {plain_size / count:6.1f} bytes/command")
+    for alias_maximum in (10, 65535):
+        size = outbound(control, rounds, alias_maximum)
+        print(
+            f"    MQTT 5, {alias_maximum:>5} aliases: {size / count:6.1f} bytes/command "
+            f"({size / plain_size - 1:+.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
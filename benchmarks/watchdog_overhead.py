@@ -0,0 +1,85 @@
+"""Measure the cost of the handler-duration watchdog on the message path.
+
+Delivers plugMetering messages through the message router with the
+watchdog off and on and compares the event-loop time per message. The
+handlers stand in for the plug sensors: they parse the reported value and
+write a state through a minimal Home Assistant state machine.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/watchdog_overhead.py [messages]
+"""
+from __future__ import annotations
+
+import asyncio
+import gc
+from pathlib import Path
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from homeassistant.core import StateMachine  # noqa: E402
+
+from custom_components.qubo_local import router as router_module  # noqa: E402
+from custom_components.qubo_local.watchdog import QuboWatchdog  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from decode_worker import metering_payload  # noqa: E402
+
+ROUNDS = 15
+
+
+async def main() -> None:
+    """Deliver the same messages with the watchdog off and on, interleaved."""
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    loop = asyncio.get_running_loop()
+    handlers = {}
+
+    async def fake_subscribe(topic, payload_callback, qos):
+        handlers[topic] = payload_callback
+        return lambda: None
+
+    bus = SimpleNamespace(async_fire_internal=lambda *args, **kwargs: None)
+    states = StateMachine(bus, loop)
+    hass = SimpleNamespace(loop=loop, data={}, states=states)
+    router = router_module.QuboMessageRouter(hass)
+    await router.async_set_transport(
+        SimpleNamespace(name="fake", connected=False, async_subscribe=fake_subscribe)
+    )
+    router.async_configure(10**9, 10**9)
+    watchdog = QuboWatchdog(hass, 10)
+
+    topic = "/monitor/unit/device-0000/plugMetering"
+    for key in ("power", "voltage", "current", "consumption"):
+
+        def handler(state, _key=key):
+            value = float(state[_key])
+            states.async_set(f"sensor.plug_{_key}", str(round(value, 2)), {"unit": "W"})
+
+        handler.__qualname__ = "QuboEnergySensor.message_received"
+        await router.async_subscribe(topic, handler)
+
+    payloads = [metering_payload("device-0000", sample) for sample in range(messages)]
+    best = {False: float("inf"), True: float("inf")}
+    gc.disable()
+    for _ in range(ROUNDS):
+        for enabled in (False, True):
+            router.async_set_watchdog(watchdog if enabled else None)
+            started = time.perf_counter()
+            for payload in payloads:
+                handlers[topic](payload)
+            best[enabled] = min(best[enabled], time.perf_counter() - started)
+            gc.collect()
+    gc.enable()
+
+    baseline, timed = (best[enabled] / messages * 1_000_000 for enabled in (False, True))
+    print(f"{messages} messages, 4 handlers per message, best of {ROUNDS}")
+    print(f"   off: {baseline:6.2f} µs/message")
+    print(f"    on: {timed:6.2f} µs/message")
+    print(f"overhead: {timed - baseline:5.2f} µs/message ({(timed / baseline - 1) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,49 +2,169 @@
 import asyncio
 import json
 import logging
+import ssl
+from collections.abc import Coroutine
 from datetime import timedelta
+from typing import Any
 
-from homeassistant.components import mqtt
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant, callback
-from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
 from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.typing import ConfigType
 
+from .adaptive import QuboAdaptiveRefresh
+from .aggregate import async_get_aggregate_tracker
+from .broker import QuboBrokerTransport, server_ssl_context
+from .commands import QuboCommandTracker
 from .const import (
+    CONF_AQI_REFRESH_MAX,
+    CONF_AQI_REFRESH_MIN,
+    CONF_BROKER_BRIDGE,
+    CONF_BROKER_CERTFILE,
+    CONF_BROKER_CONNECTIONS,
+    CONF_BROKER_KEYFILE,
+    CONF_BROKER_LISTEN_PASSWORD,
+    CONF_BROKER_LISTEN_USERNAME,
+    CONF_BROKER_LISTEN_PORT,
+    CONF_COMMAND_RETRY,
+    CONF_DECODE_WORKER,
     CONF_DEVICE_MAC,
     CONF_DEVICE_NAME,
     CONF_DEVICE_TYPE,
     CONF_DEVICE_UUID,
     CONF_ENTITY_UUID,
+    CONF_EXPORT,
+    CONF_EXPORT_MAX_SIZE,
+    CONF_EXPORT_ROTATE_INTERVAL,
     CONF_HANDLE_NAME,
+    CONF_LOAD_SHED_BUDGET,
+    CONF_LOAD_SHED_HYSTERESIS,
+    CONF_METER_PERIODS,
+    CONF_OVERLOAD_DEVICE_RATE,
+    CONF_OVERLOAD_RATE,
+    CONF_PUBLISH_RATE,
+    CONF_RESYNC_WINDOW,
+    CONF_SLOW_HANDLER_THRESHOLD,
+    CONF_STATISTICS_MODE,
+    CONF_TRANSPORT,
     CONF_UNIT_UUID,
+    CONF_WATCHDOG,
+    DATA_WATCHDOG,
     DEFAULT_AQI_REFRESH_INTERVAL,
+    DEFAULT_AQI_REFRESH_MAX,
+    DEFAULT_BROKER_CONNECTIONS,
+    DEFAULT_BROKER_LISTEN_PORT,
+    DEFAULT_EXPORT_MAX_SIZE,
+    DEFAULT_EXPORT_ROTATE_INTERVAL,
+    DEFAULT_LOAD_SHED_HYSTERESIS,
+    DEFAULT_OVERLOAD_DEVICE_RATE,
+    DEFAULT_OVERLOAD_RATE,
+    DEFAULT_PUBLISH_RATE,
     DEFAULT_REFRESH_INTERVAL,
+    DEFAULT_RESYNC_WINDOW,
+    DEFAULT_SLOW_HANDLER_THRESHOLD,
     DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_FLEET,
     DEVICE_TYPE_SMART_PLUG,
     DOMAIN,
+    FLEET_UNIQUE_ID,
     MANUFACTURER,
     MODEL,
     MODEL_AIR_PURIFIER,
+    MODEL_FLEET,
     TOPIC_CONTROL_AQI_REFRESH,
     TOPIC_CONTROL_METERING_REFRESH,
+    TOPIC_MONITOR_ENERGY,
+    TRANSPORT_DIRECT,
+    TRANSPORT_EMBEDDED,
+    TRANSPORT_MQTT,
 )
+from .devicestate import async_get_device_states
+from .export import QuboExportSink
+from .filterlife import QuboFilterPredictor
+from .loadshed import QuboLoadShedder
+from .meter import QuboConsumptionMeter
+from .metrics import async_setup_metrics
+from .resync import async_get_resync
+from .router import async_get_router
+from .scheduler import PRIORITY_REFRESH
+from .services import async_setup_services
+from .startup import PHASE_DEVICE_INFO, PHASE_PLATFORM_FORWARD, async_get_startup_timings
+from .statistics import QuboStatisticsFeed
+from .transport import QuboDirectTransport, QuboTransport, async_direct_settings
+from .watchdog import QuboWatchdog
+from .websocket import async_setup_websocket
 
 _LOGGER = logging.getLogger(__name__)
 
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
 # Smart Plug platforms
 PLATFORMS_SMART_PLUG = [Platform.SWITCH, Platform.SENSOR]
 
 # Air Purifier platforms
 PLATFORMS_AIR_PURIFIER = [Platform.FAN, Platform.SENSOR]
 
+# Fleet platforms (aggregate sensors)
+PLATFORMS_FLEET = [Platform.SENSOR]
+
+
+def _platforms_for(device_type: str) -> list[Platform]:
+    """Return the platforms to set up for a device type."""
+    if device_type == DEVICE_TYPE_AIR_PURIFIER:
+        return PLATFORMS_AIR_PURIFIER
+    if device_type == DEVICE_TYPE_FLEET:
+        return PLATFORMS_FLEET
+    return PLATFORMS_SMART_PLUG
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the QUBO Local Control services."""
+    async_setup_services(hass)
+    async_setup_websocket(hass)
+    async_setup_metrics(hass)
+    return True
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up QUBO Local Control from a config entry."""
     hass.data.setdefault(DOMAIN, {})
 
     device_type = entry.data.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG)
+    if device_type == DEVICE_TYPE_FLEET:
+        return await _async_setup_fleet_entry(hass, entry)
+
+    # Phase timing shown in the diagnostics of the entry and the fleet
+    startup = async_get_startup_timings(hass)
+    timing = startup.async_begin(
+        entry.entry_id, entry.data[CONF_DEVICE_UUID], entry.data[CONF_DEVICE_NAME]
+    )
+    entry.async_on_unload(lambda: startup.async_remove(entry.entry_id))
+
+    with timing.phase(PHASE_DEVICE_INFO):
+        await _async_setup_device(hass, entry, device_type)
+    hass.data[DOMAIN][entry.entry_id]["startup"] = timing
+
+    # Forward entry setup to appropriate platforms based on device type
+    with timing.phase(PHASE_PLATFORM_FORWARD):
+        await hass.config_entries.async_forward_entry_setups(entry, _platforms_for(device_type))
+
+    await _async_setup_refresh(hass, entry, device_type)
+    timing.async_finish()
+    return True
+
+
+async def _async_setup_device(
+    hass: HomeAssistant, entry: ConfigEntry, device_type: str
+) -> None:
+    """Create the device info and the helpers the platforms use.
+
+    Restoring stored state and subscribing the device state topics do not
+    depend on each other and run concurrently.
+    """
     device_model = MODEL_AIR_PURIFIER if device_type == DEVICE_TYPE_AIR_PURIFIER else MODEL
 
     device_info = DeviceInfo(
@@ -53,22 +173,138 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         manufacturer=MANUFACTURER,
         model=device_model,
         sw_version="1.0.0",
-        connections={("mac", entry.data[CONF_DEVICE_MAC])} if CONF_DEVICE_MAC in entry.data else None,
+        connections={("mac", entry.data[CONF_DEVICE_MAC])} if entry.data.get(CONF_DEVICE_MAC) else None,
+    )
+
+    # Steps that restore or subscribe, started together below
+    starts: list[Coroutine[Any, Any, CALLBACK_TYPE | None]] = []
+
+    # Optional long-term statistics feed for smart plug metering
+    statistics_feed = None
+    if (
+        device_type != DEVICE_TYPE_AIR_PURIFIER
+        and entry.options.get(CONF_STATISTICS_MODE, False)
+    ):
+        if "recorder" in hass.config.components:
+            statistics_feed = QuboStatisticsFeed(
+                hass, entry.data[CONF_DEVICE_UUID], entry.data[CONF_DEVICE_NAME]
+            )
+            starts.append(statistics_feed.async_start())
+            entry.async_on_unload(statistics_feed.async_stop)
+        else:
+            _LOGGER.warning(
+                "Statistics mode enabled for %s but the recorder is not loaded",
+                entry.data[CONF_DEVICE_NAME],
+            )
+
+    # Echo confirmation for power, speed and mode commands
+    commands = QuboCommandTracker(
+        hass,
+        entry.data[CONF_DEVICE_UUID],
+        entry.data[CONF_DEVICE_NAME],
+        entry.options.get(CONF_COMMAND_RETRY, False),
     )
+    entry.async_on_unload(commands.async_cancel)
+
+    # AQI refresh interval that follows the purifier's power state and PM2.5,
+    # and filter life extrapolated from the fan's run time
+    aqi_refresh = None
+    filter_predictor = None
+    if device_type == DEVICE_TYPE_AIR_PURIFIER:
+        aqi_refresh = QuboAdaptiveRefresh(
+            hass,
+            entry.data[CONF_DEVICE_NAME],
+            entry.options.get(CONF_AQI_REFRESH_MIN, DEFAULT_AQI_REFRESH_INTERVAL),
+            entry.options.get(CONF_AQI_REFRESH_MAX, DEFAULT_AQI_REFRESH_MAX),
+        )
+        filter_predictor = QuboFilterPredictor(
+            hass,
+            entry.data[CONF_DEVICE_UUID],
+            entry.data[CONF_UNIT_UUID],
+            entry.data[CONF_HANDLE_NAME],
+            entry.data[CONF_DEVICE_NAME],
+        )
+
+    # Optional hourly, daily and monthly consumption buckets for smart plugs
+    meter = None
+    if device_type != DEVICE_TYPE_AIR_PURIFIER and (
+        periods := entry.options.get(CONF_METER_PERIODS, [])
+    ):
+        meter = QuboConsumptionMeter(
+            hass,
+            entry.data[CONF_DEVICE_UUID],
+            TOPIC_MONITOR_ENERGY.format(
+                unit_uuid=entry.data[CONF_UNIT_UUID],
+                device_uuid=entry.data[CONF_DEVICE_UUID],
+            ),
+            periods,
+        )
+        # Restore the buckets before the sensors read them
+        starts.append(meter.async_start())
 
     hass.data[DOMAIN][entry.entry_id] = {
         "device_info": device_info,
         "config": entry.data,
+        "statistics": statistics_feed,
+        "commands": commands,
+        "aqi_refresh": aqi_refresh,
+        "filter": filter_predictor,
+        "meter": meter,
     }
 
-    # Forward entry setup to appropriate platforms based on device type
-    platforms = PLATFORMS_AIR_PURIFIER if device_type == DEVICE_TYPE_AIR_PURIFIER else PLATFORMS_SMART_PLUG
-    await hass.config_entries.async_forward_entry_setups(entry, platforms)
+    # Latest state for the fleet snapshot, stale after missing three refreshes
+    if device_type == DEVICE_TYPE_AIR_PURIFIER:
+        stale_timeout = 3 * aqi_refresh.max_interval
+    else:
+        stale_timeout = 3 * DEFAULT_REFRESH_INTERVAL
+    starts.append(
+        async_get_device_states(hass).async_register(
+            entry.data[CONF_DEVICE_UUID],
+            entry.data[CONF_UNIT_UUID],
+            entry.data[CONF_DEVICE_NAME],
+            device_type,
+            stale_timeout,
+            filter_predictor,
+        )
+    )
+
+    # Steps that succeeded are undone on unload even when another one failed
+    results = await asyncio.gather(*starts, return_exceptions=True)
+    for result in results:
+        if callable(result):
+            entry.async_on_unload(result)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
 
-    # Set up device-specific refresh
+    if statistics_feed is not None:
+        # Every metering sample goes to the statistics, even with the
+        # Power or Energy sensor disabled
+        store = async_get_device_states(hass)
+        device = store.devices[entry.data[CONF_DEVICE_UUID]]
+
+        @callback
+        def async_metering_reading(fields: tuple[str, ...]) -> None:
+            """Add the power and consumption of a reading to the statistics."""
+            if "power" in fields:
+                statistics_feed.async_add_sample("power", device.power)
+            if "consumption" in fields:
+                statistics_feed.async_add_sample("consumption", device.consumption)
+
+        entry.async_on_unload(store.async_add_reading_listener(device, async_metering_reading))
+
+    # Reload the entry when options change
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
+
+async def _async_setup_refresh(hass: HomeAssistant, entry: ConfigEntry, device_type: str) -> None:
+    """Set up the device-specific refresh commands."""
+    aqi_refresh = hass.data[DOMAIN][entry.entry_id]["aqi_refresh"]
+    filter_predictor = hass.data[DOMAIN][entry.entry_id]["filter"]
     device_uuid = entry.data[CONF_DEVICE_UUID]
     unit_uuid = entry.data[CONF_UNIT_UUID]
     handle_name = entry.data[CONF_HANDLE_NAME]
+    resync = async_get_resync(hass)
 
     if device_type == DEVICE_TYPE_AIR_PURIFIER:
         # Air Purifier: Set up AQI refresh
@@ -98,24 +334,23 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
                 }
             })
 
-            await mqtt.async_publish(hass, topic, payload, qos=1)
+            await async_get_router(hass).async_publish(
+                topic, payload, priority=PRIORITY_REFRESH
+            )
             _LOGGER.debug("Sent aqiRefresh command to %s", device_uuid)
 
-        # Trigger initial refresh after 5 seconds
-        async def async_initial_refresh(_):
-            await async_refresh_aqi()
+        # First refresh after 5 seconds, then at the adaptive interval
+        entry.async_on_unload(aqi_refresh.async_start(async_refresh_aqi))
+        entry.async_on_unload(resync.async_register(device_uuid, async_refresh_aqi))
 
-        hass.loop.call_later(5, lambda: asyncio.create_task(async_initial_refresh(None)))
-
-        # Set up periodic AQI refresh
-        entry.async_on_unload(
-            async_track_time_interval(
-                hass,
-                async_refresh_aqi,
-                timedelta(seconds=DEFAULT_AQI_REFRESH_INTERVAL)
-            )
-        )
+        # Poll filter life only when the prediction needs it
+        entry.async_on_unload(await filter_predictor.async_start())
     else:
+        # Smart Plug: Contribute metering to the per-unit and per-area totals
+        aggregates = async_get_aggregate_tracker(hass)
+        aggregates.async_register_plug(device_uuid, unit_uuid)
+        entry.async_on_unload(lambda: aggregates.async_unregister_plug(device_uuid))
+
         # Smart Plug: Set up energy monitoring refresh
         async def async_refresh_energy_monitoring(now=None):
             """Send meteringRefresh command to keep energy data flowing."""
@@ -141,7 +376,9 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
                 }
             })
 
-            await mqtt.async_publish(hass, topic, payload, qos=1)
+            await async_get_router(hass).async_publish(
+                topic, payload, priority=PRIORITY_REFRESH
+            )
             _LOGGER.debug("Sent meteringRefresh command to %s", device_uuid)
 
         # Trigger initial refresh after 5 seconds
@@ -149,6 +386,9 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             await async_refresh_energy_monitoring()
 
         hass.loop.call_later(5, lambda: asyncio.create_task(async_initial_refresh(None)))
+        entry.async_on_unload(
+            resync.async_register(device_uuid, async_refresh_energy_monitoring)
+        )
 
         # Set up periodic refresh
         entry.async_on_unload(
@@ -159,15 +399,182 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             )
         )
 
+
+async def _async_setup_fleet_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Set up the fleet entry that hosts integration-wide entities."""
+    aggregates = async_get_aggregate_tracker(hass)
+
+    # Optional load shedding against a fleet power budget
+    load_shedder = None
+    if budget := entry.options.get(CONF_LOAD_SHED_BUDGET, 0):
+        load_shedder = QuboLoadShedder(
+            hass,
+            aggregates,
+            budget,
+            entry.options.get(CONF_LOAD_SHED_HYSTERESIS, DEFAULT_LOAD_SHED_HYSTERESIS),
+        )
+        entry.async_on_unload(load_shedder.async_start())
+
+    # Overload thresholds for the shared message router
+    router = async_get_router(hass)
+    router.async_configure(
+        entry.options.get(CONF_OVERLOAD_RATE, DEFAULT_OVERLOAD_RATE),
+        entry.options.get(CONF_OVERLOAD_DEVICE_RATE, DEFAULT_OVERLOAD_DEVICE_RATE),
+    )
+    entry.async_on_unload(
+        lambda: router.async_configure(DEFAULT_OVERLOAD_RATE, DEFAULT_OVERLOAD_DEVICE_RATE)
+    )
+
+    # Optional direct broker connections or embedded broker instead of the
+    # MQTT integration
+    transport: QuboTransport | None = None
+    transport_type = entry.options.get(CONF_TRANSPORT, TRANSPORT_MQTT)
+    if transport_type == TRANSPORT_DIRECT:
+        if (settings := async_direct_settings(hass, entry.options)) is None:
+            _LOGGER.error(
+                "No broker configured for the direct QUBO connection, "
+                "using the MQTT integration instead"
+            )
+        else:
+            transport = QuboDirectTransport(
+                hass,
+                settings,
+                entry.options.get(CONF_BROKER_CONNECTIONS, DEFAULT_BROKER_CONNECTIONS),
+            )
+    elif transport_type == TRANSPORT_EMBEDDED:
+        transport = await _async_embedded_broker(hass, entry)
+
+    if transport is not None:
+        transport.async_start()
+        await router.async_set_transport(transport)
+
+        async def async_stop_transport() -> None:
+            """Return to the MQTT integration and close the connections."""
+            await router.async_set_transport(None)
+            await transport.async_stop()
+
+        entry.async_on_unload(async_stop_transport)
+
+    # Optional publish rate limit, user commands are always sent ahead of refreshes
+    router.async_set_publish_rate(entry.options.get(CONF_PUBLISH_RATE, DEFAULT_PUBLISH_RATE))
+    entry.async_on_unload(lambda: router.async_set_publish_rate(DEFAULT_PUBLISH_RATE))
+
+    # Spread state requests after a broker reconnect over this window
+    resync = async_get_resync(hass)
+    resync.async_set_window(entry.options.get(CONF_RESYNC_WINDOW, DEFAULT_RESYNC_WINDOW))
+    entry.async_on_unload(lambda: resync.async_set_window(DEFAULT_RESYNC_WINDOW))
+
+    # Optional off-loop decoding for very large fleets
+    if entry.options.get(CONF_DECODE_WORKER, False):
+        router.async_set_decode_worker(True)
+        entry.async_on_unload(lambda: router.async_set_decode_worker(False))
+
+    # Optional export of every raw metering sample to rotating files
+    export = None
+    if entry.options.get(CONF_EXPORT, False):
+        export = QuboExportSink(
+            hass,
+            entry.options.get(CONF_EXPORT_MAX_SIZE, DEFAULT_EXPORT_MAX_SIZE) * 1024 * 1024,
+            entry.options.get(CONF_EXPORT_ROTATE_INTERVAL, DEFAULT_EXPORT_ROTATE_INTERVAL) * 60,
+        )
+        export.async_start()
+        router.async_set_export(export)
+        # Unload callbacks run last first, the router lets go before the flush
+        entry.async_on_unload(export.async_stop)
+        entry.async_on_unload(lambda: router.async_set_export(None))
+
+    # Optional handler-duration and loop lag instrumentation
+    watchdog = None
+    if entry.options.get(CONF_WATCHDOG, False):
+        watchdog = QuboWatchdog(
+            hass,
+            entry.options.get(CONF_SLOW_HANDLER_THRESHOLD, DEFAULT_SLOW_HANDLER_THRESHOLD),
+        )
+        hass.data[DATA_WATCHDOG] = watchdog
+        router.async_set_watchdog(watchdog)
+        entry.async_on_unload(watchdog.async_start())
+
+        @callback
+        def async_stop_watchdog() -> None:
+            """Stop timing handlers."""
+            router.async_set_watchdog(None)
+            hass.data.pop(DATA_WATCHDOG, None)
+
+        entry.async_on_unload(async_stop_watchdog)
+
+    hass.data[DOMAIN][entry.entry_id] = {
+        "device_info": DeviceInfo(
+            identifiers={(DOMAIN, FLEET_UNIQUE_ID)},
+            name=entry.title,
+            manufacturer=MANUFACTURER,
+            model=MODEL_FLEET,
+            entry_type=DeviceEntryType.SERVICE,
+        ),
+        "config": entry.data,
+        "load_shedder": load_shedder,
+        "watchdog": watchdog,
+        "export": export,
+    }
+
+    # Drop plugs that stopped reporting from the aggregate power totals
+    entry.async_on_unload(aggregates.async_start_sweep())
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS_FLEET)
     return True
 
 
+async def _async_embedded_broker(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> QuboBrokerTransport | None:
+    """Return the embedded broker, or None when its certificate cannot be loaded."""
+    if not (certfile := entry.options.get(CONF_BROKER_CERTFILE)):
+        _LOGGER.error(
+            "No certificate configured for the embedded QUBO broker, "
+            "using the MQTT integration instead"
+        )
+        return None
+    keyfile = entry.options.get(CONF_BROKER_KEYFILE)
+    try:
+        ssl_context = await hass.async_add_executor_job(
+            server_ssl_context,
+            hass.config.path(certfile),
+            hass.config.path(keyfile) if keyfile else None,
+        )
+    except (OSError, ssl.SSLError) as err:
+        _LOGGER.error(
+            "Cannot load the certificate of the embedded QUBO broker, "
+            "using the MQTT integration instead: %s",
+            err,
+        )
+        return None
+
+    bridge_settings = None
+    if entry.options.get(CONF_BROKER_BRIDGE):
+        if (bridge_settings := async_direct_settings(hass, entry.options)) is None:
+            _LOGGER.warning("No broker configured to bridge the embedded QUBO broker to")
+    return QuboBrokerTransport(
+        hass,
+        entry.options.get(CONF_BROKER_LISTEN_PORT, DEFAULT_BROKER_LISTEN_PORT),
+        ssl_context,
+        bridge_settings,
+        entry.options.get(CONF_BROKER_LISTEN_USERNAME) or None,
+        entry.options.get(CONF_BROKER_LISTEN_PASSWORD) or None,
+    )
+
+
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the config entry after its options were updated."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     device_type = entry.data.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG)
-    platforms = PLATFORMS_AIR_PURIFIER if device_type == DEVICE_TYPE_AIR_PURIFIER else PLATFORMS_SMART_PLUG
 
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, platforms)
+    unload_ok = await hass.config_entries.async_unload_platforms(
+        entry, _platforms_for(device_type)
+    )
 
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
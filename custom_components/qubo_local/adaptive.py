@@ -0,0 +1,145 @@
+"""Adaptive AQI refresh interval for QUBO air purifiers."""
+from __future__ import annotations
+
+from collections.abc import Callable, Coroutine
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .const import DEFAULT_AQI_REFRESH_INTERVAL
+
+_LOGGER = logging.getLogger(__name__)
+
+# Smoothing factor of the moving average of PM2.5 changes
+EWMA_ALPHA = 0.3
+# Average change per reading (µg/m³) that counts as fully volatile
+VOLATILITY_SCALE = 5.0
+# Delay of the first refresh after setup
+INITIAL_DELAY = 5  # seconds
+
+RefreshType = Callable[[], Coroutine[Any, Any, None]]
+
+
+class QuboAdaptiveRefresh:
+    """Send aqiRefresh at an interval that follows the purifier's state.
+
+    While the fan runs, PM2.5 is refreshed at the minimum interval. While it
+    is off, the interval scales between the minimum and maximum with the
+    volatility of PM2.5, measured as an exponentially weighted moving average
+    of the absolute change between readings. Flat readings back off to the
+    maximum. Turning the fan on or a sudden jump pulls the next refresh in.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, device_name: str, min_interval: int, max_interval: int
+    ) -> None:
+        """Initialize the adaptive refresh."""
+        self.hass = hass
+        self._device_name = device_name
+        self._min = float(min_interval)
+        self._max = float(max(min_interval, max_interval))
+        self._refresh: RefreshType | None = None
+        self._handle: Any = None
+        self._due = 0.0
+        self._last_sent: float | None = None
+
+        self._is_on = False
+        self._pm25: float | None = None
+        self._volatility = 0.0
+
+        self._started = 0.0
+        self._sent = 0
+
+    @property
+    def max_interval(self) -> float:
+        """Return the longest interval between refreshes, in seconds."""
+        return self._max
+
+    @callback
+    def async_start(self, refresh: RefreshType) -> CALLBACK_TYPE:
+        """Start refreshing and return a callback that stops it."""
+        self._refresh = refresh
+        self._started = time.monotonic()
+        self._async_schedule(INITIAL_DELAY)
+        return self._async_stop
+
+    @callback
+    def _async_stop(self) -> None:
+        """Stop refreshing."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._refresh = None
+
+    @callback
+    def async_update_power(self, is_on: bool) -> None:
+        """Take the purifier's power state into account."""
+        self._is_on = is_on
+        self._async_reschedule()
+
+    @callback
+    def async_update_pm25(self, pm25: float) -> None:
+        """Feed a PM2.5 reading into the volatility average."""
+        if self._pm25 is not None:
+            change = abs(pm25 - self._pm25)
+            self._volatility = EWMA_ALPHA * change + (1 - EWMA_ALPHA) * self._volatility
+        self._pm25 = pm25
+        self._async_reschedule()
+
+    @property
+    def interval(self) -> float:
+        """Return the current refresh interval in seconds."""
+        if self._is_on:
+            return self._min
+        activity = min(1.0, self._volatility / VOLATILITY_SCALE)
+        return self._max - (self._max - self._min) * activity
+
+    @callback
+    def _async_schedule(self, delay: float) -> None:
+        """Schedule the next refresh."""
+        if self._handle is not None:
+            self._handle.cancel()
+        self._due = time.monotonic() + delay
+        self._handle = self.hass.loop.call_later(delay, self._async_fire)
+
+    @callback
+    def _async_reschedule(self) -> None:
+        """Bring the next refresh forward if the interval got shorter."""
+        if self._handle is None or self._last_sent is None:
+            return
+        due = self._last_sent + self.interval
+        if due < self._due:
+            self._async_schedule(max(0.0, due - time.monotonic()))
+
+    @callback
+    def _async_fire(self) -> None:
+        """Send a refresh and schedule the next one."""
+        self._handle = None
+        if self._refresh is None:
+            return
+        self._sent += 1
+        self._last_sent = time.monotonic()
+        self.hass.async_create_background_task(self._refresh(), "qubo_local aqi refresh")
+        interval = self.interval
+        self._async_schedule(interval)
+        _LOGGER.debug("%s: next aqiRefresh in %.0f s", self._device_name, interval)
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return the refresh state for diagnostics."""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        # Refreshes the fixed interval would have sent in the same time
+        fixed = elapsed // DEFAULT_AQI_REFRESH_INTERVAL + 1 if self._started else 0
+        return {
+            "min_interval": self._min,
+            "max_interval": self._max,
+            "interval": round(self.interval, 1),
+            "is_on": self._is_on,
+            "pm25": self._pm25,
+            "volatility": round(self._volatility, 2),
+            "sent": self._sent,
+            "fixed_interval_sent": int(fixed),
+            "saved": round(1 - self._sent / fixed, 3) if fixed else None,
+        }
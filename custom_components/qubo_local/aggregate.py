@@ -0,0 +1,257 @@
+"""Incremental per-unit and per-area aggregates of QUBO plug metering."""
+from __future__ import annotations
+
+from datetime import timedelta
+import logging
+import time
+
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import (
+    DATA_AGGREGATES,
+    DEFAULT_REFRESH_INTERVAL,
+    DOMAIN,
+    SIGNAL_AGGREGATE_GROUP_ADDED,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+GROUP_FLEET = "fleet"
+GROUP_UNIT = "unit"
+GROUP_AREA = "area"
+FLEET_GROUP_KEY = "all"
+
+# A plug that has not reported for this long no longer counts towards power
+STALE_TIMEOUT = DEFAULT_REFRESH_INTERVAL * 3  # seconds
+SWEEP_INTERVAL = timedelta(seconds=DEFAULT_REFRESH_INTERVAL)
+
+
+class _PlugContribution:
+    """Last values a single plug contributed to its groups."""
+
+    __slots__ = ("device_id", "unit_uuid", "area_id", "power", "consumption", "last_seen")
+
+    def __init__(self, device_id: str | None, unit_uuid: str, area_id: str | None) -> None:
+        """Initialize the contribution."""
+        self.device_id = device_id
+        self.unit_uuid = unit_uuid
+        self.area_id = area_id
+        self.power: float | None = None
+        self.consumption: float | None = None
+        self.last_seen = 0.0
+
+
+class AggregateGroup:
+    """Running power and energy totals for a unit or an area."""
+
+    __slots__ = ("kind", "key", "power", "energy", "energy_restored", "reporting", "_listeners")
+
+    def __init__(self, kind: str, key: str) -> None:
+        """Initialize the group."""
+        self.kind = kind
+        self.key = key
+        self.power = 0.0
+        # Energy consumed by member plugs, accumulated from counter deltas so
+        # the total never drops when a plug goes stale or is removed
+        self.energy = 0.0
+        self.energy_restored = False
+        self.reporting = 0
+        self._listeners: list[CALLBACK_TYPE] = []
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Listen for total changes."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_notify(self) -> None:
+        """Notify listeners that the totals changed."""
+        for update_callback in self._listeners:
+            update_callback()
+
+
+class QuboAggregateTracker:
+    """Maintain fleet totals in O(1) per decoded plugMetering value."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the tracker."""
+        self.hass = hass
+        self._plugs: dict[str, _PlugContribution] = {}
+        self._groups: dict[tuple[str, str], AggregateGroup] = {}
+        self._device_ids: dict[str, str] = {}
+        self._unsub_registry: CALLBACK_TYPE | None = None
+        # perf_counter_ns of the latest applied value, used for latency tracking
+        self.last_update_ns = 0
+
+    @property
+    def groups(self) -> list[AggregateGroup]:
+        """Return all known groups."""
+        return list(self._groups.values())
+
+    @property
+    def fleet(self) -> AggregateGroup:
+        """Return the group containing every plug."""
+        self._async_ensure_group(GROUP_FLEET, FLEET_GROUP_KEY)
+        return self._groups[(GROUP_FLEET, FLEET_GROUP_KEY)]
+
+    @callback
+    def async_get_power(self, device_uuid: str) -> float | None:
+        """Return the power a plug currently contributes."""
+        if (plug := self._plugs.get(device_uuid)) is None:
+            return None
+        return plug.power
+
+    @callback
+    def async_register_plug(self, device_uuid: str, unit_uuid: str) -> None:
+        """Start tracking a smart plug."""
+        self.async_unregister_plug(device_uuid)
+
+        device_registry = dr.async_get(self.hass)
+        device = device_registry.async_get_device(identifiers={(DOMAIN, device_uuid)})
+        device_id = device.id if device else None
+        area_id = device.area_id if device else None
+
+        self._plugs[device_uuid] = _PlugContribution(device_id, unit_uuid, area_id)
+        if device_id is not None:
+            self._device_ids[device_id] = device_uuid
+
+        self._async_ensure_group(GROUP_FLEET, FLEET_GROUP_KEY)
+        self._async_ensure_group(GROUP_UNIT, unit_uuid)
+        if area_id is not None:
+            self._async_ensure_group(GROUP_AREA, area_id)
+
+        if self._unsub_registry is None:
+            self._unsub_registry = self.hass.bus.async_listen(
+                dr.EVENT_DEVICE_REGISTRY_UPDATED, self._async_device_updated
+            )
+
+    @callback
+    def async_unregister_plug(self, device_uuid: str) -> None:
+        """Stop tracking a smart plug and remove its power from the totals."""
+        if (plug := self._plugs.pop(device_uuid, None)) is None:
+            return
+        if plug.device_id is not None:
+            self._device_ids.pop(plug.device_id, None)
+        self._async_drop_power(plug)
+
+        if not self._plugs and self._unsub_registry is not None:
+            self._unsub_registry()
+            self._unsub_registry = None
+
+    @callback
+    def async_update(self, device_uuid: str, data_key: str, value: float) -> None:
+        """Apply a decoded power or consumption value to the plug's groups."""
+        if (plug := self._plugs.get(device_uuid)) is None:
+            return
+        self.last_update_ns = time.perf_counter_ns()
+        plug.last_seen = time.monotonic()
+        groups = self._groups_for(plug)
+
+        if data_key == "power":
+            if plug.power is None:
+                delta = value
+                for group in groups:
+                    group.reporting += 1
+            else:
+                delta = value - plug.power
+            plug.power = value
+            for group in groups:
+                group.power += delta
+        elif data_key == "consumption":
+            previous = plug.consumption
+            plug.consumption = value
+            if previous is None:
+                # First value only sets the baseline for this plug
+                return
+            # A lower value means the device counter was reset
+            delta = value - previous if value >= previous else value
+            if not delta:
+                return
+            for group in groups:
+                group.energy += delta
+        else:
+            return
+
+        for group in groups:
+            group.async_notify()
+
+    @callback
+    def async_start_sweep(self) -> CALLBACK_TYPE:
+        """Periodically drop plugs that stopped reporting from the power totals."""
+        return async_track_time_interval(self.hass, self._async_sweep, SWEEP_INTERVAL)
+
+    @callback
+    def _async_sweep(self, _now=None) -> None:
+        """Remove stale plugs from the power totals."""
+        cutoff = time.monotonic() - STALE_TIMEOUT
+        for device_uuid, plug in self._plugs.items():
+            if plug.power is not None and plug.last_seen < cutoff:
+                _LOGGER.debug("Plug %s is stale, removing it from aggregates", device_uuid)
+                self._async_drop_power(plug)
+
+    @callback
+    def _async_drop_power(self, plug: _PlugContribution) -> None:
+        """Subtract a plug's power from its groups."""
+        if plug.power is None:
+            return
+        for group in self._groups_for(plug):
+            group.reporting -= 1
+            # Reset instead of subtracting to avoid accumulating float error
+            group.power = group.power - plug.power if group.reporting else 0.0
+            group.async_notify()
+        plug.power = None
+
+    @callback
+    def _async_device_updated(self, event: Event) -> None:
+        """Move a plug's contribution when its area changes."""
+        if event.data["action"] != "update" or "area_id" not in event.data["changes"]:
+            return
+        device_uuid = self._device_ids.get(event.data["device_id"])
+        if device_uuid is None:
+            return
+        device = dr.async_get(self.hass).async_get(event.data["device_id"])
+        if device is None:
+            return
+
+        plug = self._plugs[device_uuid]
+        power = plug.power
+        self._async_drop_power(plug)
+        plug.area_id = device.area_id
+        if plug.area_id is not None:
+            self._async_ensure_group(GROUP_AREA, plug.area_id)
+        if power is not None:
+            self.async_update(device_uuid, "power", power)
+
+    def _groups_for(self, plug: _PlugContribution) -> tuple[AggregateGroup, ...]:
+        """Return the groups a plug contributes to."""
+        fleet_group = self._groups[(GROUP_FLEET, FLEET_GROUP_KEY)]
+        unit_group = self._groups[(GROUP_UNIT, plug.unit_uuid)]
+        if plug.area_id is None:
+            return (fleet_group, unit_group)
+        return (fleet_group, unit_group, self._groups[(GROUP_AREA, plug.area_id)])
+
+    @callback
+    def _async_ensure_group(self, kind: str, key: str) -> None:
+        """Create a group and announce it to the fleet sensor platform."""
+        if (kind, key) in self._groups:
+            return
+        group = AggregateGroup(kind, key)
+        self._groups[(kind, key)] = group
+        async_dispatcher_send(self.hass, SIGNAL_AGGREGATE_GROUP_ADDED, group)
+
+
+@callback
+def async_get_aggregate_tracker(hass: HomeAssistant) -> QuboAggregateTracker:
+    """Return the shared aggregate tracker, creating it on first use."""
+    if (tracker := hass.data.get(DATA_AGGREGATES)) is None:
+        tracker = hass.data[DATA_AGGREGATES] = QuboAggregateTracker(hass)
+    return tracker
@@ -0,0 +1,617 @@
+"""Embedded MQTT broker that QUBO devices connect to directly."""
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+import functools
+import hmac
+import itertools
+import logging
+import ssl
+from typing import Any
+import uuid
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util.ssl import server_context_intermediate
+
+from . import packets
+from .errors import async_get_error_reporter
+from .transport import (
+    CONNECT_TIMEOUT,
+    CONNECTION_ERRORS,
+    RECONNECT_MAX,
+    RECONNECT_MIN,
+    PayloadCallbackType,
+    QuboTransport,
+    StatusCallbackType,
+    _QuboMqttConnection,
+    _describe,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Unsent bytes above which messages to a client are dropped
+CLIENT_BUFFER = 256 * 1024
+# How often clients are checked for an expired keepalive
+REAP_INTERVAL = 5  # seconds
+# Retained topics kept, new ones beyond this are not retained
+RETAINED_MAXIMUM = 10_000
+# Highest QoS granted to subscribers, QoS 2 subscriptions are served with 1
+MAX_QOS = 1
+
+
+def server_ssl_context(certfile: str, keyfile: str | None) -> ssl.SSLContext:
+    """Return the TLS context of the listener, this reads the files."""
+    context = server_context_intermediate()
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def _valid_filter(topic_filter: str) -> bool:
+    """Return whether a topic filter is valid MQTT."""
+    if not topic_filter or "\0" in topic_filter:
+        return False
+    levels = topic_filter.split("/")
+    for index, level in enumerate(levels):
+        if "#" in level and (level != "#" or index != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return True
+
+
+def _filter_matches(topic_filter: str, topic: str) -> bool:
+    """Return whether a topic filter matches a topic."""
+    filter_levels = topic_filter.split("/")
+    levels = topic.split("/")
+    if topic.startswith("$") and filter_levels[0] in ("+", "#"):
+        return False
+    for index, filter_level in enumerate(filter_levels):
+        if filter_level == "#":
+            return True
+        if index >= len(levels) or filter_level not in ("+", levels[index]):
+            return False
+    return len(filter_levels) == len(levels)
+
+
+class _QuboBrokerSession:
+    """A client connected to the embedded broker."""
+
+    __slots__ = (
+        "client_id",
+        "writer",
+        "keepalive",
+        "last_received",
+        "will",
+        "subscriptions",
+        "packet_ids",
+        "awaiting_release",
+    )
+
+    def __init__(
+        self,
+        client_id: str,
+        writer: asyncio.StreamWriter,
+        connect: packets.Connect,
+        now: float,
+    ) -> None:
+        """Initialize the session."""
+        self.client_id = client_id
+        self.writer = writer
+        self.keepalive = connect.keepalive
+        self.last_received = now
+        self.will = connect.will
+        # Topic filter -> granted QoS
+        self.subscriptions: dict[str, int] = {}
+        self.packet_ids = itertools.cycle(range(1, 65536))
+        # Ids of QoS 2 messages delivered but not released yet
+        self.awaiting_release: set[int] = set()
+
+    def send(self, topic: str, payload: bytes, qos: int, retain: bool = False) -> bool:
+        """Write a message, False when the client does not keep up."""
+        writer = self.writer
+        if writer.is_closing() or writer.transport.get_write_buffer_size() > CLIENT_BUFFER:
+            return False
+        packet_id = next(self.packet_ids) if qos else 0
+        writer.write(packets.publish(topic, payload, qos, packet_id, retain=retain))
+        return True
+
+
+class _TopicNode:
+    """One level of the topic filters the broker's clients subscribed."""
+
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self) -> None:
+        """Initialize an empty level."""
+        self.children: dict[str, _TopicNode] = {}
+        self.subscribers: dict[_QuboBrokerSession, int] = {}
+
+    def subscribe(self, topic_filter: str, session: _QuboBrokerSession, qos: int) -> bool:
+        """Add a subscription, True when the filter had no subscriber yet."""
+        node = self
+        for level in topic_filter.split("/"):
+            if (child := node.children.get(level)) is None:
+                child = node.children[level] = _TopicNode()
+            node = child
+        first = not node.subscribers
+        node.subscribers[session] = qos
+        return first
+
+    def unsubscribe(self, topic_filter: str, session: _QuboBrokerSession) -> bool:
+        """Remove a subscription, True when the filter has no subscriber left."""
+        path = [self]
+        levels = topic_filter.split("/")
+        for level in levels:
+            if (child := path[-1].children.get(level)) is None:
+                return False
+            path.append(child)
+        node = path[-1]
+        if node.subscribers.pop(session, None) is None:
+            return False
+        if node.subscribers:
+            return False
+        # Prune the levels nothing subscribes below anymore
+        for index in range(len(levels), 0, -1):
+            node = path[index]
+            if node.subscribers or node.children:
+                break
+            del path[index - 1].children[levels[index - 1]]
+        return True
+
+    def match(self, topic: str) -> dict[_QuboBrokerSession, int]:
+        """Return the subscribers of a topic with the highest QoS each granted."""
+        matched: dict[_QuboBrokerSession, int] = {}
+
+        def add(subscribers: dict[_QuboBrokerSession, int]) -> None:
+            for session, qos in subscribers.items():
+                if qos > matched.get(session, -1):
+                    matched[session] = qos
+
+        nodes = [self]
+        # Wildcards at the first level do not match topics starting with $
+        wildcards = not topic.startswith("$")
+        for level in topic.split("/"):
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if (child := children.get(level)) is not None:
+                    next_nodes.append(child)
+                if wildcards:
+                    if (child := children.get("+")) is not None:
+                        next_nodes.append(child)
+                    if (child := children.get("#")) is not None:
+                        add(child.subscribers)
+            if not next_nodes:
+                return matched
+            nodes = next_nodes
+            wildcards = True
+        for node in nodes:
+            add(node.subscribers)
+            # "a/#" also matches "a"
+            if (child := node.children.get("#")) is not None:
+                add(child.subscribers)
+        return matched
+
+
+class QuboBrokerTransport(QuboTransport):
+    """Run an MQTT 3.1.1 broker for the devices inside Home Assistant.
+
+    QUBO devices connect to the listener over TLS instead of to a separate
+    broker. A message a device publishes is handed to the router's
+    callback for its topic by an exact lookup, without being encoded again
+    for another client. Commands from the router are written straight to
+    the connections of the devices that subscribed them.
+
+    Other clients may connect and subscribe as well. With a bridge, every
+    message the clients publish is also forwarded to an external broker,
+    and the topic filters they subscribe are subscribed there too, so
+    commands published on the external broker reach the devices. Commands
+    from the router are not forwarded.
+
+    The broker keeps no state across restarts. Every session is clean,
+    QoS 2 messages from clients are accepted and passed on with QoS 1,
+    and retained messages are kept in memory.
+    """
+
+    name = "embedded"
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        port: int,
+        ssl_context: ssl.SSLContext,
+        bridge_settings: dict[str, Any] | None = None,
+        username: str | None = None,
+        password: str | None = None,
+    ) -> None:
+        """Initialize the broker.
+
+        bridge_settings holds the external broker in the form of the direct
+        transport's settings. With a username, clients must connect with it,
+        and with the password when one is set too.
+        """
+        self.hass = hass
+        self._port = port
+        self._ssl_context = ssl_context
+        self._username = username
+        self._password = password.encode() if password else None
+        self._handlers: dict[str, PayloadCallbackType] = {}
+        self._errors = async_get_error_reporter(hass)
+        self._sessions: dict[str, _QuboBrokerSession] = {}
+        self._tree = _TopicNode()
+        self._retained: dict[str, tuple[bytes, int]] = {}
+        self._status_callbacks: list[StatusCallbackType] = []
+        self._connected = False
+        self._server: asyncio.Server | None = None
+        self._task: asyncio.Task[None] | None = None
+
+        self._bridge: _QuboMqttConnection | None = None
+        # Topic filter -> unsubscribe from the external broker
+        self._bridged_filters: dict[str, CALLBACK_TYPE] = {}
+        if bridge_settings is not None:
+            self._bridge = _QuboMqttConnection(
+                hass,
+                # Without the messages it forwarded itself coming back over MQTT 5
+                {**bridge_settings, "share_group": None, "no_local": True},
+                f"qubo_local_bridge_{uuid.uuid4().hex[:8]}",
+                lambda: None,
+                self._async_from_bridge,
+            )
+
+        self._stats: dict[str, Any] = {
+            "connects": 0,
+            "refused": 0,
+            "received": 0,
+            "published": 0,
+            "undelivered": 0,
+            "dropped": 0,
+            "bridged_in": 0,
+            "last_error": None,
+        }
+
+    @property
+    def connected(self) -> bool:
+        """Return whether the broker is listening."""
+        return self._connected
+
+    @callback
+    def _async_set_connected(self, connected: bool) -> None:
+        """Report when the broker starts or stops listening."""
+        if connected == self._connected:
+            return
+        self._connected = connected
+        for status_callback in list(self._status_callbacks):
+            status_callback(connected)
+
+    @callback
+    def async_subscribe_connection_status(
+        self, status_callback: StatusCallbackType
+    ) -> CALLBACK_TYPE:
+        """Call back when the broker starts or stops listening."""
+        self._status_callbacks.append(status_callback)
+
+        @callback
+        def async_unsubscribe() -> None:
+            """Stop calling back."""
+            self._status_callbacks.remove(status_callback)
+
+        return async_unsubscribe
+
+    @callback
+    def async_start(self) -> None:
+        """Start listening in the background and connect the bridge."""
+        self._task = self.hass.async_create_background_task(
+            self._async_serve(), "qubo_local embedded broker"
+        )
+        if self._bridge is not None:
+            self._bridge.async_start()
+
+    async def async_stop(self) -> None:
+        """Close every client connection and stop listening."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            for session in list(self._sessions.values()):
+                # The broker going away is not the device going away
+                session.will = None
+                session.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._bridge is not None:
+            await self._bridge.async_stop()
+        self._async_set_connected(False)
+
+    async def _async_serve(self) -> None:
+        """Start the listener, retrying while the port is taken."""
+        delay = RECONNECT_MIN
+        while True:
+            try:
+                self._server = await asyncio.start_server(
+                    self._async_handle_client,
+                    port=self._port,
+                    ssl=self._ssl_context,
+                    ssl_handshake_timeout=CONNECT_TIMEOUT,
+                )
+            except OSError as err:
+                self._stats["last_error"] = str(err)
+                log = _LOGGER.error if delay == RECONNECT_MIN else _LOGGER.debug
+                log("Embedded QUBO broker cannot listen on port %d: %s", self._port, err)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
+            else:
+                break
+        _LOGGER.info("Embedded QUBO broker listening on port %d", self._port)
+        self._async_set_connected(True)
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            self._async_reap()
+
+    @callback
+    def _async_reap(self) -> None:
+        """Drop the clients that stayed silent past 1.5 keepalive periods."""
+        now = self.hass.loop.time()
+        for session in list(self._sessions.values()):
+            if session.keepalive and now - session.last_received > session.keepalive * 1.5:
+                _LOGGER.debug("QUBO broker client %s timed out", session.client_id)
+                session.writer.close()
+
+    async def _async_handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve one client connection until it disconnects."""
+        session: _QuboBrokerSession | None = None
+        clean = False
+        try:
+            async with asyncio.timeout(CONNECT_TIMEOUT):
+                header, body = await packets.read_packet(reader)
+            if header & 0xF0 != packets.CONNECT:
+                raise packets.MqttProtocolError("Expected CONNECT")
+            connect = packets.parse_connect(body)
+            if connect.protocol not in (packets.PROTOCOL_LEVEL_31, packets.PROTOCOL_LEVEL_311):
+                self._stats["refused"] += 1
+                writer.write(packets.connack(packets.CONNACK_REFUSED_VERSION))
+                return
+            if (code := self._authorize(connect)) != packets.CONNACK_ACCEPTED:
+                self._stats["refused"] += 1
+                writer.write(packets.connack(code))
+                _LOGGER.debug(
+                    "QUBO broker refused client %s from %s: %s",
+                    connect.client_id,
+                    writer.get_extra_info("peername"),
+                    "wrong credentials"
+                    if code == packets.CONNACK_REFUSED_CREDENTIALS
+                    else "no credentials",
+                )
+                return
+            client_id = connect.client_id
+            if not client_id:
+                if not connect.clean_session:
+                    self._stats["refused"] += 1
+                    writer.write(packets.connack(packets.CONNACK_REFUSED_IDENTIFIER))
+                    return
+                client_id = f"qubo_local_{uuid.uuid4().hex}"
+            if (previous := self._sessions.get(client_id)) is not None:
+                # Take the client id over from a connection that went stale
+                previous.will = None
+                previous.writer.close()
+            session = self._sessions[client_id] = _QuboBrokerSession(
+                client_id, writer, connect, self.hass.loop.time()
+            )
+            self._stats["connects"] += 1
+            writer.write(packets.connack(packets.CONNACK_ACCEPTED))
+            _LOGGER.debug("QUBO broker client %s connected", client_id)
+            clean = await self._async_read(session, reader)
+        except CONNECTION_ERRORS as err:
+            self._stats["last_error"] = (
+                "connection closed by the client"
+                if isinstance(err, asyncio.IncompleteReadError)
+                else _describe(err)
+            )
+            _LOGGER.debug(
+                "QUBO broker client %s disconnected: %s",
+                session.client_id if session else writer.get_extra_info("peername"),
+                self._stats["last_error"],
+            )
+        finally:
+            if session is not None:
+                self._async_close_session(session, clean)
+            writer.close()
+
+    def _authorize(self, connect: packets.Connect) -> int:
+        """Return the CONNACK code for the credentials of a CONNECT."""
+        if self._username is None:
+            return packets.CONNACK_ACCEPTED
+        if connect.username is None:
+            return packets.CONNACK_REFUSED_NOT_AUTHORIZED
+        # Compare both in constant time, so the reply time tells nothing
+        valid = hmac.compare_digest(connect.username.encode(), self._username.encode())
+        if self._password is not None:
+            valid &= hmac.compare_digest(connect.password or b"", self._password)
+        return packets.CONNACK_ACCEPTED if valid else packets.CONNACK_REFUSED_CREDENTIALS
+
+    async def _async_read(
+        self, session: _QuboBrokerSession, reader: asyncio.StreamReader
+    ) -> bool:
+        """Handle packets from a client, True when it disconnected cleanly."""
+        loop = self.hass.loop
+        writer = session.writer
+        while True:
+            header, body = await packets.read_packet(reader)
+            session.last_received = loop.time()
+            kind = header & 0xF0
+            if kind == packets.PUBLISH:
+                qos = header >> 1 & 0x03
+                if qos == 3:
+                    raise packets.MqttProtocolError("Invalid QoS 3")
+                topic, packet_id, payload = packets.parse_publish(header, body)
+                if not topic or "+" in topic or "#" in topic:
+                    raise packets.MqttProtocolError(f"Invalid topic {topic!r}")
+                if qos == 1:
+                    writer.write(packets.puback(packet_id))
+                elif qos == 2:
+                    writer.write(packets.pubrec(packet_id))
+                    if packet_id in session.awaiting_release:
+                        # Sent again before the release, already delivered
+                        continue
+                    session.awaiting_release.add(packet_id)
+                self._async_route(topic, payload, qos, bool(header & 0x01), session)
+            elif kind == packets.PUBREL:
+                packet_id = packets.packet_id(body)
+                session.awaiting_release.discard(packet_id)
+                writer.write(packets.pubcomp(packet_id))
+            elif kind == packets.SUBSCRIBE:
+                self._async_subscribe_session(session, body)
+            elif kind == packets.UNSUBSCRIBE:
+                packet_id, topic_filters = packets.parse_unsubscribe(body)
+                for topic_filter in topic_filters:
+                    if session.subscriptions.pop(topic_filter, None) is not None:
+                        self._async_unsubscribe_filter(topic_filter, session)
+                writer.write(packets.unsuback(packet_id))
+            elif kind == packets.PINGREQ:
+                writer.write(packets.PINGRESP_PACKET)
+            elif kind == packets.DISCONNECT:
+                return True
+            elif kind not in (packets.PUBACK, packets.PUBCOMP):
+                raise packets.MqttProtocolError(f"Unexpected packet {kind:#x}")
+
+    @callback
+    def _async_subscribe_session(self, session: _QuboBrokerSession, body: bytes) -> None:
+        """Subscribe a client and send it the matching retained messages."""
+        packet_id, topic_filters = packets.parse_subscribe(body)
+        codes = []
+        granted_filters = []
+        for topic_filter, qos in topic_filters:
+            if qos > 2 or not _valid_filter(topic_filter):
+                codes.append(packets.SUBACK_FAILURE)
+                continue
+            granted = min(qos, MAX_QOS)
+            session.subscriptions[topic_filter] = granted
+            if self._tree.subscribe(topic_filter, session, granted) and (
+                bridge := self._bridge
+            ) is not None:
+                # Exact filters get their messages through their own callback,
+                # wildcard filters through the bridge's unmatched callback
+                self._bridged_filters[topic_filter] = bridge.async_subscribe(
+                    topic_filter,
+                    functools.partial(self._async_from_bridge, topic_filter),
+                    granted,
+                )
+            codes.append(granted)
+            granted_filters.append((topic_filter, granted))
+        session.writer.write(packets.suback(packet_id, codes))
+        if not self._retained:
+            return
+        for topic, (payload, qos) in self._retained.items():
+            for topic_filter, granted in granted_filters:
+                if _filter_matches(topic_filter, topic):
+                    session.send(topic, payload, min(qos, granted), retain=True)
+                    break
+
+    @callback
+    def _async_unsubscribe_filter(self, topic_filter: str, session: _QuboBrokerSession) -> None:
+        """Remove a client's subscription and the bridged one after the last."""
+        if self._tree.unsubscribe(topic_filter, session) and (
+            unsubscribe := self._bridged_filters.pop(topic_filter, None)
+        ) is not None:
+            unsubscribe()
+
+    @callback
+    def _async_close_session(self, session: _QuboBrokerSession, clean: bool) -> None:
+        """Forget a client and publish its will when it went away uncleanly."""
+        for topic_filter in session.subscriptions:
+            self._async_unsubscribe_filter(topic_filter, session)
+        session.subscriptions.clear()
+        if self._sessions.get(session.client_id) is session:
+            del self._sessions[session.client_id]
+        if not clean and session.will is not None:
+            topic, payload, qos, retain = session.will
+            self._async_route(topic, payload, qos, retain, session)
+
+    @callback
+    def _async_route(
+        self,
+        topic: str,
+        payload: bytes,
+        qos: int,
+        retain: bool,
+        session: _QuboBrokerSession,
+    ) -> None:
+        """Pass a client's message to the router, the subscribers and the bridge."""
+        self._stats["received"] += 1
+        if retain:
+            if not payload:
+                self._retained.pop(topic, None)
+            elif topic in self._retained or len(self._retained) < RETAINED_MAXIMUM:
+                self._retained[topic] = (payload, qos)
+        if (handler := self._handlers.get(topic)) is not None:
+            try:
+                handler(payload)
+            except Exception as err:  # noqa: BLE001 - counted like payload errors
+                self._errors.async_count_topic(topic, err)
+        self._async_deliver(topic, payload, qos)
+        if self._bridge is not None:
+            self._bridge.async_forward(topic, payload)
+
+    @callback
+    def _async_deliver(self, topic: str, payload: bytes, qos: int) -> int:
+        """Write a message to the subscribed clients and return how many got it."""
+        delivered = 0
+        for session, granted in self._tree.match(topic).items():
+            if session.send(topic, payload, min(qos, granted)):
+                delivered += 1
+            else:
+                self._stats["dropped"] += 1
+        return delivered
+
+    @callback
+    def _async_from_bridge(self, topic: str, payload: bytes) -> None:
+        """Pass a message from the external broker to the subscribed clients."""
+        self._stats["bridged_in"] += 1
+        self._async_deliver(topic, payload, MAX_QOS)
+
+    async def async_subscribe(
+        self, topic: str, payload_callback: PayloadCallbackType, qos: int
+    ) -> CALLBACK_TYPE:
+        """Hand the messages clients publish on a topic to a router callback."""
+        self._handlers[topic] = payload_callback
+        if (retained := self._retained.get(topic)) is not None:
+            self.hass.loop.call_soon(payload_callback, retained[0])
+
+        @callback
+        def async_unsubscribe() -> None:
+            """Stop handing the topic's messages to the callback."""
+            if self._handlers.get(topic) is payload_callback:
+                del self._handlers[topic]
+
+        return async_unsubscribe
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Write a command to the clients that subscribed its topic."""
+        if self._server is None:
+            raise HomeAssistantError(f"Embedded MQTT broker is not running, {topic} was not sent")
+        data = payload.encode() if isinstance(payload, str) else payload
+        self._stats["published"] += 1
+        if not self._async_deliver(topic, data, qos):
+            self._stats["undelivered"] += 1
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return broker state for diagnostics."""
+        return {
+            "name": self.name,
+            "connected": self.connected,
+            "port": self._port,
+            "clients": len(self._sessions),
+            "subscriptions": sum(
+                len(session.subscriptions) for session in self._sessions.values()
+            ),
+            "retained": len(self._retained),
+            **self._stats,
+            "bridge": self._bridge.as_dict() if self._bridge is not None else None,
+        }
@@ -0,0 +1,52 @@
+"""Payload encoding and decoding shared by the QUBO message paths.
+
+This module has no Home Assistant dependencies so it can run in the decode
+worker thread.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+# Services whose stateChanged may lack keys that the command attributes of
+# the same message carry, e.g. a switch echo with the power only there
+ATTRIBUTE_FALLBACK_SERVICES = frozenset({"lcSwitchControl"})
+
+
+def decode_state(payload: str | bytes, service: str) -> dict[str, Any]:
+    """Decode a monitor payload and return the reported state of a service.
+
+    Devices report state under events.stateChanged, but some responses only
+    carry the attributes of the command they answer. For the switch, the
+    attributes also fill in keys that stateChanged leaves out.
+    """
+    data = json.loads(payload)
+    service_data = data.get("devices", {}).get("services", {}).get(service, {})
+    state = service_data.get("events", {}).get("stateChanged")
+    if state is None:
+        return service_data.get("attributes", {})
+    if service in ATTRIBUTE_FALLBACK_SERVICES and (
+        attributes := service_data.get("attributes")
+    ):
+        return {**attributes, **state}
+    return state
+
+
+def build_switch_command(device_uuid: str, entity_uuid: str, power_state: str) -> str:
+    """Build an lcSwitchControl command payload."""
+    return json.dumps(
+        {
+            "command": {
+                "devices": {
+                    "deviceUUID": device_uuid,
+                    "entityUUID": entity_uuid,
+                    "services": {
+                        "lcSwitchControl": {
+                            "attributes": {"power": power_state},
+                            "instanceId": 0,
+                        }
+                    },
+                }
+            }
+        }
+    )
@@ -0,0 +1,254 @@
+"""Confirmation tracking and retries for QUBO device commands."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import logging
+import random
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import EVENT_COMMAND_FAILED
+from .router import async_get_router
+
+_LOGGER = logging.getLogger(__name__)
+
+# Confirmation timeout before any round trip was observed
+INITIAL_TIMEOUT = 3.0  # seconds
+MIN_TIMEOUT = 1.0  # seconds
+MAX_TIMEOUT = 15.0  # seconds
+MAX_RETRIES = 3
+JITTER = 0.2  # +/- share of the backoff delay
+
+
+class _PendingCommand:
+    """A command waiting for its monitor echo."""
+
+    __slots__ = (
+        "topic",
+        "payload",
+        "expected",
+        "priority",
+        "rollback",
+        "attempt",
+        "sent_at",
+        "handle",
+    )
+
+    def __init__(
+        self,
+        topic: str,
+        payload: str,
+        expected: dict[str, str],
+        priority: int,
+        rollback: Callable[[], None] | None,
+    ) -> None:
+        """Initialize the pending command."""
+        self.topic = topic
+        self.payload = payload
+        self.expected = expected
+        self.priority = priority
+        self.rollback = rollback
+        self.attempt = 0
+        self.sent_at = 0.0
+        self.handle: Any = None
+
+
+class QuboCommandTracker:
+    """Wait for the monitor echo of each command and retry lost ones.
+
+    QoS 1 only confirms delivery to the broker. A command counts as applied
+    when the device echoes the commanded state on its monitor topic. The
+    confirmation timeout adapts to the device's observed round trips in the
+    same way TCP sets its retransmission timeout. Unconfirmed commands are
+    resent with exponential backoff and jitter when retries are enabled. A
+    new command for the same service replaces a pending one, so a retry never
+    sends an outdated intent.
+
+    Entities show the commanded state at once. Echoes that contradict a
+    pending command are reported back so the entity keeps showing the
+    intent, and the entity's rollback callback restores the last reported
+    state if the command is never confirmed.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, device_uuid: str, device_name: str, retry: bool
+    ) -> None:
+        """Initialize the tracker."""
+        self.hass = hass
+        self._device_uuid = device_uuid
+        self._device_name = device_name
+        self._retry = retry
+        self._pending: dict[str, _PendingCommand] = {}
+
+        self._srtt: float | None = None
+        self._rttvar = 0.0
+        self._timeout = INITIAL_TIMEOUT
+
+        self._stats = {
+            "sent": 0,
+            "confirmed": 0,
+            "retries": 0,
+            "superseded": 0,
+            "failed": 0,
+            "rolled_back": 0,
+        }
+
+    async def async_send(
+        self,
+        topic: str,
+        payload: str,
+        expected: dict[str, str],
+        priority: int,
+        rollback: Callable[[], None] | None = None,
+    ) -> None:
+        """Publish a command and wait in the background for its echo.
+
+        The rollback callback runs if the command is not confirmed in time
+        or could not be sent at all.
+        """
+        service = topic.rsplit("/", 1)[-1]
+        if (previous := self._pending.pop(service, None)) is not None:
+            if previous.handle is not None:
+                previous.handle.cancel()
+            self._stats["superseded"] += 1
+
+        command = _PendingCommand(topic, payload, expected, priority, rollback)
+        self._pending[service] = command
+        self._stats["sent"] += 1
+        await self._async_publish(service, command)
+
+    async def _async_publish(self, service: str, command: _PendingCommand) -> None:
+        """Publish an attempt and start its confirmation timer."""
+        try:
+            await async_get_router(self.hass).async_publish(
+                command.topic, command.payload, priority=command.priority
+            )
+        except HomeAssistantError as err:
+            if self._pending.get(service) is command:
+                self._async_fail(service, command, str(err))
+            if command.attempt == 0:
+                raise
+            return
+        if self._pending.get(service) is not command:
+            # Confirmed or replaced while the publish was queued
+            return
+        command.sent_at = time.monotonic()
+        delay = self._timeout * 2**command.attempt
+        if command.attempt:
+            delay *= random.uniform(1 - JITTER, 1 + JITTER)
+        command.handle = self.hass.loop.call_later(
+            min(delay, MAX_TIMEOUT * 2), self._async_timeout, service, command
+        )
+
+    @callback
+    def async_echo(self, topic: str, state: dict[str, Any]) -> bool:
+        """Confirm the pending command of a monitor topic if the echo matches it.
+
+        Return True if the echo contradicts a pending command. The entity
+        then keeps showing the commanded state until it is confirmed or
+        rolled back.
+        """
+        if not self._pending:
+            return False
+        service = topic.rsplit("/", 1)[-1]
+        if (command := self._pending.get(service)) is None:
+            return False
+        if any(
+            str(state.get(key, "")).lower() != value.lower()
+            for key, value in command.expected.items()
+        ):
+            # An older state or a report for another reason, e.g. a
+            # button on the device
+            return True
+
+        del self._pending[service]
+        if command.handle is not None:
+            command.handle.cancel()
+        self._stats["confirmed"] += 1
+        if command.attempt == 0 and command.sent_at:
+            # Retried commands are ambiguous, only first attempts are sampled
+            self._async_add_sample(time.monotonic() - command.sent_at)
+        return False
+
+    @callback
+    def _async_add_sample(self, rtt: float) -> None:
+        """Update the smoothed round trip and the confirmation timeout."""
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+        self._timeout = min(MAX_TIMEOUT, max(MIN_TIMEOUT, self._srtt + 4 * self._rttvar))
+
+    @callback
+    def _async_timeout(self, service: str, command: _PendingCommand) -> None:
+        """Retry or give up on a command that was not echoed."""
+        if self._pending.get(service) is not command:
+            return
+        if self._retry and command.attempt < MAX_RETRIES:
+            command.attempt += 1
+            self._stats["retries"] += 1
+            _LOGGER.debug(
+                "No echo from %s for %s, retry %d", self._device_name, service, command.attempt
+            )
+            self.hass.async_create_background_task(
+                self._async_publish(service, command), f"qubo_local retry {service}"
+            )
+            return
+
+        attempts = command.attempt + 1
+        self._async_fail(
+            service,
+            command,
+            f"not confirmed after {attempts} attempt{'s' if attempts > 1 else ''}",
+        )
+
+    @callback
+    def _async_fail(self, service: str, command: _PendingCommand, reason: str) -> None:
+        """Give up on a command and restore the reported state."""
+        del self._pending[service]
+        self._stats["failed"] += 1
+        _LOGGER.warning(
+            "%s %s command %s: %s",
+            self._device_name, service, command.expected, reason
+        )
+        if command.rollback is not None:
+            self._stats["rolled_back"] += 1
+            command.rollback()
+        self.hass.bus.async_fire(
+            EVENT_COMMAND_FAILED,
+            {
+                "device_uuid": self._device_uuid,
+                "service": service,
+                "state": command.expected,
+                "attempts": command.attempt + 1,
+                "reason": reason,
+            },
+        )
+
+    @callback
+    def async_cancel(self) -> None:
+        """Stop waiting for all pending commands."""
+        for command in self._pending.values():
+            if command.handle is not None:
+                command.handle.cancel()
+        self._pending.clear()
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return command statistics for diagnostics."""
+        sent = self._stats["sent"]
+        completed = self._stats["confirmed"] + self._stats["failed"]
+        return {
+            "retry": self._retry,
+            **self._stats,
+            "pending": list(self._pending),
+            "success_rate": round(self._stats["confirmed"] / completed, 3) if completed else None,
+            "retry_rate": round(self._stats["retries"] / sent, 3) if sent else None,
+            "round_trip_ms": round(self._srtt * 1000, 1) if self._srtt is not None else None,
+            "timeout_ms": round(self._timeout * 1000),
+        }
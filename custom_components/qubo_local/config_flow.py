@@ -14,22 +14,88 @@ from homeassistant.const import CONF_NAME
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.selector import (
+    TextSelector,
+    TextSelectorConfig,
+    TextSelectorType,
+)
 
 from .const import (
+    CONF_AQI_REFRESH_MAX,
+    CONF_AQI_REFRESH_MIN,
+    CONF_BROKER,
+    CONF_BROKER_BRIDGE,
+    CONF_BROKER_CERTFILE,
+    CONF_BROKER_CONNECTIONS,
+    CONF_BROKER_KEYFILE,
+    CONF_BROKER_LISTEN_PASSWORD,
+    CONF_BROKER_LISTEN_USERNAME,
+    CONF_BROKER_LISTEN_PORT,
+    CONF_BROKER_PASSWORD,
+    CONF_BROKER_PORT,
+    CONF_BROKER_PROTOCOL,
+    CONF_BROKER_SHARE_GROUP,
+    CONF_BROKER_TLS,
+    CONF_BROKER_USERNAME,
+    CONF_COMMAND_RETRY,
+    CONF_DECODE_WORKER,
     CONF_DEVICE_MAC,
     CONF_DEVICE_NAME,
     CONF_DEVICE_TYPE,
     CONF_DEVICE_UUID,
     CONF_ENTITY_UUID,
+    CONF_EXPORT,
+    CONF_EXPORT_MAX_SIZE,
+    CONF_EXPORT_ROTATE_INTERVAL,
     CONF_HANDLE_NAME,
+    CONF_LOAD_SHED_BUDGET,
+    CONF_LOAD_SHED_HYSTERESIS,
+    CONF_METER_PERIODS,
+    CONF_OVERLOAD_DEVICE_RATE,
+    CONF_OVERLOAD_RATE,
+    CONF_PUBLISH_RATE,
+    CONF_RESYNC_WINDOW,
+    CONF_PURIFIER_CARD_ALIASES,
+    CONF_SHED_PRIORITY,
+    CONF_SLOW_HANDLER_THRESHOLD,
+    CONF_STATISTICS_MODE,
+    CONF_TRANSPORT,
     CONF_UNIT_UUID,
+    CONF_WATCHDOG,
+    DEFAULT_AQI_REFRESH_INTERVAL,
+    DEFAULT_AQI_REFRESH_MAX,
+    DEFAULT_BROKER_CONNECTIONS,
+    DEFAULT_BROKER_LISTEN_PORT,
+    DEFAULT_BROKER_PORT,
+    DEFAULT_EXPORT_MAX_SIZE,
+    DEFAULT_EXPORT_ROTATE_INTERVAL,
+    DEFAULT_LOAD_SHED_HYSTERESIS,
+    DEFAULT_OVERLOAD_DEVICE_RATE,
+    DEFAULT_OVERLOAD_RATE,
+    DEFAULT_PUBLISH_RATE,
     DEFAULT_NAME,
+    DEFAULT_NAME_FLEET,
     DEFAULT_NAME_PURIFIER,
+    DEFAULT_RESYNC_WINDOW,
+    DEFAULT_SLOW_HANDLER_THRESHOLD,
     DEVICE_PREFIX_PLUG,
     DEVICE_PREFIX_PURIFIER,
     DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_FLEET,
     DEVICE_TYPE_SMART_PLUG,
     DOMAIN,
+    FLEET_UNIQUE_ID,
+    METER_DAILY,
+    METER_HOURLY,
+    METER_MONTHLY,
+    MQTT_PROTOCOL_5,
+    MQTT_PROTOCOL_311,
+    TLS_INSECURE,
+    TLS_OFF,
+    TLS_VERIFY,
+    TRANSPORT_DIRECT,
+    TRANSPORT_EMBEDDED,
+    TRANSPORT_MQTT,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -47,6 +113,14 @@ class QuboLocalConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self._discovered_devices = {}
         self._discovery_task = None
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> QuboLocalOptionsFlow:
+        """Get the options flow for this handler."""
+        return QuboLocalOptionsFlow(config_entry)
+
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
@@ -58,7 +132,7 @@ class QuboLocalConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         return self.async_show_menu(
             step_id="user",
-            menu_options=["mqtt_discovery", "manual"],
+            menu_options=["mqtt_discovery", "manual", "fleet"],
         )
 
     async def async_step_mqtt_discovery(
@@ -183,6 +257,31 @@ class QuboLocalConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         _LOGGER.info("MQTT discovery completed. Found %d devices", len(self._discovered_devices))
 
+    async def async_step_fleet(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Add the fleet entry that hosts integration-wide entities."""
+        await self.async_set_unique_id(FLEET_UNIQUE_ID)
+        self._abort_if_unique_id_configured()
+
+        if user_input is not None:
+            return self.async_create_entry(
+                title=DEFAULT_NAME_FLEET,
+                data={CONF_DEVICE_TYPE: DEVICE_TYPE_FLEET},
+            )
+
+        return self.async_show_form(step_id="fleet", data_schema=vol.Schema({}))
+
+    async def async_step_import(self, import_data: dict[str, Any]) -> FlowResult:
+        """Add a device from an imported manifest row."""
+        await self.async_set_unique_id(import_data[CONF_DEVICE_UUID])
+        self._abort_if_unique_id_configured()
+
+        return self.async_create_entry(
+            title=import_data[CONF_DEVICE_NAME],
+            data=import_data,
+        )
+
     async def async_step_manual(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
@@ -221,3 +320,270 @@ class QuboLocalConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             data_schema=data_schema,
             errors=errors,
         )
+
+
+class QuboLocalOptionsFlow(config_entries.OptionsFlow):
+    """Handle QUBO Local Control options."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        """Initialize the options flow."""
+        self._config_entry = config_entry
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage the device options."""
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            if user_input.get(CONF_AQI_REFRESH_MIN, 0) > user_input.get(
+                CONF_AQI_REFRESH_MAX, DEFAULT_AQI_REFRESH_MAX
+            ):
+                errors[CONF_AQI_REFRESH_MAX] = "aqi_refresh_range"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        # Show what was entered again when it was rejected
+        options = {**self._config_entry.options, **(user_input or {})}
+        device_type = self._config_entry.data.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG)
+        schema: dict[Any, Any] = {}
+
+        if device_type == DEVICE_TYPE_AIR_PURIFIER:
+            schema[
+                vol.Optional(
+                    CONF_PURIFIER_CARD_ALIASES,
+                    default=options.get(CONF_PURIFIER_CARD_ALIASES, True),
+                )
+            ] = cv.boolean
+            schema[
+                vol.Optional(
+                    CONF_AQI_REFRESH_MIN,
+                    default=options.get(CONF_AQI_REFRESH_MIN, DEFAULT_AQI_REFRESH_INTERVAL),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=5, max=3600))
+            schema[
+                vol.Optional(
+                    CONF_AQI_REFRESH_MAX,
+                    default=options.get(CONF_AQI_REFRESH_MAX, DEFAULT_AQI_REFRESH_MAX),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=5, max=3600))
+            schema[
+                vol.Optional(
+                    CONF_COMMAND_RETRY,
+                    default=options.get(CONF_COMMAND_RETRY, False),
+                )
+            ] = cv.boolean
+        elif device_type == DEVICE_TYPE_SMART_PLUG:
+            schema[
+                vol.Optional(
+                    CONF_STATISTICS_MODE,
+                    default=options.get(CONF_STATISTICS_MODE, False),
+                )
+            ] = cv.boolean
+            schema[
+                vol.Optional(
+                    CONF_METER_PERIODS,
+                    default=options.get(CONF_METER_PERIODS, []),
+                )
+            ] = cv.multi_select({
+                METER_HOURLY: "Hourly",
+                METER_DAILY: "Daily",
+                METER_MONTHLY: "Monthly",
+            })
+            schema[
+                vol.Optional(
+                    CONF_SHED_PRIORITY,
+                    default=options.get(CONF_SHED_PRIORITY, 0),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=0, max=10))
+            schema[
+                vol.Optional(
+                    CONF_COMMAND_RETRY,
+                    default=options.get(CONF_COMMAND_RETRY, False),
+                )
+            ] = cv.boolean
+        elif device_type == DEVICE_TYPE_FLEET:
+            schema[
+                vol.Optional(
+                    CONF_LOAD_SHED_BUDGET,
+                    default=options.get(CONF_LOAD_SHED_BUDGET, 0),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=0))
+            schema[
+                vol.Optional(
+                    CONF_LOAD_SHED_HYSTERESIS,
+                    default=options.get(
+                        CONF_LOAD_SHED_HYSTERESIS, DEFAULT_LOAD_SHED_HYSTERESIS
+                    ),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=0))
+            schema[
+                vol.Optional(
+                    CONF_OVERLOAD_RATE,
+                    default=options.get(CONF_OVERLOAD_RATE, DEFAULT_OVERLOAD_RATE),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=1))
+            schema[
+                vol.Optional(
+                    CONF_OVERLOAD_DEVICE_RATE,
+                    default=options.get(
+                        CONF_OVERLOAD_DEVICE_RATE, DEFAULT_OVERLOAD_DEVICE_RATE
+                    ),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=1))
+            schema[
+                vol.Optional(
+                    CONF_PUBLISH_RATE,
+                    default=options.get(CONF_PUBLISH_RATE, DEFAULT_PUBLISH_RATE),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=0))
+            schema[
+                vol.Optional(
+                    CONF_RESYNC_WINDOW,
+                    default=options.get(CONF_RESYNC_WINDOW, DEFAULT_RESYNC_WINDOW),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=0, max=600))
+            schema[
+                vol.Optional(
+                    CONF_DECODE_WORKER,
+                    default=options.get(CONF_DECODE_WORKER, False),
+                )
+            ] = cv.boolean
+            schema[
+                vol.Optional(
+                    CONF_WATCHDOG,
+                    default=options.get(CONF_WATCHDOG, False),
+                )
+            ] = cv.boolean
+            schema[
+                vol.Optional(
+                    CONF_SLOW_HANDLER_THRESHOLD,
+                    default=options.get(
+                        CONF_SLOW_HANDLER_THRESHOLD, DEFAULT_SLOW_HANDLER_THRESHOLD
+                    ),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=1))
+            schema[
+                vol.Optional(
+                    CONF_EXPORT,
+                    default=options.get(CONF_EXPORT, False),
+                )
+            ] = cv.boolean
+            schema[
+                vol.Optional(
+                    CONF_EXPORT_MAX_SIZE,
+                    default=options.get(CONF_EXPORT_MAX_SIZE, DEFAULT_EXPORT_MAX_SIZE),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=1, max=4096))
+            schema[
+                vol.Optional(
+                    CONF_EXPORT_ROTATE_INTERVAL,
+                    default=options.get(
+                        CONF_EXPORT_ROTATE_INTERVAL, DEFAULT_EXPORT_ROTATE_INTERVAL
+                    ),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=1, max=1440))
+            schema[
+                vol.Optional(
+                    CONF_TRANSPORT,
+                    default=options.get(CONF_TRANSPORT, TRANSPORT_MQTT),
+                )
+            ] = vol.In({
+                TRANSPORT_MQTT: "MQTT integration",
+                TRANSPORT_DIRECT: "Direct broker connections",
+                TRANSPORT_EMBEDDED: "Embedded broker",
+            })
+            schema[
+                vol.Optional(
+                    CONF_BROKER,
+                    default=options.get(CONF_BROKER, ""),
+                )
+            ] = cv.string
+            schema[
+                vol.Optional(
+                    CONF_BROKER_PORT,
+                    default=options.get(CONF_BROKER_PORT, DEFAULT_BROKER_PORT),
+                )
+            ] = cv.port
+            schema[
+                vol.Optional(
+                    CONF_BROKER_USERNAME,
+                    default=options.get(CONF_BROKER_USERNAME, ""),
+                )
+            ] = cv.string
+            schema[
+                vol.Optional(
+                    CONF_BROKER_PASSWORD,
+                    default=options.get(CONF_BROKER_PASSWORD, ""),
+                )
+            ] = TextSelector(TextSelectorConfig(type=TextSelectorType.PASSWORD))
+            schema[
+                vol.Optional(
+                    CONF_BROKER_TLS,
+                    default=options.get(CONF_BROKER_TLS, TLS_OFF),
+                )
+            ] = vol.In({
+                TLS_OFF: "Off",
+                TLS_VERIFY: "On",
+                TLS_INSECURE: "On, without certificate verification",
+            })
+            schema[
+                vol.Optional(
+                    CONF_BROKER_CONNECTIONS,
+                    default=options.get(CONF_BROKER_CONNECTIONS, DEFAULT_BROKER_CONNECTIONS),
+                )
+            ] = vol.All(vol.Coerce(int), vol.Range(min=1, max=16))
+            schema[
+                vol.Optional(
+                    CONF_BROKER_PROTOCOL,
+                    default=options.get(CONF_BROKER_PROTOCOL, MQTT_PROTOCOL_5),
+                )
+            ] = vol.In({
+                MQTT_PROTOCOL_5: "MQTT 5, falling back to 3.1.1",
+                MQTT_PROTOCOL_311: "MQTT 3.1.1",
+            })
+            schema[
+                vol.Optional(
+                    CONF_BROKER_SHARE_GROUP,
+                    default=options.get(CONF_BROKER_SHARE_GROUP, ""),
+                )
+            ] = cv.string
+            schema[
+                vol.Optional(
+                    CONF_BROKER_LISTEN_PORT,
+                    default=options.get(CONF_BROKER_LISTEN_PORT, DEFAULT_BROKER_LISTEN_PORT),
+                )
+            ] = cv.port
+            schema[
+                vol.Optional(
+                    CONF_BROKER_CERTFILE,
+                    default=options.get(CONF_BROKER_CERTFILE, ""),
+                )
+            ] = cv.string
+            schema[
+                vol.Optional(
+                    CONF_BROKER_KEYFILE,
+                    default=options.get(CONF_BROKER_KEYFILE, ""),
+                )
+            ] = cv.string
+            schema[
+                vol.Optional(
+                    CONF_BROKER_LISTEN_USERNAME,
+                    default=options.get(CONF_BROKER_LISTEN_USERNAME, ""),
+                )
+            ] = cv.string
+            schema[
+                vol.Optional(
+                    CONF_BROKER_LISTEN_PASSWORD,
+                    default=options.get(CONF_BROKER_LISTEN_PASSWORD, ""),
+                )
+            ] = TextSelector(TextSelectorConfig(type=TextSelectorType.PASSWORD))
+            schema[
+                vol.Optional(
+                    CONF_BROKER_BRIDGE,
+                    default=options.get(CONF_BROKER_BRIDGE, False),
+                )
+            ] = cv.boolean
+
+        return self.async_show_form(
+            step_id="init", data_schema=vol.Schema(schema), errors=errors
+        )
@@ -4,6 +4,20 @@ DOMAIN = "qubo_local"
 MANUFACTURER = "QUBO"
 MODEL = "Smart Plug"
 MODEL_AIR_PURIFIER = "Air Purifier"
+MODEL_FLEET = "Fleet"
+
+# Shared runtime data and dispatcher signals
+DATA_AGGREGATES = f"{DOMAIN}_aggregates"
+DATA_DEVICE_STATES = f"{DOMAIN}_device_states"
+DATA_ERRORS = f"{DOMAIN}_errors"
+DATA_RESYNC = f"{DOMAIN}_resync"
+DATA_ROUTER = f"{DOMAIN}_router"
+DATA_STARTUP = f"{DOMAIN}_startup"
+DATA_WATCHDOG = f"{DOMAIN}_watchdog"
+SIGNAL_AGGREGATE_GROUP_ADDED = f"{DOMAIN}_aggregate_group_added"
+
+# Bus events
+EVENT_COMMAND_FAILED = f"{DOMAIN}_command_failed"
 
 # Configuration keys
 CONF_DEVICE_UUID = "device_uuid"
@@ -14,9 +28,60 @@ CONF_DEVICE_NAME = "device_name"
 CONF_DEVICE_MAC = "device_mac"
 CONF_DEVICE_TYPE = "device_type"
 
+# Option keys
+CONF_STATISTICS_MODE = "statistics_mode"
+CONF_PURIFIER_CARD_ALIASES = "purifier_card_aliases"
+CONF_SHED_PRIORITY = "shed_priority"
+CONF_LOAD_SHED_BUDGET = "load_shed_budget"
+CONF_LOAD_SHED_HYSTERESIS = "load_shed_hysteresis"
+CONF_OVERLOAD_RATE = "overload_rate"
+CONF_OVERLOAD_DEVICE_RATE = "overload_device_rate"
+CONF_DECODE_WORKER = "decode_worker"
+CONF_WATCHDOG = "watchdog"
+CONF_SLOW_HANDLER_THRESHOLD = "slow_handler_threshold"
+CONF_PUBLISH_RATE = "publish_rate"
+CONF_COMMAND_RETRY = "command_retry"
+CONF_RESYNC_WINDOW = "resync_window"
+CONF_AQI_REFRESH_MIN = "aqi_refresh_min"
+CONF_AQI_REFRESH_MAX = "aqi_refresh_max"
+CONF_METER_PERIODS = "meter_periods"
+CONF_EXPORT = "export"
+CONF_EXPORT_MAX_SIZE = "export_max_size"
+CONF_EXPORT_ROTATE_INTERVAL = "export_rotate_interval"
+CONF_TRANSPORT = "transport"
+CONF_BROKER = "broker"
+CONF_BROKER_PORT = "broker_port"
+CONF_BROKER_USERNAME = "broker_username"
+CONF_BROKER_PASSWORD = "broker_password"
+CONF_BROKER_TLS = "broker_tls"
+CONF_BROKER_CONNECTIONS = "broker_connections"
+CONF_BROKER_PROTOCOL = "broker_protocol"
+CONF_BROKER_SHARE_GROUP = "broker_share_group"
+CONF_BROKER_LISTEN_PORT = "broker_listen_port"
+CONF_BROKER_CERTFILE = "broker_certfile"
+CONF_BROKER_KEYFILE = "broker_keyfile"
+CONF_BROKER_BRIDGE = "broker_bridge"
+CONF_BROKER_LISTEN_USERNAME = "broker_listen_username"
+CONF_BROKER_LISTEN_PASSWORD = "broker_listen_password"
+
+# Message transports
+TRANSPORT_MQTT = "mqtt"  # Home Assistant's MQTT integration
+TRANSPORT_DIRECT = "direct"  # connections owned by the integration
+TRANSPORT_EMBEDDED = "embedded"  # devices connect to a broker inside the integration
+
+# MQTT versions of the direct transport, MQTT 5 falls back to 3.1.1
+MQTT_PROTOCOL_5 = "5"
+MQTT_PROTOCOL_311 = "3.1.1"
+
+# Broker TLS modes of the direct transport
+TLS_OFF = "off"
+TLS_VERIFY = "verify"
+TLS_INSECURE = "insecure"
+
 # Device types
 DEVICE_TYPE_SMART_PLUG = "smart_plug"
 DEVICE_TYPE_AIR_PURIFIER = "air_purifier"
+DEVICE_TYPE_FLEET = "fleet"
 
 # Device type prefixes (from srcDeviceId)
 DEVICE_PREFIX_PLUG = "HSP"  # Hero Smart Plug
@@ -25,8 +90,24 @@ DEVICE_PREFIX_PURIFIER = "HPH"  # Hero Purifier Hub
 # Default values
 DEFAULT_NAME = "QUBO Smart Plug"
 DEFAULT_NAME_PURIFIER = "QUBO Air Purifier"
+DEFAULT_NAME_FLEET = "QUBO Fleet"
+FLEET_UNIQUE_ID = "fleet"
 DEFAULT_REFRESH_INTERVAL = 60  # seconds
 DEFAULT_AQI_REFRESH_INTERVAL = 30  # seconds
+DEFAULT_AQI_REFRESH_MAX = 300  # seconds, purifier off and PM2.5 stable
+DEFAULT_STATISTICS_STATE_INTERVAL = 300  # seconds between state writes in statistics mode
+DEFAULT_LOAD_SHED_HYSTERESIS = 100  # watts
+DEFAULT_OVERLOAD_RATE = 500  # messages per second across all devices
+DEFAULT_OVERLOAD_DEVICE_RATE = 10  # messages per second from one device
+DEFAULT_SLOW_HANDLER_THRESHOLD = 10  # milliseconds
+DEFAULT_PUBLISH_RATE = 0  # commands per second to the broker, 0 for no limit
+DEFAULT_RESYNC_WINDOW = 30  # seconds to spread the refreshes over after a reconnect
+DEFAULT_FLEET_PUSH_RATE = 2  # fleet snapshot delta batches per second
+DEFAULT_EXPORT_MAX_SIZE = 64  # MiB per export file
+DEFAULT_EXPORT_ROTATE_INTERVAL = 60  # minutes per export file
+DEFAULT_BROKER_PORT = 1883
+DEFAULT_BROKER_CONNECTIONS = 1
+DEFAULT_BROKER_LISTEN_PORT = 8883  # the port QUBO devices connect to
 
 # MQTT topics patterns - Smart Plug
 TOPIC_CONTROL_SWITCH = "/control/{unit_uuid}/{device_uuid}/lcSwitchControl"
@@ -45,6 +126,16 @@ TOPIC_MONITOR_FAN_MODE = "/monitor/{unit_uuid}/{device_uuid}/fanControlMode"
 TOPIC_MONITOR_AQI = "/monitor/{unit_uuid}/{device_uuid}/aqiStatus"
 TOPIC_MONITOR_FILTER = "/monitor/{unit_uuid}/{device_uuid}/filterReset"
 
+# Telemetry services whose samples may be merged under overload. Control
+# echoes (lcSwitchControl, fanSpeedControl, fanControlMode) never are.
+MERGEABLE_SERVICES = frozenset({"plugMetering", "aqiStatus", "filterReset"})
+
+# Consumption meter periods
+METER_HOURLY = "hourly"
+METER_DAILY = "daily"
+METER_MONTHLY = "monthly"
+METER_PERIODS = [METER_HOURLY, METER_DAILY, METER_MONTHLY]
+
 # Air Purifier modes
 PURIFIER_MODE_AUTO = "auto"
 PURIFIER_MODE_MANUAL = "manual"
@@ -65,3 +156,9 @@ ENTITY_ENERGY = "energy"
 ENTITY_FAN = "fan"
 ENTITY_PM25 = "pm25"
 ENTITY_FILTER_LIFE = "filter_life"
+
+# Entity IDs - Fleet
+ENTITY_TOTAL_POWER = "total_power"
+ENTITY_TOTAL_ENERGY = "total_energy"
+ENTITY_LOOP_LAG = "loop_lag"
+ENTITY_SLOWEST_HANDLER = "slowest_handler"
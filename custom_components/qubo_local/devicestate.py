@@ -0,0 +1,362 @@
+"""Shared latest-state store of every QUBO device."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from datetime import timedelta
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .aggregate import async_get_aggregate_tracker
+from .const import (
+    DATA_DEVICE_STATES,
+    DEVICE_TYPE_AIR_PURIFIER,
+    TOPIC_MONITOR_AQI,
+    TOPIC_MONITOR_ENERGY,
+    TOPIC_MONITOR_SWITCH,
+)
+from .filterlife import QuboFilterPredictor
+from .router import async_get_router
+
+_LOGGER = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = timedelta(seconds=30)
+
+# Values shown in the fleet snapshot, changes of these notify listeners
+PLUG_FIELDS = ("available", "on", "power")
+PURIFIER_FIELDS = ("available", "on", "pm25", "filter_life")
+# Values a plugMetering reading can set, named like the reported keys
+METERING_FIELDS = ("power", "voltage", "current", "consumption")
+
+
+class DeviceState:
+    """Latest reported values of a single device."""
+
+    __slots__ = (
+        "device_uuid",
+        "unit_uuid",
+        "name",
+        "device_type",
+        "stale_timeout",
+        "version",
+        "last_seen",
+        "available",
+        "on",
+        "power",
+        "voltage",
+        "current",
+        "consumption",
+        "pm25",
+        "filter_life",
+        "listeners",
+    )
+
+    def __init__(
+        self,
+        device_uuid: str,
+        unit_uuid: str,
+        name: str,
+        device_type: str,
+        stale_timeout: float,
+    ) -> None:
+        """Initialize the device state."""
+        self.device_uuid = device_uuid
+        self.unit_uuid = unit_uuid
+        self.name = name
+        self.device_type = device_type
+        self.stale_timeout = stale_timeout
+        # Incremented on every update so cached renderings can be reused
+        self.version = 0
+        self.last_seen = 0.0
+        self.available = False
+        self.on: bool | None = None
+        self.power: float | None = None
+        self.voltage: float | None = None
+        self.current: float | None = None
+        self.consumption: float | None = None
+        self.pm25: int | None = None
+        self.filter_life: int | None = None
+        # Reading listeners, called with the fields a reading set
+        self.listeners: list[Callable[[tuple[str, ...]], None]] = []
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        """Return the snapshot fields of the device type."""
+        if self.device_type == DEVICE_TYPE_AIR_PURIFIER:
+            return PURIFIER_FIELDS
+        return PLUG_FIELDS
+
+    def as_compact(self, full: bool = True) -> dict[str, Any]:
+        """Return the snapshot values, with name, type and unit when full."""
+        values = {field: getattr(self, field) for field in self.fields}
+        if self.power is not None and "power" in values:
+            values["power"] = round(self.power, 1)
+        if full:
+            values.update(name=self.name, type=self.device_type, unit=self.unit_uuid)
+        return values
+
+
+class QuboDeviceStateStore:
+    """Keep the latest state of every device in one place.
+
+    The store subscribes to the power, metering and AQI topics of each
+    registered device through the router, next to the entities, and
+    records the decoded values. A device is available from its first
+    message until it has not reported for its stale timeout or the broker
+    connection is lost.
+
+    Listeners are called with the device when a snapshot value changes:
+    availability, power state, power at 0.1 W, PM2.5 or filter life.
+    Voltage, current and the consumption counter are kept without
+    notifying.
+
+    Sensors follow a single device instead, through reading listeners that
+    are called after every metering, PM2.5 or filter life reading with the
+    fields it set, so each reading is decoded once for all of them.
+
+    Power and consumption readings of every plug also go to the unit, area
+    and fleet aggregates here, so a plug counts towards them whether or not
+    its sensors are enabled.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the store."""
+        self.hass = hass
+        self.devices: dict[str, DeviceState] = {}
+        self._listeners: list[Callable[[str], None]] = []
+        self._unsub_sweep: CALLBACK_TYPE | None = None
+        self._unsub_connection: CALLBACK_TYPE | None = None
+
+    async def async_register(
+        self,
+        device_uuid: str,
+        unit_uuid: str,
+        name: str,
+        device_type: str,
+        stale_timeout: float,
+        filter_predictor: QuboFilterPredictor | None = None,
+    ) -> CALLBACK_TYPE:
+        """Start tracking a device, return a callback that removes it."""
+        device = DeviceState(device_uuid, unit_uuid, name, device_type, stale_timeout)
+        self.devices[device_uuid] = device
+
+        router = async_get_router(self.hass)
+        topics = {"unit_uuid": unit_uuid, "device_uuid": device_uuid}
+        if device_type == DEVICE_TYPE_AIR_PURIFIER:
+            reading = router.async_subscribe(
+                TOPIC_MONITOR_AQI.format(**topics),
+                lambda state: self._async_aqi_received(device, state),
+                1,
+            )
+        else:
+            reading = router.async_subscribe(
+                TOPIC_MONITOR_ENERGY.format(**topics),
+                lambda state: self._async_metering_received(device, state),
+                1,
+            )
+        results = await asyncio.gather(
+            router.async_subscribe(
+                TOPIC_MONITOR_SWITCH.format(**topics),
+                lambda state: self._async_switch_received(device, state),
+                1,
+            ),
+            reading,
+            return_exceptions=True,
+        )
+        unsubscribes = [result for result in results if callable(result)]
+        if len(unsubscribes) < len(results):
+            # Undo the subscription that succeeded and forget the device
+            for unsubscribe in unsubscribes:
+                unsubscribe()
+            if self.devices.get(device_uuid) is device:
+                del self.devices[device_uuid]
+            raise next(result for result in results if isinstance(result, BaseException))
+        if filter_predictor is not None:
+            device.filter_life = filter_predictor.hours_remaining
+
+            @callback
+            def async_filter_updated() -> None:
+                """Record a new predicted filter life."""
+                self._async_set(device, "filter_life", filter_predictor.hours_remaining)
+                self._async_reading(device, ("filter_life",))
+
+            unsubscribes.append(filter_predictor.async_add_listener(async_filter_updated))
+
+        if self._unsub_sweep is None:
+            self._unsub_sweep = async_track_time_interval(
+                self.hass, self._async_sweep, SWEEP_INTERVAL
+            )
+            self._unsub_connection = router.async_subscribe_connection_status(
+                self._async_connection_changed
+            )
+        self._async_notify(device_uuid)
+
+        @callback
+        def async_unregister() -> None:
+            """Stop tracking the device."""
+            for unsubscribe in unsubscribes:
+                unsubscribe()
+            if self.devices.get(device_uuid) is device:
+                del self.devices[device_uuid]
+                self._async_notify(device_uuid)
+            if not self.devices and self._unsub_sweep is not None:
+                self._unsub_sweep()
+                self._unsub_sweep = None
+                self._unsub_connection()
+                self._unsub_connection = None
+
+        return async_unregister
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[str], None]) -> CALLBACK_TYPE:
+        """Call back with the device whenever one of its snapshot values changes.
+
+        Devices that were added or removed are reported the same way.
+        """
+        self._listeners.append(update_callback)
+        return lambda: self._listeners.remove(update_callback)
+
+    @callback
+    def async_add_reading_listener(
+        self, device: DeviceState, reading_callback: Callable[[tuple[str, ...]], None]
+    ) -> CALLBACK_TYPE:
+        """Call back with the fields set by every reading of a device."""
+        device.listeners.append(reading_callback)
+        return lambda: device.listeners.remove(reading_callback)
+
+    @callback
+    def _async_reading(self, device: DeviceState, fields: tuple[str, ...]) -> None:
+        """Tell the reading listeners of a device which fields a reading set."""
+        for reading_callback in list(device.listeners):
+            reading_callback(fields)
+
+    @callback
+    def _async_notify(self, device_uuid: str) -> None:
+        """Tell the listeners that a device changed."""
+        for update_callback in list(self._listeners):
+            update_callback(device_uuid)
+
+    @callback
+    def _async_seen(self, device: DeviceState) -> bool:
+        """Mark a device as reporting, return whether it became available."""
+        device.version += 1
+        device.last_seen = time.monotonic()
+        if device.available:
+            return False
+        device.available = True
+        return True
+
+    @callback
+    def _async_set(
+        self, device: DeviceState, field: str, value: Any, changed: bool = False
+    ) -> None:
+        """Set a snapshot value and notify when it or availability changed."""
+        previous = getattr(device, field)
+        setattr(device, field, value)
+        device.version += 1
+        if field == "power" and previous is not None and value is not None:
+            changed = changed or round(previous, 1) != round(value, 1)
+        else:
+            changed = changed or previous != value
+        if changed:
+            self._async_notify(device.device_uuid)
+
+    @callback
+    def _async_switch_received(self, device: DeviceState, state: dict[str, Any]) -> None:
+        """Record the power state of a plug or purifier."""
+        became_available = self._async_seen(device)
+        if (power_state := state.get("power")) is not None:
+            self._async_set(device, "on", power_state.lower() == "on", became_available)
+            if not device.on and device.device_type != DEVICE_TYPE_AIR_PURIFIER:
+                # An off plug draws nothing, don't wait for the next metering sample
+                async_get_aggregate_tracker(self.hass).async_update(
+                    device.device_uuid, "power", 0.0
+                )
+        elif became_available:
+            self._async_notify(device.device_uuid)
+
+    @callback
+    def _async_metering_received(self, device: DeviceState, state: dict[str, Any]) -> None:
+        """Record the metering values of a plug."""
+        became_available = self._async_seen(device)
+        if (voltage := state.get("voltage")) is not None:
+            device.voltage = float(voltage)
+        if (current := state.get("current")) is not None:
+            device.current = float(current) / 1000.0
+        if (consumption := state.get("consumption")) is not None:
+            device.consumption = float(consumption)
+        if (power := state.get("power")) is not None:
+            self._async_set(device, "power", float(power), became_available)
+        elif became_available:
+            self._async_notify(device.device_uuid)
+        aggregates = async_get_aggregate_tracker(self.hass)
+        if power is not None:
+            aggregates.async_update(device.device_uuid, "power", device.power)
+        if consumption is not None:
+            aggregates.async_update(device.device_uuid, "consumption", device.consumption)
+        if device.listeners:
+            self._async_reading(
+                device,
+                tuple(field for field in METERING_FIELDS if state.get(field) is not None),
+            )
+
+    @callback
+    def _async_aqi_received(self, device: DeviceState, state: dict[str, Any]) -> None:
+        """Record the PM2.5 reading of a purifier."""
+        became_available = self._async_seen(device)
+        if (pm25 := state.get("PM25")) is not None:
+            self._async_set(device, "pm25", int(pm25), became_available)
+            self._async_reading(device, ("pm25",))
+        elif became_available:
+            self._async_notify(device.device_uuid)
+
+    @callback
+    def _async_sweep(self, _now: Any = None) -> None:
+        """Mark devices that stopped reporting as unavailable."""
+        now = time.monotonic()
+        for device in self.devices.values():
+            if device.available and now - device.last_seen > device.stale_timeout:
+                _LOGGER.debug("%s stopped reporting, marking it unavailable", device.name)
+                device.available = False
+                device.version += 1
+                self._async_notify(device.device_uuid)
+
+    @callback
+    def _async_connection_changed(self, connected: bool) -> None:
+        """Mark every device unavailable while the broker is disconnected."""
+        if connected:
+            return
+        for device in self.devices.values():
+            if device.available:
+                device.available = False
+                device.version += 1
+                self._async_notify(device.device_uuid)
+
+    @callback
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Return the full snapshot of every device."""
+        return {
+            device_uuid: device.as_compact()
+            for device_uuid, device in self.devices.items()
+        }
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return store state for diagnostics."""
+        return {
+            "devices": len(self.devices),
+            "available": sum(device.available for device in self.devices.values()),
+            "listeners": len(self._listeners),
+        }
+
+
+@callback
+def async_get_device_states(hass: HomeAssistant) -> QuboDeviceStateStore:
+    """Return the shared device state store, creating it on first use."""
+    if (store := hass.data.get(DATA_DEVICE_STATES)) is None:
+        store = hass.data[DATA_DEVICE_STATES] = QuboDeviceStateStore(hass)
+    return store
@@ -0,0 +1,79 @@
+"""Diagnostics support for QUBO Local Control."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    CONF_BROKER_LISTEN_PASSWORD,
+    CONF_BROKER_LISTEN_USERNAME,
+    CONF_BROKER_PASSWORD,
+    CONF_BROKER_USERNAME,
+    CONF_DEVICE_MAC,
+    CONF_DEVICE_TYPE,
+    CONF_HANDLE_NAME,
+    DEVICE_TYPE_FLEET,
+    DOMAIN,
+)
+from .devicestate import async_get_device_states
+from .resync import async_get_resync
+from .router import async_get_router
+from .startup import async_get_startup_timings
+
+TO_REDACT = {
+    CONF_BROKER_LISTEN_PASSWORD,
+    CONF_BROKER_LISTEN_USERNAME,
+    CONF_BROKER_PASSWORD,
+    CONF_BROKER_USERNAME,
+    CONF_DEVICE_MAC,
+    CONF_HANDLE_NAME,
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    data = hass.data[DOMAIN].get(entry.entry_id, {})
+
+    diagnostics: dict[str, Any] = {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": async_redact_data(dict(entry.options), TO_REDACT),
+        },
+    }
+
+    if entry.data.get(CONF_DEVICE_TYPE) == DEVICE_TYPE_FLEET:
+        diagnostics["router"] = async_get_router(hass).as_dict()
+        diagnostics["resync"] = async_get_resync(hass).as_dict()
+        diagnostics["device_states"] = async_get_device_states(hass).as_dict()
+        diagnostics["startup"] = async_get_startup_timings(hass).as_dict()
+
+    if (startup := data.get("startup")) is not None:
+        diagnostics["startup"] = startup.as_dict()
+
+    if (commands := data.get("commands")) is not None:
+        diagnostics["commands"] = commands.as_dict()
+
+    if (aqi_refresh := data.get("aqi_refresh")) is not None:
+        diagnostics["aqi_refresh"] = aqi_refresh.as_dict()
+
+    if (filter_predictor := data.get("filter")) is not None:
+        diagnostics["filter"] = filter_predictor.as_dict()
+
+    if (meter := data.get("meter")) is not None:
+        diagnostics["meter"] = meter.as_dict()
+
+    if (load_shedder := data.get("load_shedder")) is not None:
+        diagnostics["load_shedding"] = load_shedder.as_dict()
+
+    if (export := data.get("export")) is not None:
+        diagnostics["export"] = export.as_dict()
+
+    if (watchdog := data.get("watchdog")) is not None:
+        diagnostics["watchdog"] = watchdog.as_dict()
+
+    return diagnostics
@@ -0,0 +1,170 @@
+"""Rate-limited reporting of malformed QUBO payloads."""
+from __future__ import annotations
+
+from collections import defaultdict
+import logging
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import issue_registry as ir
+
+from .const import CONF_DEVICE_UUID, DATA_ERRORS, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+REPORT_INTERVAL = 300  # seconds between summary log lines
+# Consecutive intervals with errors before a device gets a repair issue
+ISSUE_INTERVALS = 3
+# Summary lines list at most this many device, service and error combinations
+SUMMARY_LIMIT = 5
+
+ISSUE_MALFORMED_PAYLOADS = "malformed_payloads"
+
+ErrorKey = tuple[str, str, str]
+
+
+class QuboErrorReporter:
+    """Count malformed payloads and report them in periodic summaries.
+
+    Counting an error only increments a counter per device, service and
+    error class. Once per interval, the counts are written as one summary
+    line. A device and service that produce errors for several intervals
+    in a row get a repair issue, which is removed after a clean interval.
+    Only the message of the last error is kept, not the exception, so its
+    traceback and the frames it references are released right away.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the reporter."""
+        self.hass = hass
+        self._counts: defaultdict[ErrorKey, int] = defaultdict(int)
+        self._last_error: dict[ErrorKey, str] = {}
+        self._totals: defaultdict[ErrorKey, int] = defaultdict(int)
+        # (device_uuid, service) -> consecutive intervals with errors
+        self._strikes: dict[tuple[str, str], int] = {}
+        self._issues: set[tuple[str, str]] = set()
+        self._report_handle: Any = None
+        # Errors counted since startup
+        self.total = 0
+
+    @callback
+    def async_count(self, device_uuid: str, service: str, err: Exception) -> None:
+        """Count a payload that could not be processed."""
+        key = (device_uuid, service, type(err).__name__)
+        self.total += 1
+        self._counts[key] += 1
+        self._last_error[key] = str(err)
+        if self._report_handle is None:
+            self._report_handle = self.hass.loop.call_later(
+                REPORT_INTERVAL, self._async_report
+            )
+
+    @callback
+    def async_count_topic(self, topic: str, err: Exception) -> None:
+        """Count a message of a /monitor/unit/device/service topic that failed."""
+        parts = topic.split("/")
+        self.async_count(parts[3] if len(parts) > 4 else topic, parts[-1], err)
+
+    @callback
+    def _async_report(self) -> None:
+        """Log a summary of the interval and update repair issues."""
+        self._report_handle = None
+        counts, self._counts = self._counts, defaultdict(int)
+        last_errors, self._last_error = self._last_error, {}
+
+        if counts:
+            worst = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+            parts = [
+                f"{key[0]} {key[1]} {key[2]} x{count} ({last_errors[key]})"
+                for key, count in worst[:SUMMARY_LIMIT]
+            ]
+            if len(worst) > SUMMARY_LIMIT:
+                parts.append(f"and {len(worst) - SUMMARY_LIMIT} more")
+            _LOGGER.warning(
+                "%d malformed QUBO payloads in the last %d s: %s",
+                sum(counts.values()), REPORT_INTERVAL, "; ".join(parts)
+            )
+            for key, count in counts.items():
+                self._totals[key] += count
+
+        offenders = {(device_uuid, service) for device_uuid, service, _ in counts}
+        for source in list(self._strikes):
+            if source not in offenders:
+                del self._strikes[source]
+                if source in self._issues:
+                    self._issues.discard(source)
+                    ir.async_delete_issue(self.hass, DOMAIN, self._issue_id(source))
+        for source in offenders:
+            self._strikes[source] = self._strikes.get(source, 0) + 1
+            if self._strikes[source] >= ISSUE_INTERVALS and source not in self._issues:
+                self._async_create_issue(source, counts, last_errors)
+
+        # Keep reporting while there is anything to clear
+        if self._strikes:
+            self._report_handle = self.hass.loop.call_later(
+                REPORT_INTERVAL, self._async_report
+            )
+
+    @callback
+    def _async_create_issue(
+        self,
+        source: tuple[str, str],
+        counts: dict[ErrorKey, int],
+        last_errors: dict[ErrorKey, str],
+    ) -> None:
+        """Raise a repair issue for a device that keeps sending bad payloads."""
+        device_uuid, service = source
+        key = max(
+            (key for key in counts if key[:2] == source), key=lambda key: counts[key]
+        )
+        name = next(
+            (
+                entry.title
+                for entry in self.hass.config_entries.async_entries(DOMAIN)
+                if entry.data.get(CONF_DEVICE_UUID) == device_uuid
+            ),
+            device_uuid,
+        )
+        self._issues.add(source)
+        ir.async_create_issue(
+            self.hass,
+            DOMAIN,
+            self._issue_id(source),
+            is_fixable=False,
+            severity=ir.IssueSeverity.WARNING,
+            translation_key=ISSUE_MALFORMED_PAYLOADS,
+            translation_placeholders={
+                "device": name,
+                "service": service,
+                "error": f"{key[2]}: {last_errors[key]}",
+                "minutes": str(ISSUE_INTERVALS * REPORT_INTERVAL // 60),
+            },
+        )
+
+    @staticmethod
+    def _issue_id(source: tuple[str, str]) -> str:
+        """Return the repair issue id for a device and service."""
+        return f"{ISSUE_MALFORMED_PAYLOADS}_{source[0]}_{source[1]}"
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return error counts for diagnostics."""
+        totals = defaultdict(int, self._totals)
+        for key, count in self._counts.items():
+            totals[key] += count
+        return {
+            "total": sum(totals.values()),
+            "by_source": [
+                {"device": device_uuid, "service": service, "error": error, "count": count}
+                for (device_uuid, service, error), count in sorted(totals.items())
+            ],
+            "repair_issues": [f"{device_uuid} {service}" for device_uuid, service in self._issues],
+        }
+
+
+@callback
+def async_get_error_reporter(hass: HomeAssistant) -> QuboErrorReporter:
+    """Return the shared error reporter, creating it on first use."""
+    if (reporter := hass.data.get(DATA_ERRORS)) is None:
+        reporter = hass.data[DATA_ERRORS] = QuboErrorReporter(hass)
+    return reporter
@@ -0,0 +1,215 @@
+"""Export of raw plugMetering samples to rotating line protocol files."""
+from __future__ import annotations
+
+from collections import deque
+from datetime import UTC, datetime
+import gzip
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+from typing import IO, Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from .codec import decode_state
+
+_LOGGER = logging.getLogger(__name__)
+
+# Services whose messages are exported
+EXPORT_SERVICES = frozenset({"plugMetering"})
+
+EXPORT_DIRECTORY = "qubo_local_export"
+FILE_PREFIX = "qubo_metering_"
+# Samples waiting for the writer, the oldest are dropped beyond this
+QUEUE_SIZE = 100_000
+# How often the writer drains the queue
+FLUSH_INTERVAL = 1.0  # seconds
+WRITE_BUFFER = 1024 * 1024  # bytes
+# Compressed files kept, the oldest are deleted
+KEEP_FILES = 168
+
+MEASUREMENT = "qubo_metering"
+FIELDS = ("power", "voltage", "current", "consumption")
+
+
+def format_sample(
+    timestamp: float, device_uuid: str, service: str, payload: str | bytes
+) -> str:
+    """Return a metering sample as an InfluxDB line protocol line."""
+    state = decode_state(payload, service)
+    values = []
+    for field in FIELDS:
+        if (value := state.get(field)) is None:
+            continue
+        number = float(value)
+        if field == "current":
+            # Devices report mA
+            number /= 1000.0
+        values.append(f"{field}={number!r}")
+    if not values:
+        raise ValueError("no metering values")
+    return f"{MEASUREMENT},device={device_uuid} {','.join(values)} {int(timestamp * 1e9)}\n"
+
+
+class QuboExportSink:
+    """Append every raw plugMetering sample to local files.
+
+    The router hands each raw metering payload to the sink before it is
+    merged or decoded, so samples merged away under overload are still
+    exported. Adding a sample only appends to a bounded deque. When the
+    writer falls behind, the oldest samples are dropped instead of blocking
+    the event loop.
+
+    A single writer thread drains the deque once a second, decodes the
+    payloads and writes them as InfluxDB line protocol through a large
+    buffer. A file is closed and compressed with gzip once it reaches the
+    size limit or has been open for the rotation interval.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, max_bytes: int, rotate_interval: float
+    ) -> None:
+        """Initialize the sink."""
+        self.hass = hass
+        self._directory = Path(hass.config.path(EXPORT_DIRECTORY))
+        self._max_bytes = max_bytes
+        self._rotate_interval = rotate_interval
+        self._queue: deque[tuple[float, str, str, str | bytes]] = deque(maxlen=QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # Written by the writer thread, read for diagnostics
+        self._file: IO[str] | None = None
+        self._file_path: Path | None = None
+        self._file_opened = 0.0
+        self._stats: dict[str, Any] = {
+            "queued": 0,
+            "dropped": 0,
+            "written": 0,
+            "invalid": 0,
+            "files": 0,
+            "bytes": 0,
+            "file_bytes": 0,
+            "last_error": None,
+        }
+
+    @callback
+    def async_start(self) -> None:
+        """Start the writer thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="qubo_local_export", daemon=True
+        )
+        self._thread.start()
+
+    async def async_stop(self) -> None:
+        """Write the remaining samples and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        await self.hass.async_add_executor_job(self._thread.join)
+        self._thread = None
+
+    @callback
+    def async_add(self, device_uuid: str, service: str, payload: str | bytes) -> None:
+        """Queue a raw sample, dropping the oldest when the queue is full."""
+        if len(self._queue) == QUEUE_SIZE:
+            self._stats["dropped"] += 1
+        self._queue.append((time.time(), device_uuid, service, payload))
+        self._stats["queued"] += 1
+
+    def _run(self) -> None:
+        """Drain the queue until stopped."""
+        try:
+            self._directory.mkdir(exist_ok=True)
+        except OSError as err:
+            self._stats["last_error"] = str(err)
+            _LOGGER.error("Cannot create the QUBO export directory: %s", err)
+            return
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._write_batch()
+        self._write_batch()
+        self._close_file()
+
+    def _write_batch(self) -> None:
+        """Write everything queued since the last batch."""
+        queue = self._queue
+        lines = []
+        for _ in range(len(queue)):
+            timestamp, device_uuid, service, payload = queue.popleft()
+            try:
+                lines.append(format_sample(timestamp, device_uuid, service, payload))
+            except (ValueError, AttributeError, TypeError):
+                self._stats["invalid"] += 1
+        now = time.monotonic()
+        if self._file is not None and (
+            self._stats["file_bytes"] >= self._max_bytes
+            or now - self._file_opened >= self._rotate_interval
+        ):
+            self._close_file()
+        if not lines:
+            return
+        data = "".join(lines)
+        try:
+            if self._file is None:
+                self._open_file(now)
+            self._file.write(data)
+            self._file.flush()
+        except OSError as err:
+            self._stats["last_error"] = str(err)
+            _LOGGER.warning("Writing QUBO metering export failed: %s", err)
+            self._close_file()
+            return
+        self._stats["written"] += len(lines)
+        self._stats["bytes"] += len(data)
+        self._stats["file_bytes"] += len(data)
+
+    def _open_file(self, now: float) -> None:
+        """Start a new export file."""
+        name = f"{FILE_PREFIX}{datetime.now(UTC).strftime('%Y%m%dT%H%M%S%f')}.lp"
+        self._file_path = self._directory / name
+        self._file = open(  # noqa: SIM115 - kept open across batches
+            self._file_path, "a", encoding="utf-8", buffering=WRITE_BUFFER
+        )
+        self._file_opened = now
+        self._stats["file_bytes"] = 0
+        self._stats["files"] += 1
+
+    def _close_file(self) -> None:
+        """Close the current file and compress it."""
+        if self._file is None:
+            return
+        path = self._file_path
+        try:
+            self._file.close()
+        except OSError as err:
+            self._stats["last_error"] = str(err)
+        self._file = None
+        self._file_path = None
+        try:
+            with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb") as target:
+                shutil.copyfileobj(source, target, WRITE_BUFFER)
+            os.remove(path)
+        except OSError as err:
+            self._stats["last_error"] = str(err)
+            _LOGGER.warning("Compressing QUBO metering export %s failed: %s", path, err)
+            return
+        for old in sorted(self._directory.glob(f"{FILE_PREFIX}*.lp.gz"))[:-KEEP_FILES]:
+            try:
+                old.unlink()
+            except OSError as err:
+                self._stats["last_error"] = str(err)
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return export state for diagnostics."""
+        return {
+            "directory": str(self._directory),
+            "max_bytes": self._max_bytes,
+            "rotate_interval": self._rotate_interval,
+            "pending": len(self._queue),
+            "file": self._file_path.name if self._file_path else None,
+            **self._stats,
+        }
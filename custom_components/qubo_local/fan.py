@@ -1,11 +1,11 @@
 """Fan platform for QUBO Air Purifier."""
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 from typing import Any
 
-from homeassistant.components import mqtt
 from homeassistant.components.fan import FanEntity, FanEntityFeature
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant, callback
@@ -16,14 +16,12 @@ from homeassistant.util.percentage import (
     percentage_to_ordered_list_item,
 )
 
-from homeassistant.helpers.event import async_track_time_interval
-from datetime import timedelta
-
+from .codec import build_switch_command
 from .const import (
     CONF_DEVICE_TYPE,
     CONF_DEVICE_UUID,
     CONF_ENTITY_UUID,
-    CONF_HANDLE_NAME,
+    CONF_PURIFIER_CARD_ALIASES,
     CONF_UNIT_UUID,
     DEVICE_TYPE_AIR_PURIFIER,
     DOMAIN,
@@ -35,14 +33,14 @@ from .const import (
     PURIFIER_SPEED_MEDIUM,
     TOPIC_CONTROL_FAN_MODE,
     TOPIC_CONTROL_FAN_SPEED,
-    TOPIC_CONTROL_FILTER_STATUS,
     TOPIC_CONTROL_SWITCH,
     TOPIC_MONITOR_AQI,
     TOPIC_MONITOR_FAN_MODE,
     TOPIC_MONITOR_FAN_SPEED,
-    TOPIC_MONITOR_FILTER,
     TOPIC_MONITOR_SWITCH,
 )
+from .router import async_get_router
+from .scheduler import command_priority
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -54,6 +52,26 @@ PRESET_MODE_AUTO = "Auto"
 PRESET_MODE_MANUAL = "Manual"
 PRESET_MODES = [PRESET_MODE_AUTO, PRESET_MODE_MANUAL]
 
+# Extra attributes that never change or duplicate the PM2.5 and Filter Life
+# sensors. They stay on the state for purifier-card but are not recorded, so a
+# PM2.5 update no longer creates a new state attributes row.
+UNRECORDED_ATTRIBUTES = frozenset(
+    {
+        "speed_list",
+        "pm25",
+        "aqi",
+        "filter_life_remaining",
+        "filter_hours_remaining",
+    }
+)
+
+
+def _preset_to_mode(preset_mode: str) -> str:
+    """Return the device mode for a preset mode."""
+    if preset_mode == PRESET_MODE_AUTO:
+        return PURIFIER_MODE_AUTO
+    return PURIFIER_MODE_MANUAL
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -86,6 +104,7 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
     _attr_speed_count = len(ORDERED_NAMED_FAN_SPEEDS)
     _attr_preset_modes = PRESET_MODES
     _attr_should_poll = False
+    _unrecorded_attributes = UNRECORDED_ATTRIBUTES
 
     def __init__(
         self,
@@ -95,15 +114,11 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
         config: dict[str, Any],
     ) -> None:
         """Initialize the QUBO Air Purifier."""
-        self.hass = hass
-        self._config_entry = config_entry
         self._attr_device_info = device_info
-        self._config = config
 
         self._device_uuid = config[CONF_DEVICE_UUID]
         self._entity_uuid = config[CONF_ENTITY_UUID]
         self._unit_uuid = config[CONF_UNIT_UUID]
-        self._handle_name = config.get(CONF_HANDLE_NAME, self._device_uuid)
 
         self._attr_unique_id = f"{self._device_uuid}_{ENTITY_FAN}"
         self._attr_is_on = False
@@ -111,9 +126,22 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
         self._attr_preset_mode = PRESET_MODE_AUTO
         self._current_speed = PURIFIER_SPEED_LOW
 
+        # Last state reported by the device, restored when a command is not confirmed
+        self._reported_is_on = False
+        self._reported_speed = PURIFIER_SPEED_LOW
+        self._reported_preset_mode = PRESET_MODE_AUTO
+
         # Extra attributes for purifier-card compatibility
         self._pm25: int | None = None
         self._filter_life_remaining: float | None = None
+        self._card_aliases = config_entry.options.get(CONF_PURIFIER_CARD_ALIASES, True)
+        self._commands = hass.data[DOMAIN][config_entry.entry_id]["commands"]
+        self._aqi_refresh = hass.data[DOMAIN][config_entry.entry_id]["aqi_refresh"]
+        self._filter = hass.data[DOMAIN][config_entry.entry_id]["filter"]
+
+        # Cached extra attributes, rebuilt only when their inputs change
+        self._extra_attrs_key: tuple | None = None
+        self._extra_attrs: dict[str, Any] = {}
 
         # MQTT topics - Control
         self._control_switch_topic = TOPIC_CONTROL_SWITCH.format(
@@ -125,9 +153,6 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
         self._control_mode_topic = TOPIC_CONTROL_FAN_MODE.format(
             unit_uuid=self._unit_uuid, device_uuid=self._device_uuid
         )
-        self._control_filter_topic = TOPIC_CONTROL_FILTER_STATUS.format(
-            unit_uuid=self._unit_uuid, device_uuid=self._device_uuid
-        )
 
         # MQTT topics - Monitor
         self._monitor_switch_topic = TOPIC_MONITOR_SWITCH.format(
@@ -142,9 +167,6 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
         self._monitor_aqi_topic = TOPIC_MONITOR_AQI.format(
             unit_uuid=self._unit_uuid, device_uuid=self._device_uuid
         )
-        self._monitor_filter_topic = TOPIC_MONITOR_FILTER.format(
-            unit_uuid=self._unit_uuid, device_uuid=self._device_uuid
-        )
 
     @property
     def is_on(self) -> bool | None:
@@ -166,16 +188,25 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
     @property
     def extra_state_attributes(self) -> dict[str, Any]:
         """Return extra state attributes for purifier-card compatibility."""
+        key = (self._current_speed, self._pm25, self._filter_life_remaining)
+        if key == self._extra_attrs_key:
+            return self._extra_attrs
+
         attrs = {
             "speed": self._current_speed,
             "speed_list": ORDERED_NAMED_FAN_SPEEDS,
         }
         if self._pm25 is not None:
             attrs["pm25"] = self._pm25
-            attrs["aqi"] = self._pm25  # Alias for purifier-card
+            if self._card_aliases:
+                attrs["aqi"] = self._pm25  # Alias for purifier-card
         if self._filter_life_remaining is not None:
             attrs["filter_life_remaining"] = self._filter_life_remaining
-            attrs["filter_hours_remaining"] = self._filter_life_remaining
+            if self._card_aliases:
+                attrs["filter_hours_remaining"] = self._filter_life_remaining
+
+        self._extra_attrs_key = key
+        self._extra_attrs = attrs
         return attrs
 
     async def async_added_to_hass(self) -> None:
@@ -185,136 +216,85 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
             self._attr_is_on = last_state.state == "on"
             if last_state.attributes.get("percentage") is not None:
                 self._attr_percentage = last_state.attributes["percentage"]
+            if self._attr_percentage:
+                # The speed is only kept as its percentage
+                self._current_speed = percentage_to_ordered_list_item(
+                    ORDERED_NAMED_FAN_SPEEDS, self._attr_percentage
+                )
+                self._reported_speed = self._current_speed
             if last_state.attributes.get("preset_mode") is not None:
                 self._attr_preset_mode = last_state.attributes["preset_mode"]
+            self._reported_is_on = self._attr_is_on
+            self._reported_preset_mode = self._attr_preset_mode
+            self._aqi_refresh.async_update_power(self._attr_is_on)
+            self._filter.async_update_fan(self._attr_is_on, self._reported_speed)
             _LOGGER.debug(
                 "Restored purifier state: on=%s, percentage=%s, mode=%s",
                 self._attr_is_on, self._attr_percentage, self._attr_preset_mode
             )
 
         @callback
-        def power_message_received(msg):
+        def power_message_received(state_changed: dict[str, Any]) -> None:
             """Handle power state messages."""
-            try:
-                payload = json.loads(msg.payload)
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                switch_service = services.get("lcSwitchControl", {})
-
-                # Try events.stateChanged path first
-                events = switch_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-                power_state = state_changed.get("power")
-
-                # Also try attributes path (device might respond differently)
-                if power_state is None:
-                    attributes = switch_service.get("attributes", {})
-                    power_state = attributes.get("power")
-
-                if power_state is not None:
-                    self._attr_is_on = power_state.lower() == "on"
-                    if self._attr_is_on:
-                        # Always set percentage based on current speed when on
-                        self._attr_percentage = ordered_list_item_to_percentage(
-                            ORDERED_NAMED_FAN_SPEEDS, self._current_speed
-                        )
-                    else:
-                        # 0% when off
-                        self._attr_percentage = 0
-                    self.async_write_ha_state()
-                    _LOGGER.debug("Power state updated: %s", power_state)
-
-            except (json.JSONDecodeError, KeyError) as err:
-                _LOGGER.error("Error processing power state: %s", err)
+            # The codec takes the power from the command attributes when the
+            # device answers with them instead of, or next to, stateChanged
+            pending = self._commands.async_echo(self._monitor_switch_topic, state_changed)
+            power_state = state_changed.get("power")
+
+            if power_state is not None:
+                self._reported_is_on = power_state.lower() == "on"
+                self._aqi_refresh.async_update_power(self._reported_is_on)
+                self._filter.async_update_fan(self._reported_is_on, self._reported_speed)
+                if pending:
+                    # Keep showing the command until it is confirmed or rolled back
+                    return
+                self._async_show_reported_power()
 
         @callback
-        def speed_message_received(msg):
+        def speed_message_received(state_changed: dict[str, Any]) -> None:
             """Handle fan speed messages."""
-            try:
-                payload = json.loads(msg.payload)
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                speed_service = services.get("fanSpeedControl", {})
-                events = speed_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-                speed = state_changed.get("speed")
-
-                if speed is not None:
-                    self._current_speed = speed
-                    # Always update percentage based on speed when on
-                    if self._attr_is_on:
-                        self._attr_percentage = ordered_list_item_to_percentage(
-                            ORDERED_NAMED_FAN_SPEEDS, speed
-                        )
-                    self.async_write_ha_state()
-                    _LOGGER.debug("Purifier speed: %s, percentage: %s", speed, self._attr_percentage)
-
-            except (json.JSONDecodeError, KeyError) as err:
-                _LOGGER.error("Error processing speed: %s", err)
+            pending = self._commands.async_echo(self._monitor_speed_topic, state_changed)
+            speed = state_changed.get("speed")
+
+            if speed is not None:
+                self._reported_speed = speed
+                self._filter.async_update_fan(self._reported_is_on, speed)
+                if pending:
+                    return
+                self._async_show_reported_speed()
 
         @callback
-        def mode_message_received(msg):
+        def mode_message_received(state_changed: dict[str, Any]) -> None:
             """Handle fan mode messages."""
-            try:
-                payload = json.loads(msg.payload)
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                mode_service = services.get("fanControlMode", {})
-                events = mode_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-                mode = state_changed.get("state")
-
-                if mode is not None:
-                    if mode == PURIFIER_MODE_AUTO:
-                        self._attr_preset_mode = PRESET_MODE_AUTO
-                    else:
-                        self._attr_preset_mode = PRESET_MODE_MANUAL
-                    self.async_write_ha_state()
-                    _LOGGER.debug("Purifier mode: %s", mode)
-
-            except (json.JSONDecodeError, KeyError) as err:
-                _LOGGER.error("Error processing mode: %s", err)
+            pending = self._commands.async_echo(self._monitor_mode_topic, state_changed)
+            mode = state_changed.get("state")
+
+            if mode is not None:
+                if mode == PURIFIER_MODE_AUTO:
+                    self._reported_preset_mode = PRESET_MODE_AUTO
+                else:
+                    self._reported_preset_mode = PRESET_MODE_MANUAL
+                if pending:
+                    return
+                self._async_show_reported_mode()
 
         @callback
-        def aqi_message_received(msg):
+        def aqi_message_received(state_changed: dict[str, Any]) -> None:
             """Handle AQI/PM2.5 messages."""
-            try:
-                payload = json.loads(msg.payload)
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                aqi_service = services.get("aqiStatus", {})
-                events = aqi_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-                pm25 = state_changed.get("PM25")
-
-                if pm25 is not None:
-                    self._pm25 = int(pm25)
-                    self.async_write_ha_state()
-                    _LOGGER.debug("PM2.5 updated: %s", self._pm25)
-
-            except (json.JSONDecodeError, KeyError, ValueError) as err:
-                _LOGGER.error("Error processing AQI: %s", err)
+            pm25 = state_changed.get("PM25")
+
+            if pm25 is not None:
+                self._pm25 = int(pm25)
+                self._aqi_refresh.async_update_pm25(self._pm25)
+                self.async_write_ha_state()
+                _LOGGER.debug("PM2.5 updated: %s", self._pm25)
 
         @callback
-        def filter_message_received(msg):
-            """Handle filter life messages."""
-            try:
-                payload = json.loads(msg.payload)
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                filter_service = services.get("filterReset", {})
-                events = filter_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-                time_remaining = state_changed.get("timeRemaining")
-
-                if time_remaining is not None:
-                    # Value is already in hours
-                    self._filter_life_remaining = int(time_remaining)
-                    self.async_write_ha_state()
-                    _LOGGER.debug("Filter life updated: %s hours", self._filter_life_remaining)
-
-            except (json.JSONDecodeError, KeyError, ValueError) as err:
-                _LOGGER.error("Error processing filter: %s", err)
+        def filter_life_updated() -> None:
+            """Handle a new reported or predicted filter life."""
+            self._filter_life_remaining = self._filter.hours_remaining
+            self.async_write_ha_state()
+            _LOGGER.debug("Filter life updated: %s hours", self._filter_life_remaining)
 
         # Subscribe to monitor topics
         _LOGGER.debug("Subscribing to MQTT topics for air purifier")
@@ -322,36 +302,24 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
         _LOGGER.debug("  Speed topic: %s", self._monitor_speed_topic)
         _LOGGER.debug("  Mode topic: %s", self._monitor_mode_topic)
         _LOGGER.debug("  AQI topic: %s", self._monitor_aqi_topic)
-        _LOGGER.debug("  Filter topic: %s", self._monitor_filter_topic)
 
-        unsub_power = await mqtt.async_subscribe(self.hass, self._monitor_switch_topic, power_message_received, 1)
-        unsub_speed = await mqtt.async_subscribe(self.hass, self._monitor_speed_topic, speed_message_received, 1)
-        unsub_mode = await mqtt.async_subscribe(self.hass, self._monitor_mode_topic, mode_message_received, 1)
-        unsub_aqi = await mqtt.async_subscribe(self.hass, self._monitor_aqi_topic, aqi_message_received, 1)
-        unsub_filter = await mqtt.async_subscribe(self.hass, self._monitor_filter_topic, filter_message_received, 1)
+        router = async_get_router(self.hass)
+        unsubscribes = await asyncio.gather(
+            router.async_subscribe(self._monitor_switch_topic, power_message_received, 1),
+            router.async_subscribe(self._monitor_speed_topic, speed_message_received, 1),
+            router.async_subscribe(self._monitor_mode_topic, mode_message_received, 1),
+            router.async_subscribe(self._monitor_aqi_topic, aqi_message_received, 1),
+        )
 
         # Store unsubscribe callbacks for cleanup
-        self.async_on_remove(unsub_power)
-        self.async_on_remove(unsub_speed)
-        self.async_on_remove(unsub_mode)
-        self.async_on_remove(unsub_aqi)
-        self.async_on_remove(unsub_filter)
+        for unsubscribe in unsubscribes:
+            self.async_on_remove(unsubscribe)
 
         _LOGGER.debug("MQTT subscriptions complete")
 
-        # Request initial filter status
-        await self._request_filter_status()
-
-        # Set up hourly filter status refresh
-        async def refresh_filter_status(_now):
-            """Refresh filter status periodically."""
-            await self._request_filter_status()
-
-        unsub_timer = async_track_time_interval(
-            self.hass, refresh_filter_status, timedelta(hours=1)
-        )
-        self.async_on_remove(unsub_timer)
-        _LOGGER.debug("Filter status refresh scheduled every hour")
+        # Filter life is polled and extrapolated by the shared predictor
+        self._filter_life_remaining = self._filter.hours_remaining
+        self.async_on_remove(self._filter.async_add_listener(filter_life_updated))
 
     async def async_turn_on(
         self,
@@ -360,37 +328,41 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
         **kwargs: Any,
     ) -> None:
         """Turn on the purifier with optional speed/mode."""
-        # Turn on if not already on
-        if not self._attr_is_on:
-            await self._publish_power_command("on")
-            # Optimistic update
+        # Optimistic update first, each command is confirmed by its echo or
+        # rolled back to the last reported state
+        power_on = not self._attr_is_on
+        if power_on:
             self._attr_is_on = True
             if self._attr_percentage == 0:
-                self._attr_percentage = ordered_list_item_to_percentage(
-                    ORDERED_NAMED_FAN_SPEEDS, self._current_speed
-                )
+                self._attr_percentage = self._speed_percentage(self._current_speed)
 
         # Set speed if provided (like Xiaomi-Miot pattern)
+        speed = None
         if percentage is not None and percentage > 0:
             speed = percentage_to_ordered_list_item(ORDERED_NAMED_FAN_SPEEDS, percentage)
-            await self._publish_speed_command(speed)
-            # Optimistic update
             self._attr_percentage = percentage
             self._current_speed = speed
 
         # Set mode if provided
         if preset_mode is not None:
-            await self.async_set_preset_mode(preset_mode)
+            self._attr_preset_mode = preset_mode
 
         self.async_write_ha_state()
 
+        if power_on:
+            await self._publish_power_command("on")
+        if speed is not None:
+            await self._publish_speed_command(speed)
+        if preset_mode is not None:
+            await self._publish_mode_command(_preset_to_mode(preset_mode))
+
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn off the purifier."""
-        await self._publish_power_command("off")
         # Optimistic update (Xiaomi-Miot pattern: 0% when off)
         self._attr_is_on = False
         self._attr_percentage = 0
         self.async_write_ha_state()
+        await self._publish_power_command("off")
 
     async def async_set_percentage(self, percentage: int) -> None:
         """Set the speed percentage."""
@@ -399,48 +371,70 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
             return
 
         # Turn on first if not on (Xiaomi-Miot pattern)
-        if not self._attr_is_on:
-            await self._publish_power_command("on")
-            self._attr_is_on = True
-
-        # Convert percentage to speed level and publish
+        power_on = not self._attr_is_on
         speed = percentage_to_ordered_list_item(ORDERED_NAMED_FAN_SPEEDS, percentage)
-        await self._publish_speed_command(speed)
 
         # Optimistic update
+        self._attr_is_on = True
         self._attr_percentage = percentage
         self._current_speed = speed
         self.async_write_ha_state()
 
+        if power_on:
+            await self._publish_power_command("on")
+        await self._publish_speed_command(speed)
+
     async def async_set_preset_mode(self, preset_mode: str) -> None:
         """Set the preset mode."""
-        if preset_mode == PRESET_MODE_AUTO:
-            await self._publish_mode_command(PURIFIER_MODE_AUTO)
-        else:
-            await self._publish_mode_command(PURIFIER_MODE_MANUAL)
         # Optimistic update
         self._attr_preset_mode = preset_mode
         self.async_write_ha_state()
+        await self._publish_mode_command(_preset_to_mode(preset_mode))
+
+    @staticmethod
+    def _speed_percentage(speed: str) -> int:
+        """Return the percentage of a speed level."""
+        return ordered_list_item_to_percentage(ORDERED_NAMED_FAN_SPEEDS, speed)
+
+    @callback
+    def _async_show_reported_power(self) -> None:
+        """Show the reported power state."""
+        self._attr_is_on = self._reported_is_on
+        # Percentage follows the current speed when on, 0% when off
+        self._attr_percentage = (
+            self._speed_percentage(self._current_speed) if self._attr_is_on else 0
+        )
+        self.async_write_ha_state()
+        _LOGGER.debug("Power state updated: %s", self._attr_is_on)
+
+    @callback
+    def _async_show_reported_speed(self) -> None:
+        """Show the reported speed."""
+        self._current_speed = self._reported_speed
+        if self._attr_is_on:
+            self._attr_percentage = self._speed_percentage(self._current_speed)
+        self.async_write_ha_state()
+        _LOGGER.debug(
+            "Purifier speed: %s, percentage: %s", self._current_speed, self._attr_percentage
+        )
+
+    @callback
+    def _async_show_reported_mode(self) -> None:
+        """Show the reported preset mode."""
+        self._attr_preset_mode = self._reported_preset_mode
+        self.async_write_ha_state()
+        _LOGGER.debug("Purifier mode: %s", self._attr_preset_mode)
 
     async def _publish_power_command(self, power_state: str) -> None:
         """Publish MQTT command to control power."""
-        payload = json.dumps(
-            {
-                "command": {
-                    "devices": {
-                        "deviceUUID": self._device_uuid,
-                        "entityUUID": self._entity_uuid,
-                        "services": {
-                            "lcSwitchControl": {
-                                "attributes": {"power": power_state},
-                                "instanceId": 0,
-                            }
-                        },
-                    }
-                }
-            }
+        payload = build_switch_command(self._device_uuid, self._entity_uuid, power_state)
+        await self._commands.async_send(
+            self._control_switch_topic,
+            payload,
+            {"power": power_state},
+            command_priority(self._context),
+            self._async_show_reported_power,
         )
-        await mqtt.async_publish(self.hass, self._control_switch_topic, payload, qos=1)
         _LOGGER.debug("Published power command: %s", power_state)
 
     async def _publish_speed_command(self, speed: str) -> None:
@@ -461,7 +455,13 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
                 }
             }
         )
-        await mqtt.async_publish(self.hass, self._control_speed_topic, payload, qos=1)
+        await self._commands.async_send(
+            self._control_speed_topic,
+            payload,
+            {"speed": speed},
+            command_priority(self._context),
+            self._async_show_reported_speed,
+        )
         _LOGGER.debug("Published speed command: %s", speed)
 
     async def _publish_mode_command(self, mode: str) -> None:
@@ -482,28 +482,11 @@ class QuboAirPurifier(FanEntity, RestoreEntity):
                 }
             }
         )
-        await mqtt.async_publish(self.hass, self._control_mode_topic, payload, qos=1)
+        await self._commands.async_send(
+            self._control_mode_topic,
+            payload,
+            {"state": mode},
+            command_priority(self._context),
+            self._async_show_reported_mode,
+        )
         _LOGGER.debug("Published mode command: %s", mode)
-
-    async def _request_filter_status(self) -> None:
-        """Request filter status from the device."""
-        payload = json.dumps({
-            "command": {
-                "devices": {
-                    "deviceUUID": self._device_uuid,
-                    "handleName": self._handle_name,
-                    "services": {
-                        "filterReset": {
-                            "commands": {
-                                "getCurrentStatus": {
-                                    "instanceId": 0,
-                                    "parameters": {}
-                                }
-                            }
-                        }
-                    }
-                }
-            }
-        })
-        await mqtt.async_publish(self.hass, self._control_filter_topic, payload, qos=1)
-        _LOGGER.debug("Requested filter status")
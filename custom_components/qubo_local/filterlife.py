@@ -0,0 +1,315 @@
+"""Predicted filter life for QUBO air purifiers."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from datetime import timedelta
+import json
+import logging
+import math
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DOMAIN,
+    PURIFIER_SPEED_HIGH,
+    PURIFIER_SPEED_LOW,
+    PURIFIER_SPEED_MEDIUM,
+    TOPIC_CONTROL_FILTER_STATUS,
+    TOPIC_MONITOR_FILTER,
+)
+from .resync import async_get_resync
+from .router import async_get_router
+from .scheduler import PRIORITY_REFRESH
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+# The learned model is written at most this often
+SAVE_DELAY = 300  # seconds
+TICK_INTERVAL = timedelta(minutes=5)
+# Poll once the predicted wear since the last reading reaches this
+POLL_WEAR = 3.0  # filter hours
+# Poll sooner while the last reading was far off the prediction
+DRIFT_POLL_WEAR = 0.5  # filter hours
+DRIFT_TOLERANCE = 1.0  # filter hours
+# Poll at least this often, and never more often than the minimum
+MAX_POLL_AGE = 12 * 3600  # seconds
+MIN_POLL_INTERVAL = 600  # seconds
+# Run time needed between two readings to learn from them, readings are
+# whole hours so shorter spans are dominated by rounding
+LEARN_RUNTIME = 2 * 3600  # seconds
+LEARN_STEP = 0.3
+RATE_LIMITS = (0.1, 5.0)
+
+SPEEDS = (PURIFIER_SPEED_LOW, PURIFIER_SPEED_MEDIUM, PURIFIER_SPEED_HIGH)
+
+
+class QuboFilterPredictor:
+    """Extrapolate filter life between device readings.
+
+    Filter life only goes down while the fan runs. The predictor keeps the
+    run time per fan speed since the last reading and learns, per speed, how
+    many filter hours one hour of run time uses. Between readings the filter
+    life is extrapolated from the last reading, and the device is only asked
+    once the predicted wear since that reading passes a threshold, after a
+    reading that was far off the prediction, or when the last poll is old.
+    The learned rates, the last reading and the run time since it are saved
+    with a delay, so a restart carries on with the same prediction.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        device_uuid: str,
+        unit_uuid: str,
+        handle_name: str,
+        device_name: str,
+    ) -> None:
+        """Initialize the predictor."""
+        self.hass = hass
+        self._device_uuid = device_uuid
+        self._handle_name = handle_name
+        self._device_name = device_name
+        self._control_topic = TOPIC_CONTROL_FILTER_STATUS.format(
+            unit_uuid=unit_uuid, device_uuid=device_uuid
+        )
+        self._monitor_topic = TOPIC_MONITOR_FILTER.format(
+            unit_uuid=unit_uuid, device_uuid=device_uuid
+        )
+        self._listeners: list[Callable[[], None]] = []
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.filter.{device_uuid}"
+        )
+
+        # Filter hours used per hour of run time, per fan speed
+        self._rates = dict.fromkeys(SPEEDS, 1.0)
+        self._reading: float | None = None
+        # Run seconds per speed since the last reading, and since the
+        # reading the model learns from next
+        self._since_reading = dict.fromkeys(SPEEDS, 0.0)
+        self._since_reference = dict.fromkeys(SPEEDS, 0.0)
+        self._reference: float | None = None
+        self._speed: str | None = None
+        self._segment_start = 0.0
+
+        self._hours_remaining: int | None = None
+        self._last_poll = 0.0
+        self._drifting = False
+        self._last_error: float | None = None
+        self._started = 0.0
+        self._stats = {"polls": 0, "readings": 0, "learned": 0}
+
+    @property
+    def hours_remaining(self) -> int | None:
+        """Return the predicted filter life in whole hours."""
+        return self._hours_remaining
+
+    async def async_start(self) -> CALLBACK_TYPE:
+        """Start predicting and polling, return a callback that stops it."""
+        if (stored := await self._store.async_load()) is not None:
+            self._async_restore(stored)
+        self._started = time.monotonic()
+        unsubscribes = [
+            await async_get_router(self.hass).async_subscribe(
+                self._monitor_topic, self._async_reading_received, 1
+            ),
+            async_track_time_interval(self.hass, self._async_tick, TICK_INTERVAL),
+            async_get_resync(self.hass).async_register(self._device_uuid, self.async_poll),
+        ]
+        # The first poll waits behind the other refreshes of a starting fleet,
+        # so it is sent without holding up the setup
+        poll = self.hass.async_create_background_task(
+            self.async_poll(), "qubo_local filter poll"
+        )
+        unsubscribes.append(poll.cancel)
+
+        @callback
+        def async_stop() -> None:
+            """Stop predicting and polling, and save the model."""
+            for unsubscribe in unsubscribes:
+                unsubscribe()
+            self._async_close_segment(time.monotonic())
+            self._store.async_delay_save(self._data_to_save, 0)
+
+        return async_stop
+
+    @callback
+    def _async_restore(self, stored: dict[str, Any]) -> None:
+        """Carry on with the saved rates, reading and run times."""
+        for speed, rate in stored.get("rates", {}).items():
+            if speed in self._rates:
+                self._rates[speed] = rate
+        for name, runtime in (
+            ("since_reading", self._since_reading),
+            ("since_reference", self._since_reference),
+        ):
+            for speed, seconds in stored.get(name, {}).items():
+                if speed in runtime:
+                    runtime[speed] = seconds
+        self._reading = stored.get("reading")
+        self._reference = stored.get("reference")
+        self._async_update_prediction()
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call back whenever the predicted filter life changes."""
+        self._listeners.append(update_callback)
+        return lambda: self._listeners.remove(update_callback)
+
+    @callback
+    def async_update_fan(self, is_on: bool, speed: str) -> None:
+        """Take a fan power or speed change into account."""
+        now = time.monotonic()
+        self._async_close_segment(now)
+        self._speed = speed if is_on and speed in self._rates else None
+
+    @callback
+    def _async_close_segment(self, now: float) -> None:
+        """Add the run time since the last change to the accumulators."""
+        if self._speed is not None:
+            elapsed = now - self._segment_start
+            self._since_reading[self._speed] += elapsed
+            self._since_reference[self._speed] += elapsed
+        self._segment_start = now
+
+    def _wear(self, runtime: dict[str, float]) -> float:
+        """Return the predicted filter hours used in a run time."""
+        return sum(self._rates[speed] * seconds for speed, seconds in runtime.items()) / 3600
+
+    @callback
+    def _async_reading_received(self, state: dict[str, Any]) -> None:
+        """Handle a filter life reading from the device."""
+        if (time_remaining := state.get("timeRemaining")) is None:
+            return
+        reading = float(time_remaining)
+        now = time.monotonic()
+        self._async_close_segment(now)
+        self._stats["readings"] += 1
+
+        if self._reading is not None:
+            self._last_error = (self._reading - self._wear(self._since_reading)) - reading
+            self._drifting = abs(self._last_error) > DRIFT_TOLERANCE
+            if self._drifting:
+                _LOGGER.debug(
+                    "%s filter life is %.0f h, %.1f h off the prediction",
+                    self._device_name, reading, self._last_error
+                )
+
+        if self._reference is None or reading > self._reference:
+            # First reading or a new filter
+            self._reference = reading
+            self._since_reference = dict.fromkeys(SPEEDS, 0.0)
+        elif sum(self._since_reference.values()) >= LEARN_RUNTIME:
+            self._async_learn(self._reference - reading)
+            self._reference = reading
+            self._since_reference = dict.fromkeys(SPEEDS, 0.0)
+
+        self._reading = reading
+        self._since_reading = dict.fromkeys(SPEEDS, 0.0)
+        self._async_update_prediction()
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _async_learn(self, used: float) -> None:
+        """Move the wear rates toward the observed filter hours used."""
+        runtime = {speed: seconds / 3600 for speed, seconds in self._since_reference.items()}
+        norm = sum(hours * hours for hours in runtime.values())
+        error = used - sum(self._rates[speed] * hours for speed, hours in runtime.items())
+        for speed, hours in runtime.items():
+            rate = self._rates[speed] + LEARN_STEP * error * hours / norm
+            self._rates[speed] = min(RATE_LIMITS[1], max(RATE_LIMITS[0], rate))
+        self._stats["learned"] += 1
+
+    @callback
+    def _async_update_prediction(self) -> None:
+        """Notify listeners when the predicted whole hours change."""
+        if self._reading is None:
+            return
+        predicted = max(0.0, self._reading - self._wear(self._since_reading))
+        # Readings are whole hours, the next hour is only used up once
+        # a full hour of wear has passed
+        hours = math.ceil(predicted - 1e-9)
+        if hours != self._hours_remaining:
+            self._hours_remaining = hours
+            for update_callback in list(self._listeners):
+                update_callback()
+
+    @callback
+    def _async_tick(self, _now: Any = None) -> None:
+        """Update the prediction and poll the device when needed."""
+        now = time.monotonic()
+        self._async_close_segment(now)
+        self._async_update_prediction()
+        if self._speed is not None:
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+        if now - self._last_poll < MIN_POLL_INTERVAL:
+            return
+        if self._reading is None:
+            reason = "no reading"
+        elif self._wear(self._since_reading) >= (
+            DRIFT_POLL_WEAR if self._drifting else POLL_WEAR
+        ):
+            reason = "predicted wear"
+        elif now - self._last_poll >= MAX_POLL_AGE:
+            reason = "age"
+        else:
+            return
+        _LOGGER.debug("Polling %s filter life: %s", self._device_name, reason)
+        self.hass.async_create_background_task(self.async_poll(), "qubo_local filter poll")
+
+    async def async_poll(self) -> None:
+        """Request the filter status from the device."""
+        self._last_poll = time.monotonic()
+        self._stats["polls"] += 1
+        payload = json.dumps({
+            "command": {
+                "devices": {
+                    "deviceUUID": self._device_uuid,
+                    "handleName": self._handle_name,
+                    "services": {
+                        "filterReset": {
+                            "commands": {
+                                "getCurrentStatus": {
+                                    "instanceId": 0,
+                                    "parameters": {}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        })
+        await async_get_router(self.hass).async_publish(
+            self._control_topic, payload, priority=PRIORITY_REFRESH
+        )
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return the learned model to save."""
+        return {
+            "rates": self._rates,
+            "reading": self._reading,
+            "reference": self._reference,
+            "since_reading": self._since_reading,
+            "since_reference": self._since_reference,
+        }
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return the prediction state for diagnostics."""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "reading": self._reading,
+            "predicted": self._hours_remaining,
+            "wear_rates": {speed: round(rate, 3) for speed, rate in self._rates.items()},
+            "last_error": round(self._last_error, 2) if self._last_error is not None else None,
+            "drifting": self._drifting,
+            **self._stats,
+            # Polls the previous hourly schedule would have sent
+            "hourly_polls": int(elapsed // 3600) + 1 if self._started else 0,
+        }
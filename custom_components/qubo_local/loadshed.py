@@ -0,0 +1,264 @@
+"""Load-shedding controller driven by live QUBO plug metering."""
+from __future__ import annotations
+
+from collections import deque
+import logging
+import time
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry, ConfigEntryState
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+
+from .aggregate import QuboAggregateTracker
+from .const import (
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_TYPE,
+    CONF_DEVICE_UUID,
+    CONF_SHED_PRIORITY,
+    DEVICE_TYPE_SMART_PLUG,
+    DOMAIN,
+    EVENT_COMMAND_FAILED,
+)
+from .scheduler import PRIORITY_AUTOMATION
+from .switch import async_send_power_command
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds a shed plug's power is assumed gone before metering confirms it
+SHED_SETTLE_TIME = 10
+# Seconds a shed plug stays off before it may be switched back on
+RESTORE_HOLD_TIME = 60
+# Message-to-command latency above this is logged as a warning
+LATENCY_TARGET_MS = 50
+MAX_DECISIONS = 50
+
+
+class QuboLoadShedder:
+    """Switch off low-priority plugs when the fleet power exceeds a budget.
+
+    The controller listens to the fleet aggregate directly, so a decision is
+    taken in the same call as the plugMetering update that caused it. A plug
+    whose off command failed, or that still draws power once the command
+    should have settled, e.g. because it was switched back on by hand, is no
+    longer counted as shed and may be shed again.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        tracker: QuboAggregateTracker,
+        budget: int,
+        hysteresis: int,
+    ) -> None:
+        """Initialize the controller."""
+        self.hass = hass
+        self._tracker = tracker
+        self._group = tracker.fleet
+        self._budget = budget
+        self._hysteresis = hysteresis
+
+        # device_uuid -> (expected watts, monotonic expiry) until metering confirms
+        self._pending: dict[str, tuple[float, float]] = {}
+        # Plugs switched off by the controller, restored last-in first-out
+        self._shed: list[tuple[str, float, float]] = []
+        # Restores are spaced out so each restored load shows up in metering first
+        self._restore_after = 0.0
+        self._decisions: deque[dict[str, Any]] = deque(maxlen=MAX_DECISIONS)
+
+    @callback
+    def async_start(self) -> CALLBACK_TYPE:
+        """Start watching the fleet power, return a callback that stops it."""
+        _LOGGER.debug(
+            "Load shedding active with %d W budget and %d W hysteresis",
+            self._budget, self._hysteresis
+        )
+        unsubscribes = [
+            self._group.async_add_listener(self._async_total_changed),
+            self.hass.bus.async_listen(EVENT_COMMAND_FAILED, self._async_command_failed),
+        ]
+
+        @callback
+        def async_stop() -> None:
+            """Stop watching the fleet power."""
+            for unsubscribe in unsubscribes:
+                unsubscribe()
+
+        return async_stop
+
+    @callback
+    def _async_command_failed(self, event: Event) -> None:
+        """Forget a shed plug whose off command was not confirmed."""
+        if event.data["state"].get("power") == "off":
+            self._async_forget(event.data["device_uuid"])
+
+    @callback
+    def _async_forget(self, device_uuid: str) -> None:
+        """Stop counting a plug as shed, so it can be shed again."""
+        self._pending.pop(device_uuid, None)
+        if any(shed_uuid == device_uuid for shed_uuid, _, _ in self._shed):
+            self._shed = [shed for shed in self._shed if shed[0] != device_uuid]
+            _LOGGER.debug("Load shedding no longer counts %s as shed", device_uuid)
+
+    @callback
+    def _async_total_changed(self) -> None:
+        """Evaluate the budget after a metering update."""
+        now = time.monotonic()
+        started_ns = self._tracker.last_update_ns
+        for device_uuid, _, shed_at in list(self._shed):
+            # Still on after the command should have settled
+            if now - shed_at >= SHED_SETTLE_TIME and self._tracker.async_get_power(device_uuid):
+                self._async_forget(device_uuid)
+        total = self._group.power - self._async_pending_reduction(now)
+
+        if total > self._budget:
+            self._async_shed(total, now, started_ns)
+        elif self._shed and total < self._budget - self._hysteresis:
+            self._async_restore(total, now, started_ns)
+
+    @callback
+    def _async_pending_reduction(self, now: float) -> float:
+        """Return power of shed plugs that metering has not caught up with yet."""
+        reduction = 0.0
+        for device_uuid, (watts, expires) in list(self._pending.items()):
+            power = self._tracker.async_get_power(device_uuid)
+            if not power or now >= expires:
+                del self._pending[device_uuid]
+            else:
+                reduction += min(watts, power)
+        return reduction
+
+    @callback
+    def _async_shed(self, total: float, now: float, started_ns: int) -> None:
+        """Switch off plugs, lowest priority and largest load first."""
+        shed_ids = {device_uuid for device_uuid, _, _ in self._shed}
+        candidates = []
+        for entry in self._async_plug_entries():
+            device_uuid = entry.data[CONF_DEVICE_UUID]
+            priority = entry.options.get(CONF_SHED_PRIORITY, 0)
+            power = self._tracker.async_get_power(device_uuid)
+            if priority <= 0 or not power or device_uuid in shed_ids:
+                continue
+            candidates.append((priority, -power, device_uuid, entry))
+        candidates.sort(key=lambda candidate: candidate[:2])
+
+        excess = total - self._budget
+        for _, negative_power, device_uuid, entry in candidates:
+            if excess <= 0:
+                break
+            watts = -negative_power
+            self._pending[device_uuid] = (watts, now + SHED_SETTLE_TIME)
+            self._shed.append((device_uuid, watts, now))
+            excess -= watts
+            self._async_command(entry, "off", total, started_ns)
+
+        if excess > 0:
+            _LOGGER.debug(
+                "Fleet power %.0f W exceeds %d W budget and no more plugs can be shed",
+                total, self._budget
+            )
+
+    @callback
+    def _async_restore(self, total: float, now: float, started_ns: int) -> None:
+        """Switch the most recently shed plug back on if it fits the budget."""
+        device_uuid, watts, shed_at = self._shed[-1]
+        if now - shed_at < RESTORE_HOLD_TIME or now < self._restore_after:
+            return
+        if total + watts > self._budget - self._hysteresis:
+            return
+
+        self._shed.pop()
+        self._restore_after = now + RESTORE_HOLD_TIME
+        for entry in self._async_plug_entries():
+            if entry.data[CONF_DEVICE_UUID] == device_uuid:
+                self._async_command(entry, "on", total, started_ns)
+                break
+
+    @callback
+    def _async_plug_entries(self) -> list[ConfigEntry]:
+        """Return loaded smart plug entries."""
+        return [
+            entry
+            for entry in self.hass.config_entries.async_entries(DOMAIN)
+            if entry.data.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG) == DEVICE_TYPE_SMART_PLUG
+            and entry.state is ConfigEntryState.LOADED
+        ]
+
+    @callback
+    def _async_command(
+        self, entry: ConfigEntry, power_state: str, total: float, started_ns: int
+    ) -> None:
+        """Record a decision and publish it through the switch command path."""
+        decision = {
+            "time": dt_util.utcnow().isoformat(),
+            "action": power_state,
+            "device": entry.data[CONF_DEVICE_NAME],
+            "fleet_power": round(total, 1),
+            "budget": self._budget,
+            "latency_ms": None,
+            "error": None,
+        }
+        self._decisions.append(decision)
+        self.hass.async_create_task(
+            self._async_publish(entry, power_state, decision, started_ns)
+        )
+
+    async def _async_publish(
+        self,
+        entry: ConfigEntry,
+        power_state: str,
+        decision: dict[str, Any],
+        started_ns: int,
+    ) -> None:
+        """Send the switch command and measure message-to-command latency.
+
+        The command goes through the plug's command tracker, which confirms
+        it by the echo, retries it if enabled and fires the failure event.
+        """
+        try:
+            await async_send_power_command(
+                self.hass, entry, power_state, PRIORITY_AUTOMATION
+            )
+        except HomeAssistantError as err:
+            decision["error"] = str(err)
+            if power_state == "off":
+                self._async_forget(entry.data[CONF_DEVICE_UUID])
+            _LOGGER.warning(
+                "Load shedding could not switch %s %s: %s",
+                power_state, decision["device"], err
+            )
+            return
+
+        latency_ms = (time.perf_counter_ns() - started_ns) / 1_000_000
+        decision["latency_ms"] = round(latency_ms, 2)
+        _LOGGER.info(
+            "Load shedding switched %s %s at %.0f W (budget %d W), %.1f ms after metering",
+            power_state, decision["device"], decision["fleet_power"], self._budget, latency_ms
+        )
+        if latency_ms > LATENCY_TARGET_MS:
+            _LOGGER.warning(
+                "Load shedding command to %s took %.1f ms, above the %d ms target",
+                decision["device"], latency_ms, LATENCY_TARGET_MS
+            )
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return controller state for diagnostics."""
+        latencies = [
+            decision["latency_ms"]
+            for decision in self._decisions
+            if decision["latency_ms"] is not None
+        ]
+        return {
+            "budget": self._budget,
+            "hysteresis": self._hysteresis,
+            "fleet_power": round(self._group.power, 1),
+            "shed_devices": [device_uuid for device_uuid, _, _ in self._shed],
+            "latency_ms": {
+                "count": len(latencies),
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "max": max(latencies, default=None),
+            },
+            "decisions": list(self._decisions),
+        }
@@ -0,0 +1,177 @@
+"""Hourly, daily and monthly consumption buckets for QUBO Smart Plugs."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from datetime import datetime
+import logging
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_change
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, METER_HOURLY, METER_MONTHLY
+from .router import async_get_router
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+# Bucket state is written at most this often
+SAVE_DELAY = 300  # seconds
+
+
+def period_start(period: str, now: datetime) -> datetime:
+    """Return the local start of the period that contains now."""
+    if period == METER_HOURLY:
+        return now.replace(minute=0, second=0, microsecond=0)
+    if period == METER_MONTHLY:
+        now = now.replace(day=1)
+    return dt_util.start_of_local_day(now)
+
+
+class _Bucket:
+    """Consumption of one period."""
+
+    __slots__ = ("period", "start", "value")
+
+    def __init__(self, period: str, start: datetime, value: float = 0.0) -> None:
+        """Initialize the bucket."""
+        self.period = period
+        self.start = start
+        self.value = value
+
+
+class QuboConsumptionMeter:
+    """Split a plug's consumption counter into period buckets.
+
+    The meter replaces utility_meter helpers on top of the Energy sensor. It
+    takes the consumption counter straight from the decoded plugMetering
+    messages and adds each increase to the current hourly, daily and monthly
+    bucket. When the counter goes down, the device was reset or its counter
+    wrapped around, and the new value is counted from zero as with
+    TOTAL_INCREASING sensors. Buckets start over at the local period
+    boundary. Their state is saved with a delay, so storage is written at most
+    every few minutes, and pending writes are flushed when Home Assistant
+    stops.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, device_uuid: str, monitor_topic: str, periods: list[str]
+    ) -> None:
+        """Initialize the meter."""
+        self.hass = hass
+        self._device_uuid = device_uuid
+        self._monitor_topic = monitor_topic
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.meter.{device_uuid}"
+        )
+        now = dt_util.now()
+        self.buckets = {
+            period: _Bucket(period, period_start(period, now)) for period in periods
+        }
+        self._last_consumption: float | None = None
+        self._listeners: list[Callable[[], None]] = []
+        self._stats = {"samples": 0, "counter_resets": 0}
+
+    async def async_start(self) -> CALLBACK_TYPE:
+        """Restore the buckets and start metering, return a stop callback."""
+        if (stored := await self._store.async_load()) is not None:
+            self._last_consumption = stored.get("last_consumption")
+            for period, data in stored.get("buckets", {}).items():
+                if (bucket := self.buckets.get(period)) is None:
+                    continue
+                if dt_util.parse_datetime(data["start"]) == bucket.start:
+                    bucket.value = data["value"]
+
+        unsubscribes = [
+            await async_get_router(self.hass).async_subscribe(
+                self._monitor_topic, self._async_metering_received, 1
+            ),
+            # Start new buckets on time even when the plug is quiet
+            async_track_time_change(self.hass, self._async_roll, minute=0, second=0),
+        ]
+
+        @callback
+        def async_stop() -> None:
+            """Stop metering and save the buckets."""
+            for unsubscribe in unsubscribes:
+                unsubscribe()
+            self._store.async_delay_save(self._data_to_save, 0)
+
+        return async_stop
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call back whenever a bucket changes."""
+        self._listeners.append(update_callback)
+        return lambda: self._listeners.remove(update_callback)
+
+    @callback
+    def _async_metering_received(self, state: dict[str, Any]) -> None:
+        """Add the consumption increase of a metering message to the buckets."""
+        if (consumption := state.get("consumption")) is None:
+            return
+        value = float(consumption)
+        self._stats["samples"] += 1
+        last, self._last_consumption = self._last_consumption, value
+        if last is None:
+            # Nothing to compare with yet
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+            return
+        if value >= last:
+            delta = value - last
+        else:
+            # Device reset or counter rollover
+            delta = value
+            self._stats["counter_resets"] += 1
+            _LOGGER.debug(
+                "Consumption counter of %s went from %s to %s, counting from zero",
+                self._device_uuid, last, value
+            )
+
+        self._async_roll()
+        if delta:
+            for bucket in self.buckets.values():
+                bucket.value += delta
+            self._async_notify()
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _async_roll(self, _now: datetime | None = None) -> None:
+        """Start new buckets for periods that have ended."""
+        now = dt_util.now()
+        rolled = False
+        for bucket in self.buckets.values():
+            if (start := period_start(bucket.period, now)) != bucket.start:
+                bucket.start = start
+                bucket.value = 0.0
+                rolled = True
+        if rolled:
+            self._async_notify()
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _async_notify(self) -> None:
+        """Tell the bucket sensors to write their state."""
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return the bucket state to store."""
+        return {
+            "last_consumption": self._last_consumption,
+            "buckets": {
+                period: {"start": bucket.start.isoformat(), "value": bucket.value}
+                for period, bucket in self.buckets.items()
+            },
+        }
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return the meter state for diagnostics."""
+        return {
+            **self._data_to_save(),
+            **self._stats,
+        }
@@ -0,0 +1,214 @@
+"""OpenMetrics endpoint for QUBO fleet telemetry."""
+from __future__ import annotations
+
+from typing import Any
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant, callback
+
+from .devicestate import DeviceState, async_get_device_states
+from .router import async_get_router
+from .watchdog import DurationHistogram
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Metric name, type, unit, help text and the device attribute it reads
+DEVICE_METRICS = (
+    ("qubo_device_available", "gauge", "", "Whether the device reported recently", "available"),
+    ("qubo_device_on", "gauge", "", "Whether the plug or purifier is on", "on"),
+    ("qubo_power_watts", "gauge", "watts", "Power drawn by the plug", "power"),
+    ("qubo_voltage_volts", "gauge", "volts", "Mains voltage at the plug", "voltage"),
+    ("qubo_current_amperes", "gauge", "amperes", "Current drawn by the plug", "current"),
+    (
+        "qubo_consumption_kilowatt_hours",
+        "gauge",
+        "kilowatt_hours",
+        "Energy counter of the plug, resets with the device",
+        "consumption",
+    ),
+    (
+        "qubo_pm25_micrograms_per_cubic_meter",
+        "gauge",
+        "micrograms_per_cubic_meter",
+        "PM2.5 reported by the purifier",
+        "pm25",
+    ),
+    ("qubo_filter_life_hours", "gauge", "hours", "Predicted filter life left", "filter_life"),
+)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metadata(name: str, metric_type: str, unit: str, help_text: str) -> str:
+    """Return the TYPE, UNIT and HELP lines of a metric family."""
+    lines = f"# TYPE {name} {metric_type}\n"
+    if unit:
+        lines += f"# UNIT {name} {unit}\n"
+    return lines + f"# HELP {name} {help_text}.\n"
+
+
+def _number(value: Any) -> str:
+    """Format a sample value."""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class QuboMetricsRenderer:
+    """Render the fleet telemetry as OpenMetrics text.
+
+    The sample lines of each device are cached together with the version of
+    its state and only rebuilt when the device reported since the last
+    scrape, so a scrape mostly joins cached strings. Router and publish
+    counters are few and rendered on every scrape.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the renderer."""
+        self.hass = hass
+        self._headers = tuple(
+            _metadata(name, metric_type, unit, help_text)
+            for name, metric_type, unit, help_text, _ in DEVICE_METRICS
+        )
+        # device_uuid -> (state version, sample line per metric, "" when unknown)
+        self._cache: dict[str, tuple[int, tuple[str, ...]]] = {}
+
+    def _device_lines(self, device: DeviceState) -> tuple[str, ...]:
+        """Return the cached sample lines of a device, rebuilding stale ones."""
+        cached = self._cache.get(device.device_uuid)
+        if cached is not None and cached[0] == device.version:
+            return cached[1]
+        labels = (
+            f'{{device="{device.device_uuid}",name="{_escape(device.name)}",'
+            f'unit_uuid="{device.unit_uuid}",type="{device.device_type}"}}'
+        )
+        lines = tuple(
+            ""
+            if (value := getattr(device, attribute)) is None
+            else f"{name}{labels} {_number(value)}\n"
+            for name, _, _, _, attribute in DEVICE_METRICS
+        )
+        self._cache[device.device_uuid] = (device.version, lines)
+        return lines
+
+    @callback
+    def async_render(self) -> str:
+        """Return the current metrics."""
+        devices = async_get_device_states(self.hass).devices
+        if len(self._cache) > len(devices):
+            for device_uuid in self._cache.keys() - devices.keys():
+                del self._cache[device_uuid]
+
+        rows = [self._device_lines(device) for device in devices.values()]
+        parts: list[str] = []
+        for index, header in enumerate(self._headers):
+            parts.append(header)
+            parts.extend(row[index] for row in rows)
+
+        self._render_router(parts, async_get_router(self.hass).as_metrics())
+        parts.append("# EOF\n")
+        return "".join(parts)
+
+    @staticmethod
+    def _render_router(parts: list[str], metrics: dict[str, Any]) -> None:
+        """Append the router and publish scheduler metrics."""
+        parts.append(
+            _metadata("qubo_messages_received", "counter", "", "Monitor messages received")
+        )
+        parts.extend(
+            f'qubo_messages_received_total{{service="{service}"}} {count}\n'
+            for service, count in sorted(metrics["received"].items())
+        )
+        parts.append(
+            _metadata(
+                "qubo_messages_merged", "counter", "", "Telemetry samples merged under overload"
+            )
+        )
+        parts.append(f"qubo_messages_merged_total {metrics['merged']}\n")
+        parts.append(
+            _metadata(
+                "qubo_messages_dropped", "counter", "", "Samples dropped from the full mailbox"
+            )
+        )
+        parts.append(f"qubo_messages_dropped_total {metrics['dropped']}\n")
+        parts.append(
+            _metadata(
+                "qubo_payload_errors",
+                "counter",
+                "",
+                "Payloads that could not be decoded or handled",
+            )
+        )
+        parts.append(f"qubo_payload_errors_total {metrics['payload_errors']}\n")
+        parts.append(_metadata("qubo_overloaded", "gauge", "", "Whether overload mode is active"))
+        parts.append(f"qubo_overloaded {_number(metrics['overloaded'])}\n")
+        parts.append(_metadata("qubo_mailbox_size", "gauge", "", "Merged samples waiting"))
+        parts.append(f"qubo_mailbox_size {metrics['mailbox']}\n")
+
+        publish = metrics["publish"]
+        for name, help_text in (
+            ("sent", "Commands sent to the broker"),
+            ("merged", "Refreshes merged into a queued one"),
+            ("dropped", "Refreshes dropped from the full queue"),
+            ("cancelled", "Queued commands dropped after their caller was cancelled"),
+        ):
+            parts.append(_metadata(f"qubo_publish_{name}", "counter", "", help_text))
+            parts.extend(
+                f'qubo_publish_{name}_total{{priority="{priority}"}} {stats[name]}\n'
+                for priority, stats in publish.items()
+            )
+        parts.append(
+            _metadata(
+                "qubo_publish_latency_seconds",
+                "histogram",
+                "seconds",
+                "Time from a publish call until the broker accepted it, queue wait included",
+            )
+        )
+        for priority, stats in publish.items():
+            _render_histogram(
+                parts, "qubo_publish_latency_seconds", f'priority="{priority}"', stats["latency"]
+            )
+
+
+def _render_histogram(
+    parts: list[str], name: str, labels: str, histogram: DurationHistogram
+) -> None:
+    """Append the cumulative buckets, count and sum of a histogram."""
+    cumulative = 0
+    for bound_us, count in zip(histogram.bounds_us, histogram.buckets, strict=False):
+        cumulative += count
+        parts.append(f'{name}_bucket{{{labels},le="{bound_us / 1_000_000}"}} {cumulative}\n')
+    parts.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}\n')
+    parts.append(f"{name}_count{{{labels}}} {histogram.count}\n")
+    parts.append(f"{name}_sum{{{labels}}} {histogram.total_ns / 1_000_000_000}\n")
+
+
+class QuboMetricsView(HomeAssistantView):
+    """Serve the QUBO metrics to authenticated scrapers."""
+
+    url = "/api/qubo_local/metrics"
+    name = "api:qubo_local:metrics"
+    requires_auth = True
+
+    def __init__(self, renderer: QuboMetricsRenderer) -> None:
+        """Initialize the view."""
+        self._renderer = renderer
+
+    async def get(self, request: web.Request) -> web.Response:
+        """Return the metrics in the OpenMetrics text format."""
+        return web.Response(
+            body=self._renderer.async_render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+
+@callback
+def async_setup_metrics(hass: HomeAssistant) -> None:
+    """Register the metrics view."""
+    hass.http.register_view(QuboMetricsView(QuboMetricsRenderer(hass)))
@@ -0,0 +1,433 @@
+"""MQTT packet encoding and decoding for the direct broker transport.
+
+This module has no Home Assistant dependencies. It covers the packets a
+client needs for QoS 0 and 1: connect, publish, subscribe, unsubscribe,
+ping and disconnect, in MQTT 3.1.1 and in MQTT 5 with the properties used
+for topic aliases. For the embedded broker, it also parses the MQTT 3.1.1
+packets clients send and encodes the broker's answers, including the
+QoS 2 handshake.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable
+
+# Packet types in the upper nibble of the fixed header
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PUBREC = 0x50
+PUBREL = 0x60
+PUBCOMP = 0x70
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA0
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+PROTOCOL_LEVEL_31 = 3
+PROTOCOL_LEVEL_311 = 4
+PROTOCOL_LEVEL_5 = 5
+# Largest packet accepted from the broker, QUBO payloads are far smaller
+MAX_PACKET_SIZE = 256 * 1024
+# SUBACK return codes from this value on refuse the topic
+SUBACK_FAILURE = 0x80
+# CONNACK codes of a broker that does not speak the requested version
+CONNACK_UNSUPPORTED_VERSION = (0x01, 0x84)
+# MQTT 3.1.1 CONNACK return codes sent by the embedded broker
+CONNACK_ACCEPTED = 0x00
+CONNACK_REFUSED_VERSION = 0x01
+CONNACK_REFUSED_IDENTIFIER = 0x02
+CONNACK_REFUSED_CREDENTIALS = 0x04
+CONNACK_REFUSED_NOT_AUTHORIZED = 0x05
+
+# MQTT 5 property identifiers
+PROPERTY_SUBSCRIPTION_IDENTIFIER = 0x0B
+PROPERTY_TOPIC_ALIAS_MAXIMUM = 0x22
+PROPERTY_TOPIC_ALIAS = 0x23
+PROPERTY_SHARED_SUBSCRIPTION_AVAILABLE = 0x2A
+
+# Value sizes of the MQTT 5 properties with fixed-size values
+_FIXED_PROPERTIES = {
+    **dict.fromkeys((0x01, 0x17, 0x19, 0x24, 0x25, 0x28, 0x29, 0x2A), 1),
+    **dict.fromkeys((0x13, 0x21, 0x22, 0x23), 2),
+    **dict.fromkeys((0x02, 0x11, 0x18, 0x27), 4),
+}
+# Properties with a length-prefixed value, the user property holds two
+_PREFIXED_PROPERTIES = {
+    **dict.fromkeys((0x03, 0x08, 0x09, 0x12, 0x15, 0x16, 0x1A, 0x1C, 0x1F), 1),
+    0x26: 2,
+}
+
+PINGREQ_PACKET = bytes((PINGREQ, 0))
+PINGRESP_PACKET = bytes((PINGRESP, 0))
+DISCONNECT_PACKET = bytes((DISCONNECT, 0))
+
+
+class MqttProtocolError(Exception):
+    """The broker sent something this client cannot handle."""
+
+
+def encode_length(length: int) -> bytes:
+    """Encode the remaining length of a packet."""
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        if length:
+            encoded.append(digit | 0x80)
+        else:
+            encoded.append(digit)
+            return bytes(encoded)
+
+
+def _read_length(data: bytes, offset: int) -> tuple[int, int]:
+    """Decode a variable byte integer and return it with the next offset."""
+    value = 0
+    for shift in range(0, 28, 7):
+        if offset >= len(data):
+            break
+        digit = data[offset]
+        offset += 1
+        value |= (digit & 0x7F) << shift
+        if not digit & 0x80:
+            return value, offset
+    raise MqttProtocolError("Malformed variable byte integer")
+
+
+def parse_properties(data: bytes, offset: int) -> tuple[dict[int, int], int]:
+    """Return the numeric MQTT 5 properties at offset and the offset after them.
+
+    Only properties with integer values are returned, the others are
+    skipped.
+    """
+    length, offset = _read_length(data, offset)
+    end = offset + length
+    if end > len(data):
+        raise MqttProtocolError("Truncated properties")
+    properties: dict[int, int] = {}
+    while offset < end:
+        identifier = data[offset]
+        offset += 1
+        if (size := _FIXED_PROPERTIES.get(identifier)) is not None:
+            properties[identifier] = int.from_bytes(data[offset : offset + size], "big")
+            offset += size
+        elif identifier == PROPERTY_SUBSCRIPTION_IDENTIFIER:
+            properties[identifier], offset = _read_length(data, offset)
+        elif (count := _PREFIXED_PROPERTIES.get(identifier)) is not None:
+            for _ in range(count):
+                offset += 2 + int.from_bytes(data[offset : offset + 2], "big")
+        else:
+            raise MqttProtocolError(f"Unknown property {identifier:#x}")
+    if offset != end:
+        raise MqttProtocolError("Malformed properties")
+    return properties, end
+
+
+def _string(value: str | bytes) -> bytes:
+    """Encode a length-prefixed UTF-8 string."""
+    data = value.encode() if isinstance(value, str) else value
+    return len(data).to_bytes(2, "big") + data
+
+
+def _read_bytes(data: bytes, offset: int) -> tuple[bytes, int]:
+    """Decode length-prefixed bytes and return them with the next offset."""
+    end = offset + 2 + int.from_bytes(data[offset : offset + 2], "big")
+    if end > len(data):
+        raise MqttProtocolError("Truncated string")
+    return data[offset + 2 : end], end
+
+
+def _read_string(data: bytes, offset: int) -> tuple[str, int]:
+    """Decode a length-prefixed UTF-8 string and return it with the next offset."""
+    value, offset = _read_bytes(data, offset)
+    try:
+        return value.decode(), offset
+    except UnicodeDecodeError as err:
+        raise MqttProtocolError("Invalid UTF-8 string") from err
+
+
+def _packet(header: int, body: bytes) -> bytes:
+    """Prefix a packet body with its fixed header."""
+    return bytes((header,)) + encode_length(len(body)) + body
+
+
+def connect(
+    client_id: str,
+    keepalive: int,
+    username: str | None = None,
+    password: str | None = None,
+    protocol: int = PROTOCOL_LEVEL_311,
+    topic_alias_maximum: int = 0,
+) -> bytes:
+    """Return a CONNECT packet for a clean session.
+
+    In MQTT 5, topic_alias_maximum tells the broker how many topic aliases
+    it may use for the messages it sends.
+    """
+    flags = 0x02
+    payload = _string(client_id)
+    if username:
+        flags |= 0x80
+        payload += _string(username)
+        if password:
+            flags |= 0x40
+            payload += _string(password)
+    variable = _string("MQTT") + bytes((protocol, flags)) + keepalive.to_bytes(2, "big")
+    if protocol == PROTOCOL_LEVEL_5:
+        properties = b""
+        if topic_alias_maximum:
+            properties = bytes((PROPERTY_TOPIC_ALIAS_MAXIMUM,))
+            properties += topic_alias_maximum.to_bytes(2, "big")
+        variable += encode_length(len(properties)) + properties
+    return _packet(CONNECT, variable + payload)
+
+
+class Connect:
+    """The fields of a CONNECT packet the embedded broker uses."""
+
+    __slots__ = (
+        "protocol",
+        "client_id",
+        "clean_session",
+        "keepalive",
+        "username",
+        "password",
+        "will",
+    )
+
+    def __init__(
+        self,
+        protocol: int,
+        client_id: str,
+        clean_session: bool,
+        keepalive: int,
+        username: str | None,
+        password: bytes | None,
+        will: tuple[str, bytes, int, bool] | None,
+    ) -> None:
+        """Initialize the fields, will holds topic, payload, qos and retain."""
+        self.protocol = protocol
+        self.client_id = client_id
+        self.clean_session = clean_session
+        self.keepalive = keepalive
+        self.username = username
+        self.password = password
+        self.will = will
+
+
+def parse_connect(body: bytes) -> Connect:
+    """Return the fields of an MQTT 3.1 or 3.1.1 CONNECT packet.
+
+    Other protocol levels are returned without parsing the payload, for the
+    broker to refuse them.
+    """
+    try:
+        name, offset = _read_string(body, 0)
+        protocol, flags = body[offset], body[offset + 1]
+        keepalive = int.from_bytes(body[offset + 2 : offset + 4], "big")
+    except IndexError as err:
+        raise MqttProtocolError("Truncated CONNECT") from err
+    if (name, protocol) not in (("MQTT", PROTOCOL_LEVEL_311), ("MQIsdp", PROTOCOL_LEVEL_31)):
+        return Connect(protocol, "", True, keepalive, None, None, None)
+    if flags & 0x01:
+        raise MqttProtocolError("Reserved CONNECT flag set")
+    client_id, offset = _read_string(body, offset + 4)
+    will = None
+    if flags & 0x04:
+        will_topic, offset = _read_string(body, offset)
+        will_payload, offset = _read_bytes(body, offset)
+        will = (will_topic, will_payload, flags >> 3 & 0x03, bool(flags & 0x20))
+    username = password = None
+    if flags & 0x80:
+        username, offset = _read_string(body, offset)
+    if flags & 0x40:
+        password, offset = _read_bytes(body, offset)
+    return Connect(protocol, client_id, bool(flags & 0x02), keepalive, username, password, will)
+
+
+def connack(code: int) -> bytes:
+    """Return the CONNACK of a clean session."""
+    return bytes((CONNACK, 2, 0, code))
+
+
+def parse_connack(header: int, body: bytes, protocol: int) -> tuple[int, dict[int, int]]:
+    """Return the return or reason code of a CONNACK and its MQTT 5 properties."""
+    if header & 0xF0 != CONNACK or len(body) < 2:
+        raise MqttProtocolError("Expected CONNACK")
+    if protocol == PROTOCOL_LEVEL_5 and len(body) > 2:
+        return body[1], parse_properties(body, 2)[0]
+    return body[1], {}
+
+
+def publish(
+    topic: str,
+    payload: bytes,
+    qos: int = 0,
+    packet_id: int = 0,
+    protocol: int = PROTOCOL_LEVEL_311,
+    alias: int = 0,
+    retain: bool = False,
+) -> bytes:
+    """Return a PUBLISH packet.
+
+    In MQTT 5, an alias is sent as the topic alias property. An empty topic
+    with an alias reuses the topic the alias was last sent with.
+    """
+    body = _string(topic)
+    if qos:
+        body += packet_id.to_bytes(2, "big")
+    if protocol == PROTOCOL_LEVEL_5:
+        if alias:
+            body += b"\x03" + bytes((PROPERTY_TOPIC_ALIAS,)) + alias.to_bytes(2, "big")
+        else:
+            body += b"\x00"
+    return _packet(PUBLISH | qos << 1 | retain, body + payload)
+
+
+def puback(packet_id: int) -> bytes:
+    """Return the PUBACK of a QoS 1 publish."""
+    return bytes((PUBACK, 2)) + packet_id.to_bytes(2, "big")
+
+
+def pubrec(packet_id: int) -> bytes:
+    """Return the PUBREC that answers a QoS 2 publish."""
+    return bytes((PUBREC, 2)) + packet_id.to_bytes(2, "big")
+
+
+def pubcomp(packet_id: int) -> bytes:
+    """Return the PUBCOMP that answers a PUBREL."""
+    return bytes((PUBCOMP, 2)) + packet_id.to_bytes(2, "big")
+
+
+def _packet_id_and_properties(packet_id: int, protocol: int) -> bytes:
+    """Return a packet id followed by empty properties in MQTT 5."""
+    if protocol == PROTOCOL_LEVEL_5:
+        return packet_id.to_bytes(2, "big") + b"\x00"
+    return packet_id.to_bytes(2, "big")
+
+
+def subscribe(
+    packet_id: int,
+    topics: Iterable[tuple[str, int]],
+    protocol: int = PROTOCOL_LEVEL_311,
+    no_local: bool = False,
+) -> bytes:
+    """Return a SUBSCRIBE packet for several topics.
+
+    In MQTT 5, no_local asks the broker not to send back the client's own
+    messages.
+    """
+    flags = 0x04 if no_local and protocol == PROTOCOL_LEVEL_5 else 0
+    body = _packet_id_and_properties(packet_id, protocol) + b"".join(
+        _string(topic) + bytes((qos | flags,)) for topic, qos in topics
+    )
+    return _packet(SUBSCRIBE | 0x02, body)
+
+
+def parse_subscribe(body: bytes) -> tuple[int, list[tuple[str, int]]]:
+    """Return the packet id and the topic filters with their QoS of a SUBSCRIBE."""
+    topics = []
+    offset = 2
+    while offset < len(body):
+        topic_filter, offset = _read_string(body, offset)
+        if offset >= len(body):
+            raise MqttProtocolError("Truncated SUBSCRIBE")
+        topics.append((topic_filter, body[offset]))
+        offset += 1
+    if not topics:
+        raise MqttProtocolError("SUBSCRIBE without topics")
+    return packet_id(body), topics
+
+
+def suback(packet_id: int, codes: Iterable[int]) -> bytes:
+    """Return a SUBACK with the granted QoS or failure of every topic."""
+    return _packet(SUBACK, packet_id.to_bytes(2, "big") + bytes(codes))
+
+
+def parse_suback(body: bytes, protocol: int) -> bytes:
+    """Return the return or reason code of every topic in a SUBACK."""
+    if protocol == PROTOCOL_LEVEL_5:
+        return body[parse_properties(body, 2)[1] :]
+    return body[2:]
+
+
+def unsubscribe(
+    packet_id: int, topics: Iterable[str], protocol: int = PROTOCOL_LEVEL_311
+) -> bytes:
+    """Return an UNSUBSCRIBE packet for several topics."""
+    body = _packet_id_and_properties(packet_id, protocol) + b"".join(
+        _string(topic) for topic in topics
+    )
+    return _packet(UNSUBSCRIBE | 0x02, body)
+
+
+def parse_unsubscribe(body: bytes) -> tuple[int, list[str]]:
+    """Return the packet id and the topic filters of an UNSUBSCRIBE."""
+    topics = []
+    offset = 2
+    while offset < len(body):
+        topic_filter, offset = _read_string(body, offset)
+        topics.append(topic_filter)
+    return packet_id(body), topics
+
+
+def unsuback(packet_id: int) -> bytes:
+    """Return the UNSUBACK of an UNSUBSCRIBE."""
+    return bytes((UNSUBACK, 2)) + packet_id.to_bytes(2, "big")
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """Read one packet and return its first header byte and its body."""
+    header = (await reader.readexactly(1))[0]
+    length = 0
+    for shift in range(0, 28, 7):
+        digit = (await reader.readexactly(1))[0]
+        length |= (digit & 0x7F) << shift
+        if not digit & 0x80:
+            break
+    else:
+        raise MqttProtocolError("Malformed remaining length")
+    if length > MAX_PACKET_SIZE:
+        raise MqttProtocolError(f"Packet of {length} bytes exceeds the limit")
+    return header, await reader.readexactly(length) if length else b""
+
+
+def parse_publish(header: int, body: bytes) -> tuple[str, int, bytes]:
+    """Return the topic, packet id (0 for QoS 0) and payload of a PUBLISH."""
+    topic, end = _read_string(body, 0)
+    if header & 0x06:
+        if end + 2 > len(body):
+            raise MqttProtocolError("Truncated PUBLISH")
+        return topic, int.from_bytes(body[end : end + 2], "big"), body[end + 2 :]
+    return topic, 0, body[end:]
+
+
+def parse_publish_v5(header: int, body: bytes) -> tuple[str, int, bytes, int]:
+    """Return the topic, packet id, payload and topic alias of an MQTT 5 PUBLISH.
+
+    The topic is empty when the broker only sent an alias, and the alias is
+    0 when it sent none.
+    """
+    topic, end = _read_string(body, 0)
+    packet_id = 0
+    if header & 0x06:
+        packet_id = int.from_bytes(body[end : end + 2], "big")
+        end += 2
+    if end >= len(body):
+        raise MqttProtocolError("Truncated PUBLISH")
+    if body[end] == 0:
+        # No properties, the common case without an alias
+        return topic, packet_id, body[end + 1 :], 0
+    if end + 4 <= len(body) and body[end] == 3 and body[end + 1] == PROPERTY_TOPIC_ALIAS:
+        # Only a topic alias
+        return topic, packet_id, body[end + 4 :], int.from_bytes(body[end + 2 : end + 4], "big")
+    properties, end = parse_properties(body, end)
+    return topic, packet_id, body[end:], properties.get(PROPERTY_TOPIC_ALIAS, 0)
+
+
+def packet_id(body: bytes) -> int:
+    """Return the packet id that starts the body of an acknowledgement."""
+    return int.from_bytes(body[:2], "big")
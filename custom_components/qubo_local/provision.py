@@ -0,0 +1,186 @@
+"""Bulk import of QUBO devices from a manifest."""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import re
+from typing import Any
+
+from homeassistant import config_entries
+from homeassistant.core import HomeAssistant
+from homeassistant.data_entry_flow import FlowResultType
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import (
+    CONF_DEVICE_MAC,
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_TYPE,
+    CONF_DEVICE_UUID,
+    CONF_ENTITY_UUID,
+    CONF_HANDLE_NAME,
+    CONF_UNIT_UUID,
+    DEFAULT_NAME,
+    DEFAULT_NAME_PURIFIER,
+    DEVICE_PREFIX_PLUG,
+    DEVICE_PREFIX_PURIFIER,
+    DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_SMART_PLUG,
+    DOMAIN,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Manifest columns, by the short names and the config entry keys
+COLUMNS = {
+    "uuid": CONF_DEVICE_UUID,
+    CONF_DEVICE_UUID: CONF_DEVICE_UUID,
+    CONF_ENTITY_UUID: CONF_ENTITY_UUID,
+    CONF_UNIT_UUID: CONF_UNIT_UUID,
+    "handle": CONF_HANDLE_NAME,
+    CONF_HANDLE_NAME: CONF_HANDLE_NAME,
+    "mac": CONF_DEVICE_MAC,
+    CONF_DEVICE_MAC: CONF_DEVICE_MAC,
+    "type": CONF_DEVICE_TYPE,
+    CONF_DEVICE_TYPE: CONF_DEVICE_TYPE,
+    "name": CONF_DEVICE_NAME,
+    CONF_DEVICE_NAME: CONF_DEVICE_NAME,
+}
+REQUIRED = (CONF_DEVICE_UUID, CONF_ENTITY_UUID, CONF_UNIT_UUID, CONF_HANDLE_NAME)
+
+# Device types, by name and by the srcDeviceId prefix of the heartbeat
+DEVICE_TYPES = {
+    DEVICE_TYPE_SMART_PLUG: DEVICE_TYPE_SMART_PLUG,
+    DEVICE_TYPE_AIR_PURIFIER: DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_PREFIX_PLUG.lower(): DEVICE_TYPE_SMART_PLUG,
+    DEVICE_PREFIX_PURIFIER.lower(): DEVICE_TYPE_AIR_PURIFIER,
+}
+
+MAC_PATTERN = re.compile(r"^[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}$")
+# Invalid rows listed in the error, the count covers the rest
+ERROR_LIMIT = 20
+
+
+def parse_manifest(manifest: str) -> list[dict[str, Any]]:
+    """Return the rows of a JSON list of objects or a CSV with a header line."""
+    text = manifest.strip()
+    if text.startswith("["):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as err:
+            raise HomeAssistantError(f"Invalid JSON manifest: {err}") from err
+        if not all(isinstance(row, dict) for row in rows):
+            raise HomeAssistantError("A JSON manifest must be a list of objects")
+        return rows
+    return list(csv.DictReader(io.StringIO(text), skipinitialspace=True))
+
+
+def validate_manifest(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Return the config entry data of every row, checking them all first.
+
+    Raises with every invalid row instead of stopping at the first, so a
+    manifest can be fixed in one go. A device listed twice is invalid too.
+    """
+    devices: list[dict[str, Any]] = []
+    errors: list[str] = []
+    seen: dict[str, int] = {}
+    for number, row in enumerate(rows, start=1):
+        data: dict[str, Any] = {}
+        problems: list[str] = []
+        for column, value in row.items():
+            if column is None or value is None:
+                continue
+            if (key := COLUMNS.get(column.strip().lower())) is None:
+                problems.append(f"unknown column {column!r}")
+            elif value := str(value).strip():
+                data[key] = value
+
+        problems.extend(f"missing {key}" for key in REQUIRED if key not in data)
+        device_type = DEVICE_TYPES.get(
+            data.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG).lower()
+        )
+        if device_type is None:
+            problems.append(f"unknown type {data[CONF_DEVICE_TYPE]!r}")
+        mac = data.get(CONF_DEVICE_MAC, "")
+        if mac and not MAC_PATTERN.match(mac):
+            problems.append(f"invalid MAC {mac!r}")
+        if (device_uuid := data.get(CONF_DEVICE_UUID)) is not None:
+            if (first := seen.setdefault(device_uuid, number)) != number:
+                problems.append(f"duplicate of row {first}")
+
+        if problems:
+            errors.append(f"row {number}: {', '.join(problems)}")
+            continue
+
+        data[CONF_DEVICE_TYPE] = device_type
+        if mac:
+            data[CONF_DEVICE_MAC] = mac.upper()
+        if CONF_DEVICE_NAME not in data:
+            # Named like discovered devices
+            default_name = (
+                DEFAULT_NAME_PURIFIER if device_type == DEVICE_TYPE_AIR_PURIFIER else DEFAULT_NAME
+            )
+            suffix = mac.replace(":", "")[-6:].upper() if mac else device_uuid[:8]
+            data[CONF_DEVICE_NAME] = f"{default_name} {suffix}"
+        devices.append(data)
+
+    if errors:
+        listed = "; ".join(errors[:ERROR_LIMIT])
+        if len(errors) > ERROR_LIMIT:
+            listed += f"; and {len(errors) - ERROR_LIMIT} more"
+        raise HomeAssistantError(
+            f"{len(errors)} of {len(rows)} manifest rows are invalid, nothing was imported: "
+            f"{listed}"
+        )
+    return devices
+
+
+async def async_import_devices(hass: HomeAssistant, manifest: str) -> dict[str, Any]:
+    """Add a config entry for every new device of a manifest.
+
+    The whole manifest is validated before anything is added. Devices that
+    already have an entry are skipped. The entries of the others are added
+    together, so their setups, including the entity platforms, run
+    concurrently instead of one device after another.
+    """
+    devices = validate_manifest(parse_manifest(manifest))
+    configured = {entry.unique_id for entry in hass.config_entries.async_entries(DOMAIN)}
+    new = [data for data in devices if data[CONF_DEVICE_UUID] not in configured]
+
+    results = await asyncio.gather(
+        *(
+            hass.config_entries.flow.async_init(
+                DOMAIN, context={"source": config_entries.SOURCE_IMPORT}, data=data
+            )
+            for data in new
+        ),
+        return_exceptions=True,
+    )
+    created: list[str] = []
+    failed: list[dict[str, str]] = []
+    for data, result in zip(new, results):
+        if isinstance(result, Exception):
+            reason = str(result) or type(result).__name__
+        elif result["type"] is FlowResultType.CREATE_ENTRY:
+            created.append(data[CONF_DEVICE_UUID])
+            continue
+        else:
+            reason = result.get("reason", str(result["type"]))
+        failed.append({"device_uuid": data[CONF_DEVICE_UUID], "reason": reason})
+
+    _LOGGER.info(
+        "Imported %d of %d QUBO devices, %d already configured, %d failed",
+        len(created),
+        len(devices),
+        len(devices) - len(new),
+        len(failed),
+    )
+    return {
+        "created": created,
+        "skipped": [
+            data[CONF_DEVICE_UUID] for data in devices if data[CONF_DEVICE_UUID] in configured
+        ],
+        "failed": failed,
+    }
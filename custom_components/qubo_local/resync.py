@@ -0,0 +1,197 @@
+"""Paced state resync after the MQTT connection comes back."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Coroutine
+import logging
+import statistics
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .const import DATA_RESYNC, DEFAULT_RESYNC_WINDOW
+from .router import async_get_router
+
+_LOGGER = logging.getLogger(__name__)
+
+# Devices that have not reported this long after the window are counted as stale
+RESYNC_GRACE = 30  # seconds
+# Stale devices listed in the log and diagnostics
+STALE_LIMIT = 20
+
+RefreshType = Callable[[], Coroutine[Any, Any, None]]
+
+
+class QuboResync:
+    """Re-request device state after a broker reconnect.
+
+    Entities and refresh timers register the requests that fetch a device's
+    state. When the MQTT connection comes back after a disconnect, the
+    devices are refreshed one after another, spread evenly over the resync
+    window, so a broker restart does not turn into a burst of every request
+    at once. The requests use the refresh priority of the publish scheduler.
+
+    The time from the reconnect to the first message of each device after
+    its requests were sent is measured and summarized once every device
+    reported or the window plus a grace period has passed.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the resync."""
+        self.hass = hass
+        self._window = float(DEFAULT_RESYNC_WINDOW)
+        self._refreshes: dict[str, list[RefreshType]] = {}
+        self._disconnected = False
+        self._task: asyncio.Task[None] | None = None
+        self._finish_handle: Any = None
+
+        # Current resync: devices not yet refreshed or not yet reported, and
+        # seconds from the reconnect to the first message after the refresh
+        self._started = 0.0
+        self._waiting: set[str] = set()
+        self._requested: set[str] = set()
+        self._fresh: dict[str, float] = {}
+
+        self._stats: dict[str, Any] = {"disconnects": 0, "resyncs": 0, "last": None}
+
+    @callback
+    def async_start(self) -> CALLBACK_TYPE:
+        """Watch the MQTT connection state."""
+        return async_get_router(self.hass).async_subscribe_connection_status(
+            self._async_connection_changed
+        )
+
+    @callback
+    def async_set_window(self, window: float) -> None:
+        """Set the time over which the devices are refreshed."""
+        self._window = float(window)
+
+    @callback
+    def async_register(self, device_uuid: str, refresh: RefreshType) -> CALLBACK_TYPE:
+        """Register a request that fetches state from a device."""
+        self._refreshes.setdefault(device_uuid, []).append(refresh)
+
+        @callback
+        def async_unregister() -> None:
+            """Remove the request."""
+            refreshes = self._refreshes[device_uuid]
+            refreshes.remove(refresh)
+            if not refreshes:
+                del self._refreshes[device_uuid]
+
+        return async_unregister
+
+    @callback
+    def _async_connection_changed(self, connected: bool) -> None:
+        """Start a resync when the connection comes back."""
+        if not connected:
+            self._disconnected = True
+            self._stats["disconnects"] += 1
+            return
+        if not self._disconnected:
+            # First connection, entities request their state on setup
+            return
+        self._disconnected = False
+        self.async_resync()
+
+    @callback
+    def async_resync(self) -> None:
+        """Refresh every registered device within the resync window."""
+        if self._task is not None:
+            self._task.cancel()
+        self._async_finish()
+
+        devices = list(self._refreshes)
+        if not devices:
+            return
+        self._stats["resyncs"] += 1
+        self._started = time.monotonic()
+        self._waiting = set(devices)
+        self._requested = set()
+        self._fresh = {}
+        async_get_router(self.hass).async_set_device_listener(self._async_device_seen)
+        self._finish_handle = self.hass.loop.call_later(
+            self._window + RESYNC_GRACE, self._async_finish
+        )
+        _LOGGER.info(
+            "MQTT reconnected, refreshing %d QUBO devices over %.0f s",
+            len(devices), self._window
+        )
+        self._task = self.hass.async_create_background_task(
+            self._async_refresh_devices(devices), "qubo_local resync"
+        )
+
+    async def _async_refresh_devices(self, devices: list[str]) -> None:
+        """Send the refresh requests of each device at its slot in the window."""
+        spacing = self._window / len(devices)
+        for index, device_uuid in enumerate(devices):
+            delay = self._started + index * spacing - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._requested.add(device_uuid)
+            for refresh in list(self._refreshes.get(device_uuid, ())):
+                self.hass.async_create_background_task(
+                    refresh(), f"qubo_local resync {device_uuid}"
+                )
+
+    @callback
+    def _async_device_seen(self, device_uuid: str) -> None:
+        """Record the first message from a device after its refresh."""
+        if device_uuid in self._requested and device_uuid in self._waiting:
+            self._waiting.discard(device_uuid)
+            self._fresh[device_uuid] = time.monotonic() - self._started
+            if not self._waiting:
+                self._async_finish()
+
+    @callback
+    def _async_finish(self) -> None:
+        """Summarize the current resync."""
+        if self._finish_handle is not None:
+            self._finish_handle.cancel()
+            self._finish_handle = None
+        if not self._started:
+            return
+        async_get_router(self.hass).async_set_device_listener(None)
+
+        times = sorted(self._fresh.values())
+        stale = sorted(self._waiting)
+        last = {
+            "devices": len(times) + len(stale),
+            "fresh": len(times),
+            "stale": len(stale),
+            "stale_devices": stale[:STALE_LIMIT],
+            "window_s": self._window,
+            "p50_s": round(statistics.median(times), 2) if times else None,
+            "p95_s": round(times[round((len(times) - 1) * 0.95)], 2) if times else None,
+            "all_fresh_s": round(times[-1], 2) if times and not self._waiting else None,
+        }
+        self._stats["last"] = last
+        self._started = 0.0
+        self._waiting = set()
+        self._requested = set()
+        self._fresh = {}
+        _LOGGER.info(
+            "QUBO resync finished: %d of %d devices reported, median %s s, stale: %s",
+            last["fresh"], last["devices"], last["p50_s"],
+            ", ".join(stale[:STALE_LIMIT]) or "none"
+        )
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return resync state for diagnostics."""
+        return {
+            "window": self._window,
+            "devices": len(self._refreshes),
+            "running": bool(self._started),
+            **self._stats,
+        }
+
+
+@callback
+def async_get_resync(hass: HomeAssistant) -> QuboResync:
+    """Return the shared resync, creating it on first use."""
+    if (resync := hass.data.get(DATA_RESYNC)) is None:
+        resync = hass.data[DATA_RESYNC] = QuboResync(hass)
+        resync.async_start()
+    return resync
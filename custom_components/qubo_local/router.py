@@ -0,0 +1,651 @@
+"""Shared MQTT message router with overload protection for QUBO devices."""
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Callable, Coroutine, Generator
+from concurrent.futures import ThreadPoolExecutor
+import cProfile
+import logging
+import time
+import types
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .codec import decode_state
+from .const import (
+    DATA_ROUTER,
+    DEFAULT_OVERLOAD_DEVICE_RATE,
+    DEFAULT_OVERLOAD_RATE,
+    MERGEABLE_SERVICES,
+)
+from .errors import async_get_error_reporter
+from .export import EXPORT_SERVICES, QuboExportSink
+from .scheduler import PRIORITY_INTERACTIVE, QuboPublishScheduler
+from .transport import QuboMqttIntegrationTransport, QuboTransport
+from .watchdog import QuboWatchdog
+
+if TYPE_CHECKING:
+    from .startup import QuboStartupTimings
+
+_LOGGER = logging.getLogger(__name__)
+
+RATE_WINDOW = 1.0  # seconds
+DRAIN_INTERVAL = 0.1  # seconds
+DRAIN_BATCH = 50  # messages delivered per drain tick
+MAILBOX_SIZE = 5000
+
+StateCallbackType = Callable[[dict[str, Any]], None]
+
+# Raised by handlers for state values they cannot use
+HANDLER_ERRORS = (AttributeError, KeyError, TypeError, ValueError)
+
+
+def _enable(profiler: cProfile.Profile) -> bool:
+    """Enable a profiler unless another one is active on this thread."""
+    try:
+        profiler.enable()
+    except ValueError:
+        return False
+    return True
+
+
+@types.coroutine
+def _profiled(
+    coro: Coroutine[Any, Any, Any], profiler: cProfile.Profile
+) -> Generator[Any, Any, Any]:
+    """Await a coroutine with the profiler enabled only while it runs.
+
+    Other tasks that run while the coroutine is suspended stay out of the
+    profile.
+    """
+    send, value = coro.send, None
+    while True:
+        enabled = _enable(profiler)
+        try:
+            yielded = send(value)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            if enabled:
+                profiler.disable()
+        try:
+            value, send = (yield yielded), coro.send
+        except BaseException as err:  # noqa: BLE001 - forwarded into the coroutine
+            value, send = err, coro.throw
+
+
+class _TopicSubscription:
+    """A single MQTT subscription shared by every handler of a topic."""
+
+    __slots__ = (
+        "topic",
+        "qos",
+        "device_uuid",
+        "service",
+        "mergeable",
+        "callbacks",
+        "handler_name",
+        "message_received",
+        "unsubscribe",
+    )
+
+    def __init__(self, topic: str, qos: int) -> None:
+        """Initialize the subscription from a /monitor/unit/device/service topic."""
+        parts = topic.split("/")
+        self.topic = topic
+        self.qos = qos
+        self.device_uuid = parts[3] if len(parts) > 4 else topic
+        self.service = parts[-1]
+        self.mergeable = self.service in MERGEABLE_SERVICES
+        self.callbacks: list[StateCallbackType] = []
+        # Name delivery durations are recorded under, e.g. QuboSwitch.lcSwitchControl
+        self.handler_name = self.service
+        # Transport callback that receives the raw payloads of the topic
+        self.message_received: Callable[[str | bytes], None] | None = None
+        self.unsubscribe: CALLBACK_TYPE | None = None
+
+    def update_handler_name(self) -> None:
+        """Name the handlers after the entity classes they belong to."""
+        classes = sorted(
+            {msg_callback.__qualname__.split(".", 1)[0] for msg_callback in self.callbacks}
+        )
+        self.handler_name = f"{'+'.join(classes)}.{self.service}"
+
+
+class QuboMessageRouter:
+    """Route monitor messages to entity handlers.
+
+    Each topic is subscribed once, every message is decoded once and the
+    reported service state is fanned out to its handlers. When the inbound
+    rate of the fleet or of a single device passes its limit, telemetry
+    messages are merged into a bounded mailbox that keeps only the latest
+    message per device and service. The mailbox is drained in small
+    batches. Control echoes such as lcSwitchControl are always delivered
+    immediately.
+
+    Payloads that cannot be decoded and state that a handler cannot
+    process are counted by the error reporter instead of being logged one
+    by one.
+
+    Commands are published through a rate-limited priority scheduler.
+
+    Subscriptions and publishes go through a transport, by default the
+    client of Home Assistant's MQTT integration. Switching the transport
+    moves every subscription over, so entities never notice.
+
+    When the watchdog is enabled, the handlers run for each message and
+    every publish are timed and recorded in its histograms. Handlers are
+    timed together per message, which keeps the cost to one pair of clock
+    reads however many entities share a topic.
+
+    With an export sink set, the raw payload of every metering message is
+    queued for export before any merging.
+
+    With the decode worker enabled, payloads are decoded in batches on a
+    single worker thread and the results come back to the event loop with one
+    call per batch. A single thread keeps messages in arrival order.
+
+    Subscribes and publishes are timed per device for the startup timings,
+    which keep the ones made while an entry sets up.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the router."""
+        self.hass = hass
+        self._subscriptions: dict[str, _TopicSubscription] = {}
+        self._mailbox: dict[str, tuple[_TopicSubscription, str | bytes]] = {}
+        self._drain_handle: Any = None
+
+        self._worker: ThreadPoolExecutor | None = None
+        # Disabled worker that still decodes batches submitted before
+        self._retired_worker: ThreadPoolExecutor | None = None
+        self._watchdog: QuboWatchdog | None = None
+        self._profiler: cProfile.Profile | None = None
+        self._device_listener: Callable[[str], None] | None = None
+        self._export: QuboExportSink | None = None
+        self._startup: QuboStartupTimings | None = None
+        self._transport: QuboTransport = QuboMqttIntegrationTransport(hass)
+        self._status_callbacks: list[Callable[[bool], None]] = []
+        self._unsub_status: CALLBACK_TYPE | None = None
+        self._errors = async_get_error_reporter(hass)
+        self._scheduler = QuboPublishScheduler(hass, self._async_send)
+        self._batch: list[tuple[_TopicSubscription, str | bytes]] = []
+        # Batches handed to the worker whose results were not delivered yet
+        self._batches_in_flight = 0
+
+        self._global_limit = DEFAULT_OVERLOAD_RATE
+        self._device_limit = DEFAULT_OVERLOAD_DEVICE_RATE
+        self._overloaded = False
+        self._overloaded_devices: set[str] = set()
+
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._device_counts: defaultdict[str, int] = defaultdict(int)
+        self._service_counts: defaultdict[str, int] = defaultdict(int)
+
+        self._stats = {
+            "received": 0,
+            "merged": 0,
+            "dropped": 0,
+            "overload_periods": 0,
+            "peak_rate": 0.0,
+            "peak_mailbox": 0,
+            "worker_batches": 0,
+        }
+
+    @callback
+    def async_configure(self, global_limit: int, device_limit: int) -> None:
+        """Set the overload thresholds in messages per second."""
+        self._global_limit = global_limit
+        self._device_limit = device_limit
+
+    @callback
+    def async_set_decode_worker(self, enabled: bool) -> None:
+        """Enable or disable off-loop batch decoding.
+
+        Batches already submitted still deliver their results. Messages that
+        arrive before they did are held and decoded after them, so a topic's
+        states are never delivered out of order. The worker thread is shut
+        down once its last batch was delivered, and taken back when decoding
+        is enabled again before that, so batches never overtake each other.
+        """
+        if enabled and self._worker is None:
+            self._worker = self._retired_worker or ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="qubo_local_decode"
+            )
+            self._retired_worker = None
+            if self._batch:
+                # Held messages go to the worker behind the batches in flight
+                self.hass.loop.call_soon(self._async_submit_batch)
+        elif not enabled and self._worker is not None:
+            self._retired_worker, self._worker = self._worker, None
+            self._async_retire_worker()
+
+    @callback
+    def _async_retire_worker(self) -> None:
+        """Shut the disabled worker down once it has no batch in flight."""
+        if self._retired_worker is not None and not self._batches_in_flight:
+            self._retired_worker.shutdown(wait=False)
+            self._retired_worker = None
+
+    @callback
+    def async_set_watchdog(self, watchdog: QuboWatchdog | None) -> None:
+        """Start or stop timing handlers and publishes."""
+        self._watchdog = watchdog
+
+    @callback
+    def async_set_profiler(self, profiler: cProfile.Profile | None) -> None:
+        """Start or stop profiling the message and publish paths."""
+        self._profiler = profiler
+
+    @callback
+    def async_set_export(self, export: QuboExportSink | None) -> None:
+        """Start or stop handing raw metering payloads to the export sink."""
+        self._export = export
+
+    @callback
+    def async_set_startup_timings(self, timings: QuboStartupTimings | None) -> None:
+        """Start or stop reporting subscribe and publish times per device."""
+        self._startup = timings
+
+    @callback
+    def async_set_device_listener(self, listener: Callable[[str], None] | None) -> None:
+        """Set a callback that receives the device of every incoming message."""
+        self._device_listener = listener
+
+    async def async_set_transport(self, transport: QuboTransport | None) -> None:
+        """Move every subscription to another transport.
+
+        None returns to the MQTT integration. The transport must already be
+        started, and stopping the previous one is left to the caller.
+        """
+        if transport is None:
+            transport = QuboMqttIntegrationTransport(self.hass)
+        previous, self._transport = self._transport, transport
+        if self._unsub_status is not None:
+            self._unsub_status()
+            self._unsub_status = transport.async_subscribe_connection_status(
+                self._async_connection_changed
+            )
+        for subscription in list(self._subscriptions.values()):
+            unsubscribe = await transport.async_subscribe(
+                subscription.topic, subscription.message_received, subscription.qos
+            )
+            if self._subscriptions.get(subscription.topic) is not subscription:
+                # All handlers went away while subscribing
+                unsubscribe()
+                continue
+            if subscription.unsubscribe is not None:
+                subscription.unsubscribe()
+            subscription.unsubscribe = unsubscribe
+        _LOGGER.debug("QUBO messages now use the %s transport", transport.name)
+        if transport.connected != previous.connected:
+            self._async_connection_changed(transport.connected)
+
+    @callback
+    def async_subscribe_connection_status(
+        self, status_callback: Callable[[bool], None]
+    ) -> CALLBACK_TYPE:
+        """Call back with the new state whenever the broker connection changes."""
+        self._status_callbacks.append(status_callback)
+        if self._unsub_status is None:
+            self._unsub_status = self._transport.async_subscribe_connection_status(
+                self._async_connection_changed
+            )
+
+        @callback
+        def async_unsubscribe() -> None:
+            """Stop calling back."""
+            self._status_callbacks.remove(status_callback)
+
+        return async_unsubscribe
+
+    @callback
+    def _async_connection_changed(self, connected: bool) -> None:
+        """Tell every status listener about a connection change."""
+        for status_callback in list(self._status_callbacks):
+            status_callback(connected)
+
+    @property
+    def profiling(self) -> bool:
+        """Return whether a profile is being collected."""
+        return self._profiler is not None
+
+    async def async_subscribe(
+        self, topic: str, msg_callback: StateCallbackType, qos: int = 1
+    ) -> CALLBACK_TYPE:
+        """Subscribe a handler to the decoded service state of a monitor topic."""
+        started = time.perf_counter()
+        if (subscription := self._subscriptions.get(topic)) is None:
+            subscription = _TopicSubscription(topic, qos)
+            self._subscriptions[topic] = subscription
+
+            @callback
+            def message_received(payload: str | bytes) -> None:
+                """Handle a message for the shared subscription."""
+                self._async_message_received(subscription, payload)
+
+            subscription.message_received = message_received
+            subscription.callbacks.append(msg_callback)
+            subscription.update_handler_name()
+            subscription.unsubscribe = await self._transport.async_subscribe(
+                topic, message_received, qos
+            )
+            if not subscription.callbacks:
+                # All handlers went away while subscribing
+                self._async_remove_subscription(subscription)
+        else:
+            subscription.callbacks.append(msg_callback)
+            subscription.update_handler_name()
+        if self._startup is not None:
+            self._startup.async_subscribed(
+                subscription.device_uuid, started, time.perf_counter()
+            )
+
+        @callback
+        def async_unsubscribe() -> None:
+            """Remove the handler and drop the topic when unused."""
+            subscription.callbacks.remove(msg_callback)
+            subscription.update_handler_name()
+            if not subscription.callbacks and subscription.unsubscribe is not None:
+                self._async_remove_subscription(subscription)
+
+        return async_unsubscribe
+
+    @callback
+    def _async_remove_subscription(self, subscription: _TopicSubscription) -> None:
+        """Unsubscribe a topic from the broker."""
+        if self._subscriptions.get(subscription.topic) is subscription:
+            del self._subscriptions[subscription.topic]
+        self._mailbox.pop(subscription.topic, None)
+        if subscription.unsubscribe is not None:
+            subscription.unsubscribe()
+            subscription.unsubscribe = None
+
+    @callback
+    def _async_message_received(
+        self, subscription: _TopicSubscription, payload: str | bytes
+    ) -> None:
+        """Count the message and deliver or merge it."""
+        now = time.monotonic()
+        if now - self._window_start >= RATE_WINDOW:
+            self._async_update_rates(now)
+        self._window_count += 1
+        self._device_counts[subscription.device_uuid] += 1
+        self._service_counts[subscription.service] += 1
+        self._stats["received"] += 1
+        if self._device_listener is not None:
+            self._device_listener(subscription.device_uuid)
+        if self._export is not None and subscription.service in EXPORT_SERVICES:
+            # Every raw sample, including the ones merged away below
+            self._export.async_add(subscription.device_uuid, subscription.service, payload)
+
+        if subscription.mergeable and (
+            self._overloaded or subscription.device_uuid in self._overloaded_devices
+        ):
+            if subscription.topic in self._mailbox:
+                self._stats["merged"] += 1
+            elif len(self._mailbox) >= MAILBOX_SIZE:
+                # Drop the oldest pending sample rather than grow without bound
+                del self._mailbox[next(iter(self._mailbox))]
+                self._stats["dropped"] += 1
+            self._mailbox[subscription.topic] = (subscription, payload)
+            self._stats["peak_mailbox"] = max(self._stats["peak_mailbox"], len(self._mailbox))
+            if self._drain_handle is None:
+                self._drain_handle = self.hass.loop.call_later(
+                    DRAIN_INTERVAL, self._async_drain
+                )
+            return
+
+        # A direct delivery supersedes anything still waiting for this topic
+        if self._mailbox:
+            self._mailbox.pop(subscription.topic, None)
+        self._async_dispatch(subscription, payload)
+
+    @callback
+    def _async_update_rates(self, now: float) -> None:
+        """Enter or leave overload mode from the last window's rates."""
+        elapsed = now - self._window_start
+        rate = self._window_count / elapsed
+        self._stats["peak_rate"] = max(self._stats["peak_rate"], round(rate, 1))
+
+        if not self._overloaded and rate > self._global_limit:
+            self._overloaded = True
+            self._stats["overload_periods"] += 1
+            _LOGGER.warning(
+                "QUBO message rate %.0f/s exceeds %d/s, merging telemetry samples",
+                rate, self._global_limit
+            )
+        elif self._overloaded and rate < self._global_limit / 2:
+            self._overloaded = False
+            _LOGGER.info("QUBO message rate back to %.0f/s, leaving overload mode", rate)
+
+        device_limit = self._device_limit * elapsed
+        self._overloaded_devices = {
+            device_uuid
+            for device_uuid, count in self._device_counts.items()
+            if count > device_limit
+        }
+
+        self._window_start = now
+        self._window_count = 0
+        self._device_counts.clear()
+
+    @callback
+    def _async_drain(self) -> None:
+        """Deliver a batch of merged samples."""
+        self._drain_handle = None
+        for _ in range(min(DRAIN_BATCH, len(self._mailbox))):
+            topic = next(iter(self._mailbox))
+            subscription, payload = self._mailbox.pop(topic)
+            self._async_dispatch(subscription, payload)
+
+        if self._mailbox:
+            self._drain_handle = self.hass.loop.call_later(DRAIN_INTERVAL, self._async_drain)
+
+    @callback
+    def _async_dispatch(self, subscription: _TopicSubscription, payload: str | bytes) -> None:
+        """Decode a message and run every handler of its topic."""
+        if self._profiler is not None:
+            self._async_run_profiled(self._async_route, subscription, payload)
+            return
+        self._async_route(subscription, payload)
+
+    @callback
+    def _async_route(self, subscription: _TopicSubscription, payload: str | bytes) -> None:
+        """Decode a message inline or queue it for the worker."""
+        if self._worker is not None or self._batches_in_flight:
+            if not self._batch:
+                self.hass.loop.call_soon(self._async_submit_batch)
+            self._batch.append((subscription, payload))
+            return
+        self._async_decode(subscription, payload)
+
+    @callback
+    def _async_decode(self, subscription: _TopicSubscription, payload: str | bytes) -> None:
+        """Decode a payload on the event loop and deliver it."""
+        try:
+            state = decode_state(payload, subscription.service)
+        except (ValueError, AttributeError) as err:
+            self._async_decode_error(subscription, err)
+            return
+        self._async_deliver(subscription, state)
+
+    @callback
+    def _async_deliver(self, subscription: _TopicSubscription, state: dict[str, Any]) -> None:
+        """Run every handler of a topic with the decoded state."""
+        if (watchdog := self._watchdog) is None:
+            self._async_run_handlers(subscription, state)
+            return
+        started = time.perf_counter_ns()
+        self._async_run_handlers(subscription, state)
+        watchdog.async_record(subscription.handler_name, time.perf_counter_ns() - started)
+
+    @callback
+    def _async_run_handlers(self, subscription: _TopicSubscription, state: dict[str, Any]) -> None:
+        """Run the handlers, counting state they could not process."""
+        for msg_callback in list(subscription.callbacks):
+            try:
+                msg_callback(state)
+            except HANDLER_ERRORS as err:
+                self._errors.async_count(subscription.device_uuid, subscription.service, err)
+
+    @callback
+    def async_set_publish_rate(self, rate: float) -> None:
+        """Set the publish rate limit in commands per second."""
+        self._scheduler.async_set_rate(rate)
+
+    async def async_publish(
+        self,
+        topic: str,
+        payload: str,
+        qos: int = 1,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> None:
+        """Publish a command through the priority scheduler."""
+        if (startup := self._startup) is None:
+            await self._scheduler.async_publish(topic, payload, qos, priority)
+            return
+        started = time.perf_counter()
+        try:
+            await self._scheduler.async_publish(topic, payload, qos, priority)
+        finally:
+            # Control topics are /control/unit/device/service
+            parts = topic.split("/", 4)
+            startup.async_published(
+                parts[3] if len(parts) > 4 else topic, started, time.perf_counter()
+            )
+
+    async def _async_send(self, topic: str, payload: str, qos: int) -> None:
+        """Send a command to the broker, timing it when the watchdog is enabled."""
+        publish = self._transport.async_publish(topic, payload, qos)
+        if self._profiler is not None:
+            publish = _profiled(publish, self._profiler)
+        if (watchdog := self._watchdog) is None:
+            await publish
+            return
+        started = time.perf_counter_ns()
+        await publish
+        watchdog.async_record(
+            f"publish.{topic.rsplit('/', 1)[-1]}", time.perf_counter_ns() - started
+        )
+
+    @callback
+    def _async_decode_error(self, subscription: _TopicSubscription, err: Exception) -> None:
+        """Count a payload that could not be decoded."""
+        self._errors.async_count(subscription.device_uuid, subscription.service, err)
+
+    @callback
+    def _async_submit_batch(self) -> None:
+        """Hand the raw payloads collected this loop iteration to the worker."""
+        if self._worker is None:
+            # Worker was disabled while the batch was collected
+            self._async_decode_held()
+            return
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._stats["worker_batches"] += 1
+        self._batches_in_flight += 1
+        self._worker.submit(self._decode_batch, batch)
+
+    @callback
+    def _async_decode_held(self) -> None:
+        """Decode the collected payloads inline once no batch is in flight."""
+        if self._batches_in_flight:
+            # Decoded after the last batch delivered its older messages
+            return
+        batch, self._batch = self._batch, []
+        for subscription, payload in batch:
+            self._async_decode(subscription, payload)
+
+    def _decode_batch(self, batch: list[tuple[_TopicSubscription, str | bytes]]) -> None:
+        """Decode a batch in the worker thread and return it to the loop."""
+        results: list[tuple[_TopicSubscription, dict[str, Any] | Exception]] = []
+        try:
+            for subscription, payload in batch:
+                try:
+                    results.append((subscription, decode_state(payload, subscription.service)))
+                except (ValueError, AttributeError) as err:
+                    results.append((subscription, err))
+        finally:
+            # Always returned, held messages wait for it
+            self.hass.loop.call_soon_threadsafe(self._async_deliver_batch, results)
+
+    @callback
+    def _async_deliver_batch(
+        self, results: list[tuple[_TopicSubscription, dict[str, Any] | Exception]]
+    ) -> None:
+        """Run the handlers for a decoded batch in arrival order."""
+        self._batches_in_flight -= 1
+        if self._profiler is not None:
+            self._async_run_profiled(self._async_deliver_results, results)
+        else:
+            self._async_deliver_results(results)
+        if self._worker is None and not self._batches_in_flight:
+            self._async_decode_held()
+            self._async_retire_worker()
+
+    @callback
+    def _async_deliver_results(
+        self, results: list[tuple[_TopicSubscription, dict[str, Any] | Exception]]
+    ) -> None:
+        """Deliver decoded states and report decode errors."""
+        for subscription, state in results:
+            if isinstance(state, Exception):
+                self._async_decode_error(subscription, state)
+            else:
+                self._async_deliver(subscription, state)
+
+    @callback
+    def _async_run_profiled(self, func: Callable[..., None], *args: Any) -> None:
+        """Run part of the message path with the profiler enabled."""
+        profiler = self._profiler
+        if not _enable(profiler):
+            # Another profiler is active on the event loop thread
+            func(*args)
+            return
+        try:
+            func(*args)
+        finally:
+            profiler.disable()
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return router state for diagnostics."""
+        return {
+            "topics": len(self._subscriptions),
+            "overloaded": self._overloaded,
+            "overloaded_devices": len(self._overloaded_devices),
+            "global_limit": self._global_limit,
+            "device_limit": self._device_limit,
+            "mailbox": len(self._mailbox),
+            "decode_worker": self._worker is not None,
+            "watchdog": self._watchdog is not None,
+            "transport": self._transport.as_dict(),
+            **self._stats,
+            "errors": self._errors.as_dict(),
+            "publish": self._scheduler.as_dict(),
+        }
+
+    @callback
+    def as_metrics(self) -> dict[str, Any]:
+        """Return the counters and histograms exported as metrics."""
+        return {
+            "received": self._service_counts,
+            "merged": self._stats["merged"],
+            "dropped": self._stats["dropped"],
+            "overloaded": self._overloaded,
+            "mailbox": len(self._mailbox),
+            "payload_errors": self._errors.total,
+            "publish": self._scheduler.as_metrics(),
+        }
+
+
+@callback
+def async_get_router(hass: HomeAssistant) -> QuboMessageRouter:
+    """Return the shared message router, creating it on first use."""
+    if (router := hass.data.get(DATA_ROUTER)) is None:
+        router = hass.data[DATA_ROUTER] = QuboMessageRouter(hass)
+    return router
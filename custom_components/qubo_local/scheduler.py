@@ -0,0 +1,269 @@
+"""Priority publish scheduler for QUBO commands."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import Callable, Coroutine
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import Context, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DEFAULT_PUBLISH_RATE
+from .watchdog import DurationHistogram
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_AUTOMATION = 1
+PRIORITY_REFRESH = 2
+PRIORITY_NAMES = ("interactive", "automation", "refresh")
+
+# Queued commands per priority. Interactive and automation commands are
+# rejected when their queue is full, the oldest refresh is dropped instead.
+QUEUE_LIMITS = (100, 500, 2000)
+# Commands that may be sent back to back before the rate limit applies
+PUBLISH_BURST = 20
+# Publish latency bucket upper bounds in microseconds, queue wait included
+LATENCY_BOUNDS_US = (
+    1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000,
+    1_000_000, 2_500_000, 5_000_000, 10_000_000,
+)
+
+SendType = Callable[[str, str, int], Coroutine[Any, Any, None]]
+
+
+def command_priority(context: Context | None) -> int:
+    """Return the priority of an entity command from its service call context.
+
+    Commands issued by a logged-in user (dashboard, app, voice) carry a user
+    id, commands from automations and scripts do not.
+    """
+    if context is not None and context.user_id is not None:
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_AUTOMATION
+
+
+def _retrieve_exception(future: asyncio.Future[None]) -> None:
+    """Mark the failure of a command nobody waits for anymore as retrieved."""
+    if not future.cancelled():
+        future.exception()
+
+
+class _QueuedCommand:
+    """A command waiting for a publish slot."""
+
+    __slots__ = ("topic", "payload", "qos", "priority", "future", "queued_at", "waiters")
+
+    def __init__(
+        self, topic: str, payload: str, qos: int, priority: int, future: asyncio.Future[None]
+    ) -> None:
+        """Initialize the queued command."""
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.priority = priority
+        self.future = future
+        self.queued_at = time.monotonic()
+        # Callers waiting for the command, merged refreshes included
+        self.waiters = 0
+
+
+class QuboPublishScheduler:
+    """Rate-limit publishes to the broker and send the most urgent first.
+
+    Without a rate limit, which is the default, every command is sent at
+    once. With one, a token bucket limits the publish rate. While tokens are
+    available and nothing of the same or a higher priority is queued, a
+    command is sent at once. Otherwise it waits in the
+    queue of its priority and the queues are served strictly in priority
+    order, so a switch press overtakes any number of queued refreshes. A
+    refresh for a topic that already has one queued is merged into it. A
+    queued command is dropped when every caller waiting for it was cancelled.
+    """
+
+    def __init__(self, hass: HomeAssistant, send: SendType) -> None:
+        """Initialize the scheduler."""
+        self.hass = hass
+        self._send = send
+        self._rate = float(DEFAULT_PUBLISH_RATE)
+        self._tokens = float(PUBLISH_BURST)
+        self._refilled = time.monotonic()
+        self._queues: tuple[deque[_QueuedCommand], ...] = tuple(
+            deque() for _ in PRIORITY_NAMES
+        )
+        self._queued_refreshes: dict[str, _QueuedCommand] = {}
+        self._drain_handle: Any = None
+
+        self._stats = {
+            name: {
+                "sent": 0,
+                "queued": 0,
+                "merged": 0,
+                "dropped": 0,
+                "cancelled": 0,
+                "max_wait_ms": 0.0,
+            }
+            for name in PRIORITY_NAMES
+        }
+        # Time from the publish call until the broker accepted the command
+        self.latency = tuple(DurationHistogram(LATENCY_BOUNDS_US) for _ in PRIORITY_NAMES)
+
+    @callback
+    def async_set_rate(self, rate: float) -> None:
+        """Set the publish rate limit in commands per second, 0 for no limit."""
+        self._async_refill(time.monotonic())
+        self._rate = float(rate)
+        if self._drain_handle is not None:
+            # Drain at the new rate
+            self._drain_handle.cancel()
+            self._drain_handle = None
+            self._async_schedule_drain()
+
+    async def async_publish(self, topic: str, payload: str, qos: int, priority: int) -> None:
+        """Publish a command when its priority and the rate limit allow."""
+        now = time.monotonic()
+        self._async_refill(now)
+        stats = self._stats[PRIORITY_NAMES[priority]]
+        if not any(self._queues[: priority + 1]) and self._async_take_token():
+            stats["sent"] += 1
+            await self._send(topic, payload, qos)
+            self.latency[priority].record(int((time.monotonic() - now) * 1e9))
+            return
+
+        if priority == PRIORITY_REFRESH and (queued := self._queued_refreshes.get(topic)):
+            # The queued refresh requests the same data
+            stats["merged"] += 1
+            await self._async_wait(queued)
+            return
+
+        queue = self._queues[priority]
+        if len(queue) >= QUEUE_LIMITS[priority]:
+            if priority != PRIORITY_REFRESH:
+                raise HomeAssistantError(
+                    f"QUBO command queue is full, {topic} was not sent"
+                )
+            dropped = queue.popleft()
+            del self._queued_refreshes[dropped.topic]
+            dropped.future.set_result(None)
+            stats["dropped"] += 1
+            _LOGGER.debug("Refresh queue full, dropped the refresh for %s", dropped.topic)
+
+        command = _QueuedCommand(topic, payload, qos, priority, self.hass.loop.create_future())
+        queue.append(command)
+        if priority == PRIORITY_REFRESH:
+            self._queued_refreshes[topic] = command
+        stats["queued"] += 1
+        self._async_schedule_drain()
+        await self._async_wait(command)
+
+    async def _async_wait(self, command: _QueuedCommand) -> None:
+        """Wait until a queued command was sent, drop it if nobody waits anymore."""
+        command.waiters += 1
+        try:
+            await asyncio.shield(command.future)
+        except asyncio.CancelledError:
+            command.waiters -= 1
+            if not command.waiters:
+                self._async_cancel(command)
+            raise
+
+    @callback
+    def _async_cancel(self, command: _QueuedCommand) -> None:
+        """Remove a command without waiters from its queue."""
+        if command.future.done():
+            return
+        queue = self._queues[command.priority]
+        if command not in queue:
+            # Already being sent, a failure has nobody to go to
+            command.future.add_done_callback(_retrieve_exception)
+            return
+        queue.remove(command)
+        if command.priority == PRIORITY_REFRESH:
+            del self._queued_refreshes[command.topic]
+        command.future.cancel()
+        self._stats[PRIORITY_NAMES[command.priority]]["cancelled"] += 1
+        _LOGGER.debug("Dropped the cancelled command for %s", command.topic)
+
+    @callback
+    def _async_refill(self, now: float) -> None:
+        """Add the tokens earned since the last refill."""
+        self._tokens = min(PUBLISH_BURST, self._tokens + (now - self._refilled) * self._rate)
+        self._refilled = now
+
+    @callback
+    def _async_take_token(self) -> bool:
+        """Take a token for a publish, always possible without a rate limit."""
+        if not self._rate:
+            return True
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    @callback
+    def _async_schedule_drain(self) -> None:
+        """Drain the queues once the next token is available."""
+        if self._drain_handle is None:
+            delay = max(0.0, (1 - self._tokens) / self._rate) if self._rate else 0.0
+            self._drain_handle = self.hass.loop.call_at(
+                self.hass.loop.time() + delay, self._async_drain
+            )
+
+    @callback
+    def _async_drain(self) -> None:
+        """Send queued commands, highest priority first, while tokens last."""
+        self._drain_handle = None
+        now = time.monotonic()
+        self._async_refill(now)
+        for priority, queue in enumerate(self._queues):
+            stats = self._stats[PRIORITY_NAMES[priority]]
+            while queue and self._async_take_token():
+                command = queue.popleft()
+                if priority == PRIORITY_REFRESH:
+                    del self._queued_refreshes[command.topic]
+                stats["sent"] += 1
+                stats["max_wait_ms"] = max(
+                    stats["max_wait_ms"], round((now - command.queued_at) * 1000, 1)
+                )
+                self.hass.async_create_background_task(
+                    self._async_send_queued(command), "qubo_local publish"
+                )
+        if any(self._queues):
+            self._async_schedule_drain()
+
+    async def _async_send_queued(self, command: _QueuedCommand) -> None:
+        """Send a queued command and resolve its waiters."""
+        try:
+            await self._send(command.topic, command.payload, command.qos)
+        except Exception as err:  # noqa: BLE001 - handed to the waiting caller
+            if not command.future.done():
+                command.future.set_exception(err)
+            return
+        self.latency[command.priority].record(
+            int((time.monotonic() - command.queued_at) * 1e9)
+        )
+        if not command.future.done():
+            command.future.set_result(None)
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return scheduler state for diagnostics."""
+        return {
+            "rate": self._rate or None,
+            "burst": PUBLISH_BURST,
+            "queued": {
+                name: len(queue) for name, queue in zip(PRIORITY_NAMES, self._queues, strict=True)
+            },
+            **{name: dict(stats) for name, stats in self._stats.items()},
+        }
+
+    @callback
+    def as_metrics(self) -> dict[str, Any]:
+        """Return the counters and latency histograms per priority."""
+        return {
+            name: {**self._stats[name], "latency": self.latency[priority]}
+            for priority, name in enumerate(PRIORITY_NAMES)
+        }
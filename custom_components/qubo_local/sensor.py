@@ -1,19 +1,22 @@
 """Sensor platform for QUBO Local Control integration."""
 from __future__ import annotations
 
-import json
+from dataclasses import dataclass, replace
 import logging
+import time
 from typing import Any
 
-from homeassistant.components import mqtt
 from homeassistant.components.sensor import (
+    RestoreSensor,
     SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    EntityCategory,
     UnitOfElectricCurrent,
     UnitOfElectricPotential,
     UnitOfEnergy,
@@ -21,32 +24,120 @@ from homeassistant.const import (
     UnitOfTime,
 )
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import area_registry as ar
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
+from .aggregate import (
+    GROUP_FLEET,
+    GROUP_UNIT,
+    AggregateGroup,
+    async_get_aggregate_tracker,
+)
 from .const import (
     CONF_DEVICE_TYPE,
     CONF_DEVICE_UUID,
-    CONF_HANDLE_NAME,
-    CONF_UNIT_UUID,
+    DEFAULT_STATISTICS_STATE_INTERVAL,
     DEVICE_TYPE_AIR_PURIFIER,
+    DEVICE_TYPE_FLEET,
     DEVICE_TYPE_SMART_PLUG,
     DOMAIN,
     ENTITY_CURRENT,
     ENTITY_ENERGY,
     ENTITY_FILTER_LIFE,
+    ENTITY_LOOP_LAG,
     ENTITY_PM25,
     ENTITY_POWER,
+    ENTITY_SLOWEST_HANDLER,
+    ENTITY_TOTAL_ENERGY,
+    ENTITY_TOTAL_POWER,
     ENTITY_VOLTAGE,
-    TOPIC_CONTROL_AQI_REFRESH,
-    TOPIC_CONTROL_FILTER_STATUS,
-    TOPIC_MONITOR_AQI,
-    TOPIC_MONITOR_ENERGY,
-    TOPIC_MONITOR_FILTER,
+    FLEET_UNIQUE_ID,
+    METER_DAILY,
+    METER_HOURLY,
+    SIGNAL_AGGREGATE_GROUP_ADDED,
 )
+from .devicestate import DeviceState, async_get_device_states
+from .meter import QuboConsumptionMeter
+from .watchdog import QuboWatchdog
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True, kw_only=True)
+class QuboSensorEntityDescription(SensorEntityDescription):
+    """Describes a QUBO device sensor."""
+
+    # Attribute of the device's DeviceState the sensor shows
+    field: str
+    # Power and energy, which feed the long-term statistics in statistics mode
+    metered: bool = False
+
+
+PLUG_SENSORS: tuple[QuboSensorEntityDescription, ...] = (
+    QuboSensorEntityDescription(
+        key=ENTITY_POWER,
+        name="Power",
+        field="power",
+        device_class=SensorDeviceClass.POWER,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfPower.WATT,
+        metered=True,
+    ),
+    QuboSensorEntityDescription(
+        key=ENTITY_VOLTAGE,
+        name="Voltage",
+        field="voltage",
+        device_class=SensorDeviceClass.VOLTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfElectricPotential.VOLT,
+    ),
+    QuboSensorEntityDescription(
+        key=ENTITY_CURRENT,
+        name="Current",
+        field="current",
+        device_class=SensorDeviceClass.CURRENT,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfElectricCurrent.AMPERE,
+    ),
+    QuboSensorEntityDescription(
+        key=ENTITY_ENERGY,
+        name="Energy",
+        field="consumption",
+        device_class=SensorDeviceClass.ENERGY,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        native_unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+        metered=True,
+    ),
+)
+
+# In statistics mode the feed owns the long-term statistics of power and energy
+PLUG_STATISTICS_SENSORS: tuple[QuboSensorEntityDescription, ...] = tuple(
+    replace(description, state_class=None) if description.metered else description
+    for description in PLUG_SENSORS
+)
+
+PURIFIER_SENSORS: tuple[QuboSensorEntityDescription, ...] = (
+    QuboSensorEntityDescription(
+        key=ENTITY_PM25,
+        name="PM2.5",
+        field="pm25",
+        device_class=SensorDeviceClass.PM25,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    ),
+    QuboSensorEntityDescription(
+        key=ENTITY_FILTER_LIFE,
+        name="Filter Life",
+        field="filter_life",
+        icon="mdi:air-filter",
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.HOURS,
+    ),
+)
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
@@ -56,334 +147,285 @@ async def async_setup_entry(
     data = hass.data[DOMAIN][config_entry.entry_id]
     device_info = data["device_info"]
     config = data["config"]
+    statistics_feed = data.get("statistics")
 
-    device_uuid = config[CONF_DEVICE_UUID]
-    unit_uuid = config[CONF_UNIT_UUID]
-    device_type = config.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG)
+    if config.get(CONF_DEVICE_TYPE) == DEVICE_TYPE_FLEET:
+        # Fleet aggregate sensors, added as units and areas appear
+        @callback
+        def async_add_group(group: AggregateGroup) -> None:
+            """Add total power and energy sensors for a new group."""
+            async_add_entities(
+                [
+                    QuboAggregateSensor(hass, device_info, group, ENTITY_TOTAL_POWER),
+                    QuboAggregateSensor(hass, device_info, group, ENTITY_TOTAL_ENERGY),
+                ]
+            )
+
+        for group in async_get_aggregate_tracker(hass).groups:
+            async_add_group(group)
+        config_entry.async_on_unload(
+            async_dispatcher_connect(hass, SIGNAL_AGGREGATE_GROUP_ADDED, async_add_group)
+        )
 
-    sensors = []
+        if (watchdog := data.get("watchdog")) is not None:
+            async_add_entities(
+                [
+                    QuboWatchdogSensor(device_info, watchdog, ENTITY_LOOP_LAG),
+                    QuboWatchdogSensor(device_info, watchdog, ENTITY_SLOWEST_HANDLER),
+                ]
+            )
+        return
 
-    if device_type == DEVICE_TYPE_AIR_PURIFIER:
-        # Air Purifier sensors
-        aqi_topic = TOPIC_MONITOR_AQI.format(
-            unit_uuid=unit_uuid, device_uuid=device_uuid
-        )
-        filter_topic = TOPIC_MONITOR_FILTER.format(
-            unit_uuid=unit_uuid, device_uuid=device_uuid
-        )
+    device_uuid = config[CONF_DEVICE_UUID]
+    device = async_get_device_states(hass).devices[device_uuid]
 
+    if config.get(CONF_DEVICE_TYPE, DEVICE_TYPE_SMART_PLUG) == DEVICE_TYPE_AIR_PURIFIER:
+        sensors: list[SensorEntity] = [
+            QuboDeviceSensor(description, device_info, device)
+            for description in PURIFIER_SENSORS
+        ]
+    elif statistics_feed is None:
         sensors = [
-            QuboAQISensor(
-                hass,
-                config_entry,
-                device_info,
-                config,
-                aqi_topic,
-            ),
-            QuboFilterSensor(
-                hass,
-                config_entry,
-                device_info,
-                config,
-                filter_topic,
-            ),
+            QuboDeviceSensor(description, device_info, device)
+            for description in PLUG_SENSORS
         ]
     else:
-        # Smart Plug sensors
-        monitor_topic = TOPIC_MONITOR_ENERGY.format(
-            unit_uuid=unit_uuid, device_uuid=device_uuid
-        )
-
         sensors = [
-            QuboEnergySensor(
-                hass,
-                config_entry,
-                device_info,
-                config,
-                monitor_topic,
-                ENTITY_POWER,
-                "Power",
-                SensorDeviceClass.POWER,
-                UnitOfPower.WATT,
-                "power",
-            ),
-            QuboEnergySensor(
-                hass,
-                config_entry,
-                device_info,
-                config,
-                monitor_topic,
-                ENTITY_VOLTAGE,
-                "Voltage",
-                SensorDeviceClass.VOLTAGE,
-                UnitOfElectricPotential.VOLT,
-                "voltage",
-            ),
-            QuboEnergySensor(
-                hass,
-                config_entry,
-                device_info,
-                config,
-                monitor_topic,
-                ENTITY_CURRENT,
-                "Current",
-                SensorDeviceClass.CURRENT,
-                UnitOfElectricCurrent.AMPERE,
-                "current",
-            ),
-            QuboEnergySensor(
-                hass,
-                config_entry,
-                device_info,
-                config,
-                monitor_topic,
-                ENTITY_ENERGY,
-                "Energy",
-                SensorDeviceClass.ENERGY,
-                UnitOfEnergy.KILO_WATT_HOUR,
-                "consumption",
-            ),
+            QuboStatisticsSensor(description, device_info, device)
+            if description.metered
+            else QuboDeviceSensor(description, device_info, device)
+            for description in PLUG_STATISTICS_SENSORS
         ]
 
+    # Optional consumption per period, in place of utility_meter helpers
+    if (meter := data.get("meter")) is not None:
+        sensors.extend(
+            QuboMeterSensor(device_info, device_uuid, meter, period)
+            for period in meter.buckets
+        )
+
     async_add_entities(sensors)
 
 
-class QuboEnergySensor(SensorEntity):
-    """Representation of a QUBO energy monitoring sensor."""
+class QuboDeviceSensor(SensorEntity):
+    """A value of a device, read from the shared device state store.
+
+    The store decodes the device's readings once and calls the sensor back
+    with the fields they set. The sensor only keeps its shared description
+    and the device's entry in the store.
+    """
 
+    entity_description: QuboSensorEntityDescription
     _attr_has_entity_name = True
+    _attr_should_poll = False
 
     def __init__(
         self,
-        hass: HomeAssistant,
-        config_entry: ConfigEntry,
-        device_info,
-        config: dict[str, Any],
-        monitor_topic: str,
-        entity_id: str,
-        name: str,
-        device_class: SensorDeviceClass,
-        unit: str,
-        data_key: str,
+        description: QuboSensorEntityDescription,
+        device_info: DeviceInfo,
+        device: DeviceState,
     ) -> None:
-        """Initialize the QUBO sensor."""
-        self.hass = hass
-        self._config_entry = config_entry
+        """Initialize the sensor."""
+        self.entity_description = description
         self._attr_device_info = device_info
-        self._config = config
-        self._monitor_topic = monitor_topic
-        self._data_key = data_key
-
-        device_uuid = config[CONF_DEVICE_UUID]
-        self._attr_unique_id = f"{device_uuid}_{entity_id}"
-        # Energy sensors need TOTAL_INCREASING, others use MEASUREMENT
-        if device_class == SensorDeviceClass.ENERGY:
-            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
-        else:
-            self._attr_state_class = SensorStateClass.MEASUREMENT
-        self._attr_name = name
-        self._attr_device_class = device_class
-        self._attr_native_unit_of_measurement = unit
-        self._attr_native_value = None
+        self._device = device
 
-    async def async_added_to_hass(self) -> None:
-        """Subscribe to MQTT topics when added to hass."""
+    @property
+    def unique_id(self) -> str:
+        """Return the unique ID, e.g. <device uuid>_power."""
+        return f"{self._device.device_uuid}_{self.entity_description.key}"
 
-        @callback
-        def message_received(msg):
-            """Handle new MQTT messages."""
-            try:
-                payload = json.loads(msg.payload)
-                _LOGGER.debug("Received energy data: %s", payload)
-
-                # Extract energy metrics from the response
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                metering_service = services.get("plugMetering", {})
-                events = metering_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-
-                value = state_changed.get(self._data_key)
-
-                if value is not None:
-                    # Convert string to float
-                    numeric_value = float(value)
-
-                    # Convert current from mA to A
-                    if self._data_key == "current":
-                        numeric_value = numeric_value / 1000.0
-
-                    self._attr_native_value = round(numeric_value, 3)
-                    self.async_write_ha_state()
-                    _LOGGER.debug(
-                        "%s updated to: %s %s",
-                        self._attr_name,
-                        self._attr_native_value,
-                        self._attr_native_unit_of_measurement,
-                    )
-
-            except (json.JSONDecodeError, KeyError, ValueError) as err:
-                _LOGGER.error("Error processing energy data: %s", err)
-
-        # Subscribe to monitor topic
-        await mqtt.async_subscribe(
-            self.hass, self._monitor_topic, message_received, 1
+    @property
+    def native_value(self) -> float | int | None:
+        """Return the latest value, metering values rounded to 3 decimals."""
+        value = getattr(self._device, self.entity_description.field)
+        if isinstance(value, float):
+            return round(value, 3)
+        return value
+
+    async def async_added_to_hass(self) -> None:
+        """Follow the readings of the device."""
+        self.async_on_remove(
+            async_get_device_states(self.hass).async_add_reading_listener(
+                self._device, self._async_reading_received
+            )
         )
 
+    @callback
+    def _async_reading_received(self, fields: tuple[str, ...]) -> None:
+        """Write the state when a reading set the sensor's field."""
+        if self.entity_description.field in fields:
+            self.async_write_ha_state()
 
-class QuboAQISensor(SensorEntity):
-    """Representation of a QUBO Air Purifier PM2.5 sensor."""
 
-    _attr_has_entity_name = True
-    _attr_state_class = SensorStateClass.MEASUREMENT
-    _attr_device_class = SensorDeviceClass.PM25
-    _attr_native_unit_of_measurement = CONCENTRATION_MICROGRAMS_PER_CUBIC_METER
-    _attr_name = "PM2.5"
+class QuboStatisticsSensor(QuboDeviceSensor):
+    """A power or energy sensor in statistics mode, written at a low rate.
+
+    The long-term statistics get every sample from the device state store
+    directly, so the states table only needs an occasional state.
+    """
 
     def __init__(
         self,
-        hass: HomeAssistant,
-        config_entry: ConfigEntry,
-        device_info,
-        config: dict[str, Any],
-        monitor_topic: str,
+        description: QuboSensorEntityDescription,
+        device_info: DeviceInfo,
+        device: DeviceState,
     ) -> None:
-        """Initialize the QUBO AQI sensor."""
-        self.hass = hass
-        self._config_entry = config_entry
-        self._attr_device_info = device_info
-        self._config = config
-        self._monitor_topic = monitor_topic
+        """Initialize the sensor."""
+        super().__init__(description, device_info, device)
+        self._last_write = float("-inf")
+
+    @callback
+    def _async_reading_received(self, fields: tuple[str, ...]) -> None:
+        """Write the state at most once per statistics state interval."""
+        if self.entity_description.field not in fields:
+            return
+        now = time.monotonic()
+        if now - self._last_write < DEFAULT_STATISTICS_STATE_INTERVAL:
+            return
+        self._last_write = now
+        self.async_write_ha_state()
 
-        device_uuid = config[CONF_DEVICE_UUID]
-        self._attr_unique_id = f"{device_uuid}_{ENTITY_PM25}"
-        self._attr_native_value = None
+
+class QuboMeterSensor(SensorEntity):
+    """Energy used by a smart plug in the current hour, day or month."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_device_class = SensorDeviceClass.ENERGY
+    _attr_state_class = SensorStateClass.TOTAL
+    _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
+
+    def __init__(
+        self, device_info, device_uuid: str, meter: QuboConsumptionMeter, period: str
+    ) -> None:
+        """Initialize the meter sensor."""
+        self._attr_device_info = device_info
+        self._bucket = meter.buckets[period]
+        self._meter = meter
+        self._attr_unique_id = f"{device_uuid}_{ENTITY_ENERGY}_{period}"
+        if period == METER_HOURLY:
+            self._attr_name = "Hourly Energy"
+        elif period == METER_DAILY:
+            self._attr_name = "Daily Energy"
+        else:
+            self._attr_name = "Monthly Energy"
+        self._attr_native_value = round(self._bucket.value, 3)
+        self._attr_last_reset = self._bucket.start
 
     async def async_added_to_hass(self) -> None:
-        """Subscribe to MQTT topics when added to hass."""
+        """Listen for bucket updates."""
+        self.async_on_remove(self._meter.async_add_listener(self._async_bucket_updated))
 
-        @callback
-        def message_received(msg):
-            """Handle new MQTT messages."""
-            try:
-                payload = json.loads(msg.payload)
-                _LOGGER.debug("Received AQI data: %s", payload)
-
-                # Extract PM2.5 from the response
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                aqi_service = services.get("aqiStatus", {})
-                events = aqi_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-
-                pm25_value = state_changed.get("PM25")
-
-                if pm25_value is not None:
-                    self._attr_native_value = int(pm25_value)
-                    self.async_write_ha_state()
-                    _LOGGER.debug("PM2.5 updated to: %s", self._attr_native_value)
-
-            except (json.JSONDecodeError, KeyError, ValueError) as err:
-                _LOGGER.error("Error processing AQI data: %s", err)
-
-        # Subscribe to monitor topic
-        await mqtt.async_subscribe(
-            self.hass, self._monitor_topic, message_received, 1
-        )
+    @callback
+    def _async_bucket_updated(self) -> None:
+        """Write the state when the rounded value or the period changed."""
+        value = round(self._bucket.value, 3)
+        if (value, self._bucket.start) == (self._attr_native_value, self._attr_last_reset):
+            return
+        self._attr_native_value = value
+        self._attr_last_reset = self._bucket.start
+        self.async_write_ha_state()
 
 
-class QuboFilterSensor(SensorEntity):
-    """Representation of a QUBO Air Purifier filter life sensor."""
+class QuboAggregateSensor(RestoreSensor):
+    """Total power or energy of all smart plugs in a unit or area."""
 
     _attr_has_entity_name = True
-    _attr_state_class = SensorStateClass.MEASUREMENT
-    _attr_native_unit_of_measurement = UnitOfTime.HOURS
-    _attr_name = "Filter Life"
-    _attr_icon = "mdi:air-filter"
+    _attr_should_poll = False
 
     def __init__(
         self,
         hass: HomeAssistant,
-        config_entry: ConfigEntry,
         device_info,
-        config: dict[str, Any],
-        monitor_topic: str,
+        group: AggregateGroup,
+        entity_id: str,
     ) -> None:
-        """Initialize the QUBO filter sensor."""
+        """Initialize the aggregate sensor."""
         self.hass = hass
-        self._config_entry = config_entry
         self._attr_device_info = device_info
-        self._config = config
-        self._monitor_topic = monitor_topic
+        self._group = group
+        self._is_power = entity_id == ENTITY_TOTAL_POWER
 
-        self._device_uuid = config[CONF_DEVICE_UUID]
-        self._unit_uuid = config[CONF_UNIT_UUID]
-        self._handle_name = config[CONF_HANDLE_NAME]
-
-        self._attr_unique_id = f"{self._device_uuid}_{ENTITY_FILTER_LIFE}"
-        self._attr_native_value = None
+        self._attr_unique_id = f"{FLEET_UNIQUE_ID}_{group.kind}_{group.key}_{entity_id}"
+        if self._is_power:
+            self._attr_device_class = SensorDeviceClass.POWER
+            self._attr_state_class = SensorStateClass.MEASUREMENT
+            self._attr_native_unit_of_measurement = UnitOfPower.WATT
+        else:
+            self._attr_device_class = SensorDeviceClass.ENERGY
+            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+            self._attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
 
-        # Topic for requesting filter status
-        self._control_topic = TOPIC_CONTROL_FILTER_STATUS.format(
-            unit_uuid=self._unit_uuid, device_uuid=self._device_uuid
-        )
+        if group.kind == GROUP_FLEET:
+            label = "Total"
+        elif group.kind == GROUP_UNIT:
+            label = f"Unit {group.key[:8]}"
+        else:
+            area = ar.async_get(hass).async_get_area(group.key)
+            label = area.name if area else group.key
+        self._attr_name = f"{label} {'Power' if self._is_power else 'Energy'}"
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the running total."""
+        if self._is_power:
+            if not self._group.reporting:
+                return None
+            return round(self._group.power, 1)
+        return round(self._group.energy, 3)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Return the number of plugs currently contributing power."""
+        if self._is_power:
+            return {"reporting_plugs": self._group.reporting}
+        return None
 
     async def async_added_to_hass(self) -> None:
-        """Subscribe to MQTT topics when added to hass."""
+        """Restore the energy total and listen for group updates."""
+        if not self._is_power and not self._group.energy_restored:
+            # Deltas only start after setup, so continue from the last total
+            if (last := await self.async_get_last_sensor_data()) is not None:
+                if last.native_value is not None:
+                    self._group.energy += float(last.native_value)
+            self._group.energy_restored = True
 
-        @callback
-        def message_received(msg):
-            """Handle new MQTT messages."""
-            try:
-                payload = json.loads(msg.payload)
-                _LOGGER.debug("Received filter data: %s", payload)
-
-                # Extract filter time remaining from the response
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                filter_service = services.get("filterReset", {})
-                events = filter_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-
-                time_remaining = state_changed.get("timeRemaining")
-
-                if time_remaining is not None:
-                    # Value is already in hours
-                    self._attr_native_value = int(time_remaining)
-                    self.async_write_ha_state()
-                    _LOGGER.debug("Filter life updated to: %s hours", self._attr_native_value)
-
-            except (json.JSONDecodeError, KeyError, ValueError) as err:
-                _LOGGER.error("Error processing filter data: %s", err)
-
-        # Subscribe to monitor topic
-        await mqtt.async_subscribe(
-            self.hass, self._monitor_topic, message_received, 1
-        )
+        self.async_on_remove(self._group.async_add_listener(self.async_write_ha_state))
 
-        # Request initial filter status
-        await self._request_filter_status()
-
-    async def _request_filter_status(self) -> None:
-        """Request filter status from the device."""
-        payload = json.dumps({
-            "command": {
-                "devices": {
-                    "deviceUUID": self._device_uuid,
-                    "handleName": self._handle_name,
-                    "services": {
-                        "filterReset": {
-                            "commands": {
-                                "getCurrentStatus": {
-                                    "instanceId": 0,
-                                    "parameters": {}
-                                }
-                            }
-                        }
-                    }
-                }
-            }
-        })
-
-        await mqtt.async_publish(self.hass, self._control_topic, payload, qos=1)
-        _LOGGER.debug("Requested filter status")
+
+class QuboWatchdogSensor(SensorEntity):
+    """Worst event loop lag or handler duration of the last 30 seconds."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+
+    def __init__(self, device_info, watchdog: QuboWatchdog, entity_id: str) -> None:
+        """Initialize the watchdog sensor."""
+        self._attr_device_info = device_info
+        self._watchdog = watchdog
+        self._is_loop_lag = entity_id == ENTITY_LOOP_LAG
+        self._attr_unique_id = f"{FLEET_UNIQUE_ID}_{entity_id}"
+        self._attr_name = "Loop Lag" if self._is_loop_lag else "Slowest Handler"
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the worst value of the last window."""
+        if self._is_loop_lag:
+            return self._watchdog.loop_lag_ms
+        return self._watchdog.slowest_handler_ms
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Return the handler that took longest."""
+        if self._is_loop_lag:
+            return None
+        return {"handler": self._watchdog.slowest_handler}
+
+    async def async_added_to_hass(self) -> None:
+        """Listen for watchdog window updates."""
+        self.async_on_remove(self._watchdog.async_add_listener(self.async_write_ha_state))
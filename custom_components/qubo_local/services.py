@@ -0,0 +1,133 @@
+"""Services for the QUBO Local Control integration."""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import logging
+from pathlib import Path
+import pstats
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+from .provision import async_import_devices
+from .router import async_get_router
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_PROFILE = "profile"
+SERVICE_IMPORT_DEVICES = "import_devices"
+
+ATTR_SECONDS = "seconds"
+ATTR_TOP = "top"
+ATTR_SORT = "sort"
+ATTR_MANIFEST = "manifest"
+
+SORT_KEYS = {
+    "tottime": pstats.SortKey.TIME,
+    "cumulative": pstats.SortKey.CUMULATIVE,
+    "calls": pstats.SortKey.CALLS,
+}
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_SECONDS, default=60): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=3600)
+        ),
+        vol.Optional(ATTR_TOP, default=15): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+        vol.Optional(ATTR_SORT, default="tottime"): vol.In(list(SORT_KEYS)),
+    }
+)
+
+IMPORT_DEVICES_SCHEMA = vol.Schema({vol.Required(ATTR_MANIFEST): cv.string})
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the integration services."""
+
+    async def async_profile(call: ServiceCall) -> ServiceResponse:
+        """Profile the QUBO message and publish paths for a while."""
+        router = async_get_router(hass)
+        if router.profiling:
+            raise HomeAssistantError("A QUBO profile is already running")
+
+        profiler = cProfile.Profile()
+        seconds = call.data[ATTR_SECONDS]
+        _LOGGER.info("Profiling QUBO message handlers for %.0f seconds", seconds)
+        router.async_set_profiler(profiler)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            router.async_set_profiler(None)
+
+        path = Path(
+            hass.config.path(f"qubo_local_profile_{dt_util.utcnow():%Y%m%d_%H%M%S}.prof")
+        )
+        summary = await hass.async_add_executor_job(
+            _write_profile, profiler, path, call.data[ATTR_SORT], call.data[ATTR_TOP]
+        )
+        _LOGGER.info("QUBO profile written to %s", path)
+        return {"file": str(path), "seconds": seconds, **summary}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        async_profile,
+        schema=PROFILE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_import(call: ServiceCall) -> ServiceResponse:
+        """Add the new devices of a JSON or CSV manifest."""
+        return await async_import_devices(hass, call.data[ATTR_MANIFEST])
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_IMPORT_DEVICES,
+        async_import,
+        schema=IMPORT_DEVICES_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+
+def _write_profile(
+    profiler: cProfile.Profile, path: Path, sort: str, top: int
+) -> dict[str, Any]:
+    """Dump the profile as pstats and return its top entries."""
+    profiler.dump_stats(path)
+    if not profiler.getstats():
+        return {"total_time_ms": 0.0, "functions": []}
+
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(SORT_KEYS[sort])
+    functions = []
+    for func in stats.fcn_list:
+        filename, line, name = func
+        if "_lsprof.Profiler" in name:
+            # The profiler's own enable and disable calls
+            continue
+        if len(functions) >= top:
+            break
+        _, calls, tottime, cumtime, _ = stats.stats[func]
+        functions.append(
+            {
+                "function": f"{Path(filename).name}:{line}({name})",
+                "calls": calls,
+                "total_ms": round(tottime * 1000, 3),
+                "cumulative_ms": round(cumtime * 1000, 3),
+            }
+        )
+    return {"total_time_ms": round(stats.total_tt * 1000, 3), "functions": functions}
@@ -0,0 +1,204 @@
+"""Phase timing of QUBO config entry setup."""
+from __future__ import annotations
+
+from collections.abc import Generator
+from contextlib import contextmanager
+import statistics
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DATA_STARTUP
+from .router import async_get_router
+
+PHASE_DEVICE_INFO = "device_info"
+PHASE_PLATFORM_FORWARD = "platform_forward"
+PHASE_SUBSCRIPTIONS = "subscriptions"
+PHASE_INITIAL_PUBLISHES = "initial_publishes"
+PHASES = (
+    PHASE_DEVICE_INFO,
+    PHASE_PLATFORM_FORWARD,
+    PHASE_SUBSCRIPTIONS,
+    PHASE_INITIAL_PUBLISHES,
+)
+
+# Publishes that start this long after the setup began count as its initial
+# publishes, which covers the first refresh 5 seconds in and its queueing
+INITIAL_PUBLISH_WINDOW = 30.0  # seconds
+# Slowest entries listed in the fleet summary
+SLOWEST_LIMIT = 10
+
+
+class _PhaseSpan:
+    """The steps of one phase, from the first start to the last end."""
+
+    __slots__ = ("start", "end", "count")
+
+    def __init__(self, start: float, end: float) -> None:
+        """Initialize the span with its first step."""
+        self.start = start
+        self.end = end
+        self.count = 1
+
+    def add(self, start: float, end: float) -> None:
+        """Widen the span by another step."""
+        self.start = min(self.start, start)
+        self.end = max(self.end, end)
+        self.count += 1
+
+
+class QuboSetupTiming:
+    """Phase timing of one device entry's setup.
+
+    Each phase is kept as the span from the start of its first step to the
+    end of its last one, with the number of steps. The router adds the
+    subscriptions made until the setup finished and the publishes sent
+    shortly after it began, so those two phases overlap the others.
+    """
+
+    def __init__(self, device_uuid: str, name: str) -> None:
+        """Initialize the timing, the setup starts now."""
+        self.device_uuid = device_uuid
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self._phases: dict[str, _PhaseSpan] = {}
+
+    @property
+    def duration(self) -> float | None:
+        """Return the seconds the setup took, None while it runs."""
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @callback
+    def async_record(self, phase: str, start: float, end: float) -> None:
+        """Add a step of a phase, with perf_counter times."""
+        if (span := self._phases.get(phase)) is None:
+            self._phases[phase] = _PhaseSpan(start, end)
+        else:
+            span.add(start, end)
+
+    @contextmanager
+    def phase(self, phase: str) -> Generator[None]:
+        """Time the enclosed step as part of a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.async_record(phase, start, time.perf_counter())
+
+    @callback
+    def async_finish(self) -> None:
+        """Mark the setup as finished."""
+        self.finished = time.perf_counter()
+
+    def phase_end(self, phase: str) -> float | None:
+        """Return the seconds from the start of the setup to the end of a phase."""
+        if (span := self._phases.get(phase)) is None:
+            return None
+        return span.end - self.started
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the phases in milliseconds from the start of the setup."""
+        duration = self.duration
+        return {
+            "total_ms": None if duration is None else round(duration * 1_000, 1),
+            "phases": {
+                phase: {
+                    "start_ms": round((span.start - self.started) * 1_000, 1),
+                    "end_ms": round((span.end - self.started) * 1_000, 1),
+                    "steps": span.count,
+                }
+                for phase in PHASES
+                if (span := self._phases.get(phase)) is not None
+            },
+        }
+
+
+class QuboStartupTimings:
+    """Setup timings of every device entry.
+
+    The router reports each subscribe and publish with the device of its
+    topic. Subscriptions count towards an entry until its setup finished,
+    publishes while they start within the initial window. The fleet
+    summary shows the time from the first setup starting to the last one
+    finishing, and how far into their setup the entries got through each
+    phase.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the timings."""
+        self.hass = hass
+        self._entries: dict[str, QuboSetupTiming] = {}
+        self._devices: dict[str, QuboSetupTiming] = {}
+
+    @callback
+    def async_begin(self, entry_id: str, device_uuid: str, name: str) -> QuboSetupTiming:
+        """Start timing the setup of an entry."""
+        if (previous := self._entries.get(entry_id)) is not None:
+            self._devices.pop(previous.device_uuid, None)
+        timing = self._entries[entry_id] = QuboSetupTiming(device_uuid, name)
+        self._devices[device_uuid] = timing
+        return timing
+
+    @callback
+    def async_remove(self, entry_id: str) -> None:
+        """Forget the timing of an unloaded entry."""
+        if (timing := self._entries.pop(entry_id, None)) is not None:
+            if self._devices.get(timing.device_uuid) is timing:
+                del self._devices[timing.device_uuid]
+
+    @callback
+    def async_subscribed(self, device_uuid: str, start: float, end: float) -> None:
+        """Record a subscription made for a device."""
+        if (timing := self._devices.get(device_uuid)) is not None and timing.finished is None:
+            timing.async_record(PHASE_SUBSCRIPTIONS, start, end)
+
+    @callback
+    def async_published(self, device_uuid: str, start: float, end: float) -> None:
+        """Record a command sent to a device."""
+        if (
+            timing := self._devices.get(device_uuid)
+        ) is not None and start - timing.started < INITIAL_PUBLISH_WINDOW:
+            timing.async_record(PHASE_INITIAL_PUBLISHES, start, end)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the fleet summary for diagnostics."""
+        timings = list(self._entries.values())
+        finished = [timing for timing in timings if timing.finished is not None]
+        phases: dict[str, Any] = {}
+        for phase in PHASES:
+            ends = [end for timing in timings if (end := timing.phase_end(phase)) is not None]
+            if ends:
+                phases[phase] = {
+                    "entries": len(ends),
+                    "end_p50_ms": round(statistics.median(ends) * 1_000, 1),
+                    "end_max_ms": round(max(ends) * 1_000, 1),
+                }
+        wall_clock = None
+        if finished:
+            wall_clock = max(timing.finished for timing in finished) - min(
+                timing.started for timing in finished
+            )
+        slowest = sorted(finished, key=lambda timing: timing.duration, reverse=True)
+        return {
+            "entries": len(timings),
+            "setting_up": len(timings) - len(finished),
+            "wall_clock_ms": None if wall_clock is None else round(wall_clock * 1_000, 1),
+            "phases": phases,
+            "slowest": [
+                {"name": timing.name, "total_ms": round(timing.duration * 1_000, 1)}
+                for timing in slowest[:SLOWEST_LIMIT]
+            ],
+        }
+
+
+@callback
+def async_get_startup_timings(hass: HomeAssistant) -> QuboStartupTimings:
+    """Return the shared startup timings, handing them to the router on first use."""
+    if (timings := hass.data.get(DATA_STARTUP)) is None:
+        timings = hass.data[DATA_STARTUP] = QuboStartupTimings(hass)
+        async_get_router(hass).async_set_startup_timings(timings)
+    return timings
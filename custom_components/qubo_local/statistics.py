@@ -0,0 +1,231 @@
+"""Long-term statistics feed for QUBO Smart Plug energy monitoring."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import logging
+from typing import Any
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+)
+from homeassistant.const import UnitOfEnergy, UnitOfPower
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_utc_time_change
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+# The running period is written at most this often
+SAVE_DELAY = 300  # seconds
+
+
+class QuboStatisticsFeed:
+    """Aggregate metering samples per hour and import them as external statistics.
+
+    Power is reduced to mean/min/max and consumption to a running sum, so the
+    recorder only stores one row per statistic per hour instead of a state row
+    for every metering sample.
+
+    The running period is saved with a delay instead of being imported when
+    Home Assistant stops. A restart within the same hour carries on with it,
+    so the hour is imported once, complete, and a period left over from
+    before a longer restart is imported when the feed starts again.
+    """
+
+    def __init__(self, hass: HomeAssistant, device_uuid: str, device_name: str) -> None:
+        """Initialize the statistics feed."""
+        self.hass = hass
+        self._device_name = device_name
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.statistics.{device_uuid}"
+        )
+
+        object_id = slugify(device_uuid)
+        self.power_statistic_id = f"{DOMAIN}:{object_id}_power"
+        self.energy_statistic_id = f"{DOMAIN}:{object_id}_energy"
+
+        self._period_start: datetime | None = None
+        self._unsub_timer: CALLBACK_TYPE | None = None
+
+        # Power aggregate for the current period
+        self._power_count = 0
+        self._power_total = 0.0
+        self._power_min: float | None = None
+        self._power_max: float | None = None
+
+        # Consumption counter state
+        self._last_consumption: float | None = None
+        self._energy_sum = 0.0
+        self._energy_dirty = False
+
+    async def async_start(self) -> None:
+        """Restore the running period and start the hourly flush timer."""
+        if (stored := await self._store.async_load()) is not None:
+            self._async_restore(stored)
+        else:
+            await self._async_restore_last_statistics()
+
+        # Flush shortly after every hour boundary even when no samples arrive
+        self._unsub_timer = async_track_utc_time_change(
+            self.hass, self._async_hour_elapsed, minute=0, second=10
+        )
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop the timer and save the running period."""
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        self._store.async_delay_save(self._data_to_save, 0)
+
+    async def _async_restore_last_statistics(self) -> None:
+        """Restore the consumption sum from the last imported statistics."""
+        last = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics,
+            self.hass,
+            1,
+            self.energy_statistic_id,
+            True,
+            {"state", "sum"},
+        )
+        if rows := last.get(self.energy_statistic_id):
+            self._energy_sum = rows[0].get("sum") or 0.0
+            self._last_consumption = rows[0].get("state")
+            _LOGGER.debug(
+                "Restored energy statistics for %s: sum=%s, state=%s",
+                self._device_name, self._energy_sum, self._last_consumption
+            )
+
+    @callback
+    def _async_restore(self, stored: dict[str, Any]) -> None:
+        """Carry on with the saved period, import it if its hour has passed."""
+        self._last_consumption = stored.get("last_consumption")
+        self._energy_sum = stored.get("energy_sum", 0.0)
+        if (start := stored.get("period_start")) is None:
+            return
+
+        self._period_start = dt_util.parse_datetime(start)
+        self._power_count = stored.get("power_count", 0)
+        self._power_total = stored.get("power_total", 0.0)
+        self._power_min = stored.get("power_min")
+        self._power_max = stored.get("power_max")
+        self._energy_dirty = stored.get("energy_dirty", False)
+        _LOGGER.debug(
+            "Restored statistics period %s for %s (%d power samples)",
+            self._period_start, self._device_name, self._power_count
+        )
+        self._async_hour_elapsed(dt_util.utcnow())
+
+    @callback
+    def async_add_sample(self, data_key: str, value: float) -> None:
+        """Add a decoded plugMetering value to the current period."""
+        period_start = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)
+        if self._period_start != period_start:
+            self._async_flush()
+            self._period_start = period_start
+
+        if data_key == "power":
+            self._power_count += 1
+            self._power_total += value
+            if self._power_min is None or value < self._power_min:
+                self._power_min = value
+            if self._power_max is None or value > self._power_max:
+                self._power_max = value
+        elif data_key == "consumption":
+            if self._last_consumption is not None:
+                if value >= self._last_consumption:
+                    self._energy_sum += value - self._last_consumption
+                else:
+                    # Device counter was reset, count from zero like TOTAL_INCREASING
+                    self._energy_sum += value
+            self._last_consumption = value
+            self._energy_dirty = True
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _async_hour_elapsed(self, now: datetime) -> None:
+        """Flush the previous period once the hour has passed."""
+        if self._period_start is not None and now - self._period_start >= timedelta(hours=1):
+            self._async_flush()
+            self._period_start = None
+
+    @callback
+    def _async_flush(self) -> None:
+        """Import the aggregated period into the recorder."""
+        if self._period_start is None:
+            return
+
+        if self._power_count:
+            async_add_external_statistics(
+                self.hass,
+                StatisticMetaData(
+                    has_mean=True,
+                    has_sum=False,
+                    name=f"{self._device_name} Power",
+                    source=DOMAIN,
+                    statistic_id=self.power_statistic_id,
+                    unit_of_measurement=UnitOfPower.WATT,
+                ),
+                [
+                    StatisticData(
+                        start=self._period_start,
+                        mean=self._power_total / self._power_count,
+                        min=self._power_min,
+                        max=self._power_max,
+                    )
+                ],
+            )
+
+        if self._energy_dirty:
+            async_add_external_statistics(
+                self.hass,
+                StatisticMetaData(
+                    has_mean=False,
+                    has_sum=True,
+                    name=f"{self._device_name} Energy",
+                    source=DOMAIN,
+                    statistic_id=self.energy_statistic_id,
+                    unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+                ),
+                [
+                    StatisticData(
+                        start=self._period_start,
+                        state=self._last_consumption,
+                        sum=self._energy_sum,
+                    )
+                ],
+            )
+
+        _LOGGER.debug(
+            "Imported statistics for %s period %s (%d power samples)",
+            self._device_name, self._period_start, self._power_count
+        )
+
+        self._power_count = 0
+        self._power_total = 0.0
+        self._power_min = None
+        self._power_max = None
+        self._energy_dirty = False
+        # Saved right away, so a restart never imports the period a second time
+        self._store.async_delay_save(self._data_to_save, 0)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return the running period to save."""
+        return {
+            "period_start": self._period_start.isoformat() if self._period_start else None,
+            "power_count": self._power_count,
+            "power_total": self._power_total,
+            "power_min": self._power_min,
+            "power_max": self._power_max,
+            "last_consumption": self._last_consumption,
+            "energy_sum": self._energy_sum,
+            "energy_dirty": self._energy_dirty,
+        }
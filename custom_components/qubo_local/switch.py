@@ -1,16 +1,15 @@
 """Switch platform for QUBO Local Control integration."""
 from __future__ import annotations
 
-import json
 import logging
 from typing import Any
 
-from homeassistant.components import mqtt
 from homeassistant.components.switch import SwitchEntity
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
+from .codec import build_switch_command
 from .const import (
     CONF_DEVICE_TYPE,
     CONF_DEVICE_UUID,
@@ -22,6 +21,8 @@ from .const import (
     TOPIC_CONTROL_SWITCH,
     TOPIC_MONITOR_SWITCH,
 )
+from .router import async_get_router
+from .scheduler import command_priority
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +44,30 @@ async def async_setup_entry(
     async_add_entities([QuboSwitch(hass, config_entry, device_info, config)])
 
 
+async def async_send_power_command(
+    hass: HomeAssistant, config_entry: ConfigEntry, power_state: str, priority: int
+) -> None:
+    """Switch a plug through its command tracker, like its switch entity does.
+
+    The switch entity shows the command at once and rolls it back if it is
+    not confirmed. Without the entity, e.g. when it is disabled, the command
+    is still confirmed and retried.
+    """
+    data = hass.data[DOMAIN][config_entry.entry_id]
+    if (switch_command := data.get("switch_command")) is not None:
+        await switch_command(power_state, priority)
+        return
+    config = data["config"]
+    await data["commands"].async_send(
+        TOPIC_CONTROL_SWITCH.format(
+            unit_uuid=config[CONF_UNIT_UUID], device_uuid=config[CONF_DEVICE_UUID]
+        ),
+        build_switch_command(config[CONF_DEVICE_UUID], config[CONF_ENTITY_UUID], power_state),
+        {"power": power_state},
+        priority,
+    )
+
+
 class QuboSwitch(SwitchEntity):
     """Representation of a QUBO Smart Plug switch."""
 
@@ -57,10 +82,7 @@ class QuboSwitch(SwitchEntity):
         config: dict[str, Any],
     ) -> None:
         """Initialize the QUBO switch."""
-        self.hass = hass
-        self._config_entry = config_entry
         self._attr_device_info = device_info
-        self._config = config
 
         self._device_uuid = config[CONF_DEVICE_UUID]
         self._entity_uuid = config[CONF_ENTITY_UUID]
@@ -68,6 +90,9 @@ class QuboSwitch(SwitchEntity):
 
         self._attr_unique_id = f"{self._device_uuid}_{ENTITY_SWITCH}"
         self._attr_is_on = False
+        self._reported_is_on = False
+        self._data = hass.data[DOMAIN][config_entry.entry_id]
+        self._commands = self._data["commands"]
 
         # MQTT topics
         self._control_topic = TOPIC_CONTROL_SWITCH.format(
@@ -81,30 +106,32 @@ class QuboSwitch(SwitchEntity):
         """Subscribe to MQTT topics when added to hass."""
 
         @callback
-        def message_received(msg):
+        def message_received(state_changed: dict[str, Any]) -> None:
             """Handle new MQTT messages."""
-            try:
-                payload = json.loads(msg.payload)
-                _LOGGER.debug("Received switch state: %s", payload)
-
-                # Extract power state from the response
-                devices = payload.get("devices", {})
-                services = devices.get("services", {})
-                switch_service = services.get("lcSwitchControl", {})
-                events = switch_service.get("events", {})
-                state_changed = events.get("stateChanged", {})
-                power_state = state_changed.get("power")
-
-                if power_state is not None:
-                    self._attr_is_on = power_state.lower() == "on"
-                    self.async_write_ha_state()
-                    _LOGGER.debug("Switch state updated to: %s", self._attr_is_on)
-
-            except (json.JSONDecodeError, KeyError) as err:
-                _LOGGER.error("Error processing switch state: %s", err)
+            _LOGGER.debug("Received switch state: %s", state_changed)
+            pending = self._commands.async_echo(self._monitor_topic, state_changed)
+
+            power_state = state_changed.get("power")
+
+            if power_state is not None:
+                self._reported_is_on = power_state.lower() == "on"
+                if pending:
+                    # Keep showing the command until it is confirmed or rolled back
+                    return
+                self._attr_is_on = self._reported_is_on
+                self.async_write_ha_state()
+                _LOGGER.debug("Switch state updated to: %s", self._attr_is_on)
 
         # Subscribe to monitor topic
-        await mqtt.async_subscribe(self.hass, self._monitor_topic, message_received, 1)
+        self.async_on_remove(
+            await async_get_router(self.hass).async_subscribe(
+                self._monitor_topic, message_received, 1
+            )
+        )
+
+        # Commands from load shedding go through the entity as well
+        self._data["switch_command"] = self._async_send_power
+        self.async_on_remove(lambda: self._data.pop("switch_command", None))
 
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the switch on."""
@@ -116,22 +143,26 @@ class QuboSwitch(SwitchEntity):
 
     async def _publish_command(self, power_state: str) -> None:
         """Publish MQTT command to control the switch."""
-        payload = json.dumps(
-            {
-                "command": {
-                    "devices": {
-                        "deviceUUID": self._device_uuid,
-                        "entityUUID": self._entity_uuid,
-                        "services": {
-                            "lcSwitchControl": {
-                                "attributes": {"power": power_state},
-                                "instanceId": 0,
-                            }
-                        },
-                    }
-                }
-            }
+        await self._async_send_power(power_state, command_priority(self._context))
+
+    async def _async_send_power(self, power_state: str, priority: int) -> None:
+        """Send a power command with a priority through the command tracker."""
+        # Optimistic update, confirmed by the echo or rolled back
+        self._attr_is_on = power_state == "on"
+        self.async_write_ha_state()
+
+        payload = build_switch_command(self._device_uuid, self._entity_uuid, power_state)
+        await self._commands.async_send(
+            self._control_topic,
+            payload,
+            {"power": power_state},
+            priority,
+            self._async_rollback,
         )
-
-        await mqtt.async_publish(self.hass, self._control_topic, payload, qos=1)
         _LOGGER.debug("Published switch command: %s to %s", power_state, self._control_topic)
+
+    @callback
+    def _async_rollback(self) -> None:
+        """Show the last reported state again after an unconfirmed command."""
+        self._attr_is_on = self._reported_is_on
+        self.async_write_ha_state()
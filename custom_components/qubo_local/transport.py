@@ -0,0 +1,710 @@
+"""Broker transports for the QUBO message router."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from contextlib import suppress
+import itertools
+import logging
+import random
+from typing import Any
+import uuid
+import zlib
+
+from homeassistant.components import mqtt
+from homeassistant.components.mqtt.models import ReceiveMessage
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util.ssl import client_context, get_default_no_verify_context
+
+from . import packets
+from .const import (
+    CONF_BROKER,
+    CONF_BROKER_PASSWORD,
+    CONF_BROKER_PORT,
+    CONF_BROKER_PROTOCOL,
+    CONF_BROKER_SHARE_GROUP,
+    CONF_BROKER_TLS,
+    CONF_BROKER_USERNAME,
+    DEFAULT_BROKER_PORT,
+    MQTT_PROTOCOL_5,
+    TLS_INSECURE,
+    TLS_OFF,
+)
+from .errors import async_get_error_reporter
+
+_LOGGER = logging.getLogger(__name__)
+
+KEEPALIVE = 60  # seconds
+CONNECT_TIMEOUT = 10  # seconds
+PUBLISH_TIMEOUT = 10  # seconds until an unacknowledged QoS 1 publish fails
+RECONNECT_MIN = 1.0  # seconds
+RECONNECT_MAX = 60.0  # seconds
+# Topics per SUBSCRIBE or UNSUBSCRIBE packet
+SUBSCRIBE_BATCH = 200
+# Topic aliases the broker may use for the messages it sends over MQTT 5
+TOPIC_ALIAS_MAXIMUM = 4096
+# Unsent bytes above which forwarded QoS 0 messages are dropped
+FORWARD_BUFFER = 1024 * 1024
+
+# Raised when a connection attempt fails or an established connection drops
+CONNECTION_ERRORS = (
+    OSError, TimeoutError, asyncio.IncompleteReadError, packets.MqttProtocolError
+)
+
+PayloadCallbackType = Callable[[str | bytes], None]
+MessageCallbackType = Callable[[str, bytes], None]
+StatusCallbackType = Callable[[bool], None]
+
+
+class _UnsupportedVersion(packets.MqttProtocolError):
+    """The broker does not speak MQTT 5."""
+
+
+def _describe(err: Exception) -> str:
+    """Return a short reason for a connection error."""
+    if isinstance(err, asyncio.IncompleteReadError):
+        return "connection closed by the broker"
+    return str(err) or type(err).__name__
+
+
+class QuboTransport:
+    """Carry monitor messages and commands between the router and a broker.
+
+    The router subscribes each topic once with a single callback that takes
+    the raw payload, so a transport does not need to share subscriptions or
+    match wildcards.
+    """
+
+    name = ""
+
+    @property
+    def connected(self) -> bool:
+        """Return whether the broker can be reached."""
+        raise NotImplementedError
+
+    async def async_subscribe(
+        self, topic: str, payload_callback: PayloadCallbackType, qos: int
+    ) -> CALLBACK_TYPE:
+        """Subscribe a callback to the raw payloads of a topic."""
+        raise NotImplementedError
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Publish a command."""
+        raise NotImplementedError
+
+    @callback
+    def async_subscribe_connection_status(
+        self, status_callback: StatusCallbackType
+    ) -> CALLBACK_TYPE:
+        """Call back with the new state whenever the broker connection changes."""
+        raise NotImplementedError
+
+    @callback
+    def async_start(self) -> None:
+        """Start connecting."""
+
+    async def async_stop(self) -> None:
+        """Close the broker connections."""
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return transport state for diagnostics."""
+        return {"name": self.name, "connected": self.connected}
+
+
+class QuboMqttIntegrationTransport(QuboTransport):
+    """Use the client of Home Assistant's MQTT integration."""
+
+    name = "mqtt"
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the transport."""
+        self.hass = hass
+
+    @property
+    def connected(self) -> bool:
+        """Return whether the MQTT integration is connected."""
+        try:
+            return mqtt.is_connected(self.hass)
+        except KeyError:
+            return False
+
+    async def async_subscribe(
+        self, topic: str, payload_callback: PayloadCallbackType, qos: int
+    ) -> CALLBACK_TYPE:
+        """Subscribe through the MQTT integration."""
+
+        @callback
+        def message_received(msg: ReceiveMessage) -> None:
+            """Hand the payload to the router."""
+            payload_callback(msg.payload)
+
+        return await mqtt.async_subscribe(self.hass, topic, message_received, qos)
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Publish through the MQTT integration."""
+        await mqtt.async_publish(self.hass, topic, payload, qos=qos)
+
+    @callback
+    def async_subscribe_connection_status(
+        self, status_callback: StatusCallbackType
+    ) -> CALLBACK_TYPE:
+        """Follow the connection of the MQTT integration."""
+        return mqtt.async_subscribe_connection_status(self.hass, status_callback)
+
+
+class _QuboMqttConnection:
+    """One client connection to the broker that reconnects on its own.
+
+    Subscriptions are remembered and sent again on every new session.
+    Subscribes and unsubscribes made in the same event-loop iteration are
+    sent together in as few packets as possible.
+
+    Over MQTT 5, the broker may replace the topic of the messages it sends
+    with a topic alias. Commands are published with aliases too: a topic
+    gets one the second time it is published, while the broker's alias
+    limit allows, and keeps it for the session. Brokers often allow only a
+    few aliases, and handing them around in turn would cost more than it
+    saves when refreshes cycle through every device. A broker that rejects
+    MQTT 5 is connected to with MQTT 3.1.1 from then on.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        settings: dict[str, Any],
+        client_id: str,
+        status_changed: Callable[[], None],
+        unmatched: MessageCallbackType | None = None,
+    ) -> None:
+        """Initialize the connection.
+
+        unmatched receives the topic and payload of the messages whose topic
+        has no callback of its own, such as those of wildcard subscriptions.
+        """
+        self.hass = hass
+        self.client_id = client_id
+        self._settings = settings
+        self._status_changed = status_changed
+        self._unmatched = unmatched
+        self._errors = async_get_error_reporter(hass)
+        self.connected = False
+
+        # Protocol level of the sessions, an MQTT 5 fallback is kept
+        self._protocol: int = settings["protocol"]
+        # $share/<group>/ while the broker supports shared subscriptions
+        self._share_prefix = ""
+        # Topic -> alias sent with commands, and topics published once
+        self._aliases: dict[str, int] = {}
+        self._published_topics: set[str] = set()
+        self._alias_maximum = 0
+        # Alias -> topic of the messages the broker sends
+        self._inbound_aliases: dict[int, str] = {}
+
+        self._handlers: dict[str, tuple[PayloadCallbackType, int]] = {}
+        self._pending_subscribe: dict[str, int] = {}
+        self._pending_unsubscribe: set[str] = set()
+        self._flush_handle: asyncio.Handle | None = None
+        self._packet_ids = itertools.cycle(range(1, 65536))
+        self._inflight: dict[int, asyncio.Future[None]] = {}
+
+        self._task: asyncio.Task[None] | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._last_received = 0.0
+        self._stats: dict[str, Any] = {
+            "connects": 0,
+            "connect_failures": 0,
+            "disconnects": 0,
+            "received": 0,
+            "published": 0,
+            "forward_dropped": 0,
+            "aliased_received": 0,
+            "aliased_published": 0,
+            "refused_topics": 0,
+            "last_error": None,
+        }
+
+    @callback
+    def async_start(self) -> None:
+        """Start connecting in the background."""
+        self._task = self.hass.async_create_background_task(
+            self._async_run(), f"qubo_local mqtt {self.client_id}"
+        )
+
+    async def async_stop(self) -> None:
+        """Disconnect and stop reconnecting."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _async_run(self) -> None:
+        """Connect, read until the connection drops and reconnect with backoff."""
+        delay = RECONNECT_MIN
+        while True:
+            try:
+                reader = await self._async_connect()
+            except CONNECTION_ERRORS as err:
+                self._stats["connect_failures"] += 1
+                self._stats["last_error"] = _describe(err)
+                _LOGGER.debug(
+                    "QUBO connection %s failed: %s", self.client_id, self._stats["last_error"]
+                )
+            else:
+                delay = RECONNECT_MIN
+                try:
+                    await self._async_read(reader)
+                except CONNECTION_ERRORS as err:
+                    self._stats["last_error"] = _describe(err)
+                    _LOGGER.warning(
+                        "QUBO connection %s to the broker lost: %s",
+                        self.client_id,
+                        self._stats["last_error"],
+                    )
+                finally:
+                    self._async_disconnected()
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    async def _async_handshake(
+        self, protocol: int
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, dict[int, int]]:
+        """Open a connection and return it with the CONNACK properties."""
+        settings = self._settings
+        async with asyncio.timeout(CONNECT_TIMEOUT):
+            reader, writer = await asyncio.open_connection(
+                settings["host"], settings["port"], ssl=settings["ssl"]
+            )
+            try:
+                writer.write(
+                    packets.connect(
+                        self.client_id,
+                        KEEPALIVE,
+                        settings["username"],
+                        settings["password"],
+                        protocol,
+                        TOPIC_ALIAS_MAXIMUM,
+                    )
+                )
+                try:
+                    header, body = await packets.read_packet(reader)
+                except asyncio.IncompleteReadError as err:
+                    if protocol == packets.PROTOCOL_LEVEL_5:
+                        # Some MQTT 3.1.1 brokers hang up on an unknown version
+                        raise _UnsupportedVersion from err
+                    raise
+                code, properties = packets.parse_connack(header, body, protocol)
+                if protocol == packets.PROTOCOL_LEVEL_5 and (
+                    code in packets.CONNACK_UNSUPPORTED_VERSION
+                ):
+                    raise _UnsupportedVersion
+                if code:
+                    raise packets.MqttProtocolError(
+                        f"Broker refused the connection with code {code}"
+                    )
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer, properties
+
+    async def _async_connect(self) -> asyncio.StreamReader:
+        """Open the connection and start a clean session."""
+        try:
+            reader, writer, properties = await self._async_handshake(self._protocol)
+        except _UnsupportedVersion:
+            _LOGGER.info(
+                "Broker does not support MQTT 5, %s falls back to MQTT 3.1.1", self.client_id
+            )
+            self._protocol = packets.PROTOCOL_LEVEL_311
+            reader, writer, properties = await self._async_handshake(self._protocol)
+
+        # Aliases only last for one session
+        self._aliases.clear()
+        self._published_topics.clear()
+        self._inbound_aliases.clear()
+        self._alias_maximum = properties.get(packets.PROPERTY_TOPIC_ALIAS_MAXIMUM, 0)
+        self._share_prefix = ""
+        if group := self._settings["share_group"]:
+            if self._protocol == packets.PROTOCOL_LEVEL_5 and properties.get(
+                packets.PROPERTY_SHARED_SUBSCRIPTION_AVAILABLE, 1
+            ):
+                self._share_prefix = f"$share/{group}/"
+            else:
+                _LOGGER.info(
+                    "Broker does not support shared subscriptions, %s subscribes directly",
+                    self.client_id,
+                )
+
+        self._writer = writer
+        self._last_received = self.hass.loop.time()
+        self.connected = True
+        self._stats["connects"] += 1
+        _LOGGER.debug("QUBO connection %s established", self.client_id)
+
+        # A clean session starts without subscriptions
+        self._pending_unsubscribe.clear()
+        self._pending_subscribe = {topic: qos for topic, (_, qos) in self._handlers.items()}
+        self._async_flush()
+        self._status_changed()
+        return reader
+
+    async def _async_read(self, reader: asyncio.StreamReader) -> None:
+        """Dispatch packets from the broker until the connection drops."""
+        pinger = self.hass.async_create_background_task(
+            self._async_ping(), f"qubo_local mqtt ping {self.client_id}"
+        )
+        loop = self.hass.loop
+        handlers = self._handlers
+        inbound_aliases = self._inbound_aliases
+        v5 = self._protocol == packets.PROTOCOL_LEVEL_5
+        try:
+            while True:
+                header, body = await packets.read_packet(reader)
+                self._last_received = loop.time()
+                kind = header & 0xF0
+                if kind == packets.PUBLISH:
+                    if not v5:
+                        topic, packet_id, payload = packets.parse_publish(header, body)
+                    else:
+                        topic, packet_id, payload, alias = packets.parse_publish_v5(header, body)
+                        if alias:
+                            if topic:
+                                inbound_aliases[alias] = topic
+                            elif (topic := inbound_aliases.get(alias)) is not None:
+                                self._stats["aliased_received"] += 1
+                            else:
+                                raise packets.MqttProtocolError(f"Unknown topic alias {alias}")
+                    if packet_id:
+                        self._writer.write(packets.puback(packet_id))
+                    self._stats["received"] += 1
+                    if (handler := handlers.get(topic)) is not None:
+                        try:
+                            handler[0](payload)
+                        except Exception as err:  # noqa: BLE001 - counted like payload errors
+                            self._errors.async_count_topic(topic, err)
+                    elif self._unmatched is not None:
+                        self._unmatched(topic, payload)
+                elif kind == packets.PUBACK:
+                    future = self._inflight.pop(packets.packet_id(body), None)
+                    if future is not None and not future.done():
+                        future.set_result(None)
+                elif kind == packets.SUBACK:
+                    codes = packets.parse_suback(body, self._protocol)
+                    if refused := sum(code >= packets.SUBACK_FAILURE for code in codes):
+                        self._stats["refused_topics"] += refused
+                        _LOGGER.warning(
+                            "Broker refused %d QUBO subscriptions on %s", refused, self.client_id
+                        )
+        finally:
+            pinger.cancel()
+
+    async def _async_ping(self) -> None:
+        """Keep the connection alive and drop it when the broker went silent."""
+        while True:
+            await asyncio.sleep(KEEPALIVE / 2)
+            if self.hass.loop.time() - self._last_received > KEEPALIVE * 1.5:
+                _LOGGER.warning("QUBO broker stopped answering on %s", self.client_id)
+                self._writer.close()
+                return
+            self._writer.write(packets.PINGREQ_PACKET)
+
+    @callback
+    def _async_disconnected(self) -> None:
+        """Fail the waiting publishes and report the disconnect."""
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            if not writer.is_closing():
+                writer.write(packets.DISCONNECT_PACKET)
+            writer.close()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for future in self._inflight.values():
+            if not future.done():
+                future.set_exception(HomeAssistantError("Connection to the MQTT broker lost"))
+        self._inflight.clear()
+        if self.connected:
+            self.connected = False
+            self._stats["disconnects"] += 1
+            self._status_changed()
+
+    @callback
+    def async_subscribe(
+        self, topic: str, payload_callback: PayloadCallbackType, qos: int
+    ) -> CALLBACK_TYPE:
+        """Subscribe a topic now or on the next connect."""
+        self._handlers[topic] = (payload_callback, qos)
+        if self.connected:
+            self._pending_unsubscribe.discard(topic)
+            self._pending_subscribe[topic] = qos
+            self._async_schedule_flush()
+
+        @callback
+        def async_unsubscribe() -> None:
+            """Forget the topic and unsubscribe it from the broker."""
+            if self._handlers.get(topic, (None,))[0] is not payload_callback:
+                return
+            del self._handlers[topic]
+            if self.connected and self._pending_subscribe.pop(topic, None) is None:
+                self._pending_unsubscribe.add(topic)
+                self._async_schedule_flush()
+
+        return async_unsubscribe
+
+    @callback
+    def _async_schedule_flush(self) -> None:
+        """Send the collected subscription changes at the end of this iteration."""
+        if self._flush_handle is None:
+            self._flush_handle = self.hass.loop.call_soon(self._async_flush)
+
+    @callback
+    def _async_flush(self) -> None:
+        """Send the collected subscribes and unsubscribes."""
+        self._flush_handle = None
+        if self._writer is None:
+            return
+        prefix = self._share_prefix
+        unsubscribes = [prefix + topic for topic in self._pending_unsubscribe]
+        self._pending_unsubscribe.clear()
+        for start in range(0, len(unsubscribes), SUBSCRIBE_BATCH):
+            self._writer.write(
+                packets.unsubscribe(
+                    next(self._packet_ids),
+                    unsubscribes[start : start + SUBSCRIBE_BATCH],
+                    self._protocol,
+                )
+            )
+        subscribes = [(prefix + topic, qos) for topic, qos in self._pending_subscribe.items()]
+        self._pending_subscribe.clear()
+        for start in range(0, len(subscribes), SUBSCRIBE_BATCH):
+            self._writer.write(
+                packets.subscribe(
+                    next(self._packet_ids),
+                    subscribes[start : start + SUBSCRIBE_BATCH],
+                    self._protocol,
+                    self._settings.get("no_local", False),
+                )
+            )
+
+    @callback
+    def _async_alias(self, topic: str) -> tuple[str, int]:
+        """Return the topic and alias to publish with, 0 for no alias."""
+        aliases = self._aliases
+        if (alias := aliases.get(topic)) is not None:
+            self._stats["aliased_published"] += 1
+            return "", alias
+        if len(aliases) < self._alias_maximum:
+            if topic in self._published_topics:
+                # Published before, set up the alias with the full topic
+                self._published_topics.discard(topic)
+                alias = aliases[topic] = len(aliases) + 1
+                return topic, alias
+            self._published_topics.add(topic)
+        return topic, 0
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Publish a command and wait for the broker to accept QoS 1."""
+        if (writer := self._writer) is None:
+            raise HomeAssistantError(f"Not connected to the MQTT broker, {topic} was not sent")
+        data = payload.encode() if isinstance(payload, str) else payload
+        self._stats["published"] += 1
+        topic_name, alias = topic, 0
+        if self._alias_maximum:
+            topic_name, alias = self._async_alias(topic)
+        if not qos:
+            writer.write(packets.publish(topic_name, data, 0, 0, self._protocol, alias))
+            await writer.drain()
+            return
+        packet_id = next(self._packet_ids)
+        future = self._inflight[packet_id] = self.hass.loop.create_future()
+        writer.write(packets.publish(topic_name, data, 1, packet_id, self._protocol, alias))
+        try:
+            async with asyncio.timeout(PUBLISH_TIMEOUT):
+                await writer.drain()
+                await future
+        except TimeoutError as err:
+            raise HomeAssistantError(
+                f"MQTT broker did not acknowledge {topic} within {PUBLISH_TIMEOUT} s"
+            ) from err
+        except (OSError, RuntimeError) as err:
+            raise HomeAssistantError(f"Publishing {topic} failed: {err}") from err
+        finally:
+            self._inflight.pop(packet_id, None)
+
+    @callback
+    def async_forward(self, topic: str, payload: bytes) -> None:
+        """Publish a QoS 0 message without waiting for the write buffer.
+
+        The message is dropped while disconnected or when the broker does
+        not keep up with the messages already forwarded.
+        """
+        writer = self._writer
+        if writer is None or writer.transport.get_write_buffer_size() > FORWARD_BUFFER:
+            self._stats["forward_dropped"] += 1
+            return
+        self._stats["published"] += 1
+        topic_name, alias = topic, 0
+        if self._alias_maximum:
+            topic_name, alias = self._async_alias(topic)
+        writer.write(packets.publish(topic_name, payload, 0, 0, self._protocol, alias))
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return connection state for diagnostics."""
+        return {
+            "client_id": self.client_id,
+            "connected": self.connected,
+            "protocol": "5" if self._protocol == packets.PROTOCOL_LEVEL_5 else "3.1.1",
+            "topic_alias_maximum": self._alias_maximum,
+            "shared_subscriptions": bool(self._share_prefix),
+            "topics": len(self._handlers),
+            "inflight": len(self._inflight),
+            **self._stats,
+        }
+
+
+class QuboDirectTransport(QuboTransport):
+    """Connect to the broker directly instead of through the MQTT integration.
+
+    The integration opens its own connections, so QUBO traffic does not share
+    the MQTT integration's client with other integrations and each message
+    is handed to its single router callback by an exact topic lookup. With
+    more than one connection, devices are spread across them by the hash of
+    their unit UUID, and commands for a unit go out on the connection that
+    receives its messages. Each connection reconnects with exponential
+    backoff and subscribes its topics again. The transport counts as
+    connected while all connections are. With a share group, the
+    connections subscribe as members of an MQTT 5 shared subscription, so
+    other consumers in the group split the messages with this instance.
+    """
+
+    name = "direct"
+
+    def __init__(
+        self, hass: HomeAssistant, settings: dict[str, Any], connections: int
+    ) -> None:
+        """Initialize the transport.
+
+        settings holds host, port, username, password, tls, protocol and
+        share_group.
+        """
+        self.hass = hass
+        self._settings = settings
+        prefix = f"qubo_local_{uuid.uuid4().hex[:8]}"
+        self._connections = [
+            _QuboMqttConnection(hass, settings, f"{prefix}_{index}", self._async_status_changed)
+            for index in range(connections)
+        ]
+        self._status_callbacks: list[StatusCallbackType] = []
+        self._connected = False
+
+    @property
+    def connected(self) -> bool:
+        """Return whether every connection is up."""
+        return self._connected
+
+    def _connection_for(self, topic: str) -> _QuboMqttConnection:
+        """Return the connection that carries a /monitor or /control topic."""
+        if len(self._connections) == 1:
+            return self._connections[0]
+        parts = topic.split("/", 3)
+        unit_uuid = parts[2] if len(parts) > 3 else topic
+        return self._connections[zlib.crc32(unit_uuid.encode()) % len(self._connections)]
+
+    async def async_subscribe(
+        self, topic: str, payload_callback: PayloadCallbackType, qos: int
+    ) -> CALLBACK_TYPE:
+        """Subscribe on the connection of the topic's unit."""
+        return self._connection_for(topic).async_subscribe(topic, payload_callback, qos)
+
+    async def async_publish(self, topic: str, payload: str, qos: int) -> None:
+        """Publish on the connection of the topic's unit."""
+        await self._connection_for(topic).async_publish(topic, payload, qos)
+
+    @callback
+    def async_subscribe_connection_status(
+        self, status_callback: StatusCallbackType
+    ) -> CALLBACK_TYPE:
+        """Call back when the transport becomes connected or disconnected."""
+        self._status_callbacks.append(status_callback)
+
+        @callback
+        def async_unsubscribe() -> None:
+            """Stop calling back."""
+            self._status_callbacks.remove(status_callback)
+
+        return async_unsubscribe
+
+    @callback
+    def _async_status_changed(self) -> None:
+        """Report when all connections are up or the first one dropped."""
+        connected = all(connection.connected for connection in self._connections)
+        if connected == self._connected:
+            return
+        self._connected = connected
+        for status_callback in list(self._status_callbacks):
+            status_callback(connected)
+
+    @callback
+    def async_start(self) -> None:
+        """Start every connection."""
+        for connection in self._connections:
+            connection.async_start()
+
+    async def async_stop(self) -> None:
+        """Close every connection."""
+        await asyncio.gather(*(connection.async_stop() for connection in self._connections))
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return transport state for diagnostics."""
+        return {
+            "name": self.name,
+            "connected": self.connected,
+            "host": self._settings["host"],
+            "port": self._settings["port"],
+            "tls": self._settings["tls"],
+            "connections": [connection.as_dict() for connection in self._connections],
+        }
+
+
+@callback
+def async_direct_settings(hass: HomeAssistant, options: dict[str, Any]) -> dict[str, Any] | None:
+    """Return the broker settings of the direct transport.
+
+    Without a broker in the options, the broker, port and credentials of the
+    MQTT integration are used. Returns None when neither names a broker.
+    """
+    if host := options.get(CONF_BROKER):
+        settings = {
+            "host": host,
+            "port": options.get(CONF_BROKER_PORT, DEFAULT_BROKER_PORT),
+            "username": options.get(CONF_BROKER_USERNAME) or None,
+            "password": options.get(CONF_BROKER_PASSWORD) or None,
+        }
+    else:
+        entries = hass.config_entries.async_entries(mqtt.DOMAIN)
+        if not entries or not (host := entries[0].data.get("broker")):
+            return None
+        data = entries[0].data
+        settings = {
+            "host": host,
+            "port": data.get("port", DEFAULT_BROKER_PORT),
+            "username": data.get("username"),
+            "password": data.get("password"),
+        }
+    protocol = options.get(CONF_BROKER_PROTOCOL, MQTT_PROTOCOL_5)
+    settings["protocol"] = (
+        packets.PROTOCOL_LEVEL_5 if protocol == MQTT_PROTOCOL_5 else packets.PROTOCOL_LEVEL_311
+    )
+    settings["share_group"] = options.get(CONF_BROKER_SHARE_GROUP) or None
+    settings["tls"] = tls = options.get(CONF_BROKER_TLS, TLS_OFF)
+    if tls == TLS_OFF:
+        settings["ssl"] = None
+    elif tls == TLS_INSECURE:
+        settings["ssl"] = get_default_no_verify_context()
+    else:
+        settings["ssl"] = client_context()
+    return settings
@@ -0,0 +1,219 @@
+"""Handler-duration and event-loop lag watchdog for QUBO message paths."""
+from __future__ import annotations
+
+from bisect import bisect_left
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .const import DATA_WATCHDOG
+
+_LOGGER = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in microseconds, the last bucket is open
+BUCKET_BOUNDS_US = (50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000)
+
+LAG_PROBE_INTERVAL = 1.0  # seconds between loop lag samples
+SENSOR_WINDOW = 30  # lag probes per sensor update
+SLOW_LOG_INTERVAL = 300  # seconds between slow handler reports per handler
+
+LOOP_LAG = "loop_lag"
+
+
+class DurationHistogram:
+    """Fixed-bucket histogram of durations in nanoseconds."""
+
+    __slots__ = ("bounds_us", "bounds_ns", "count", "total_ns", "max_ns", "buckets")
+
+    def __init__(self, bounds_us: tuple[int, ...] = BUCKET_BOUNDS_US) -> None:
+        """Initialize an empty histogram with bucket upper bounds in microseconds."""
+        self.bounds_us = bounds_us
+        self.bounds_ns = tuple(bound * 1_000 for bound in bounds_us)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * (len(bounds_us) + 1)
+
+    def record(self, duration_ns: int) -> None:
+        """Add a duration."""
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.buckets[bisect_left(self.bounds_ns, duration_ns)] += 1
+
+    def percentile_us(self, percentile: float) -> int | None:
+        """Return the bucket bound the given share of durations stays under."""
+        if not self.count:
+            return None
+        max_us = round(self.max_ns / 1_000)
+        target = self.count * percentile
+        seen = 0
+        for index, bound in enumerate(self.bounds_us):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(bound, max_us)
+        return max_us
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a summary for diagnostics."""
+        return {
+            "count": self.count,
+            "mean_us": round(self.total_ns / self.count / 1_000, 1) if self.count else None,
+            "p50_us": self.percentile_us(0.5),
+            "p95_us": self.percentile_us(0.95),
+            "p99_us": self.percentile_us(0.99),
+            "max_us": round(self.max_ns / 1_000, 1),
+            "buckets_us": dict(
+                zip([*map(str, self.bounds_us), "inf"], self.buckets, strict=True)
+            ),
+        }
+
+
+class QuboWatchdog:
+    """Record how long QUBO handlers and publishes take and how late the loop runs.
+
+    The router calls async_record with a perf_counter_ns duration for every
+    handler it runs and every command it publishes. Handlers slower than the
+    threshold are reported at most once per handler every few minutes, with
+    the number of slow calls seen since the last report. A probe scheduled
+    every second measures how late the event loop runs it.
+    """
+
+    def __init__(self, hass: HomeAssistant, slow_threshold_ms: int) -> None:
+        """Initialize the watchdog."""
+        self.hass = hass
+        self._slow_threshold_ns = slow_threshold_ms * 1_000_000
+        self._histograms: dict[str, DurationHistogram] = {}
+        # handler -> (slow calls since last report, monotonic time of last report)
+        self._slow: dict[str, tuple[int, float]] = {}
+
+        self._probe_handle: Any = None
+        self._probe_due = 0.0
+        self._probes = 0
+        # Worst values of the current sensor window
+        self._window_lag_ns = 0
+        self._window_handler_ns = 0
+        self._window_handler = ""
+        self.loop_lag_ms: float | None = None
+        self.slowest_handler_ms: float | None = None
+        self.slowest_handler: str | None = None
+        self._listeners: list[CALLBACK_TYPE] = []
+
+    @callback
+    def async_start(self) -> CALLBACK_TYPE:
+        """Start the loop lag probe."""
+        self._probe_due = self.hass.loop.time() + LAG_PROBE_INTERVAL
+        self._probe_handle = self.hass.loop.call_at(self._probe_due, self._async_probe)
+
+        @callback
+        def async_stop() -> None:
+            """Stop the loop lag probe."""
+            if self._probe_handle is not None:
+                self._probe_handle.cancel()
+                self._probe_handle = None
+
+        return async_stop
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Listen for sensor window updates."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_record(self, name: str, duration_ns: int) -> None:
+        """Record the duration of a handler or publish."""
+        self._async_histogram(name).record(duration_ns)
+        if duration_ns > self._window_handler_ns:
+            self._window_handler_ns = duration_ns
+            self._window_handler = name
+        if duration_ns > self._slow_threshold_ns:
+            self._async_report_slow(name, duration_ns)
+
+    def _async_histogram(self, name: str) -> DurationHistogram:
+        """Return the histogram for a handler, creating it on first use."""
+        if (histogram := self._histograms.get(name)) is None:
+            histogram = self._histograms[name] = DurationHistogram()
+        return histogram
+
+    @callback
+    def _async_report_slow(self, name: str, duration_ns: int) -> None:
+        """Log a slow handler or loop stall, rate limited per name."""
+        suppressed, reported_at = self._slow.get(name, (0, -SLOW_LOG_INTERVAL))
+        now = time.monotonic()
+        if now - reported_at < SLOW_LOG_INTERVAL:
+            self._slow[name] = (suppressed + 1, reported_at)
+            return
+        self._slow[name] = (0, now)
+        _LOGGER.warning(
+            "QUBO watchdog: %s took %.1f ms, above the %d ms threshold "
+            "(%d more since the last report)",
+            name, duration_ns / 1_000_000, self._slow_threshold_ns // 1_000_000, suppressed
+        )
+
+    @callback
+    def _async_probe(self) -> None:
+        """Measure how late the loop ran the probe and schedule the next one."""
+        now = self.hass.loop.time()
+        lag_ns = max(0, int((now - self._probe_due) * 1_000_000_000))
+        self._async_histogram(LOOP_LAG).record(lag_ns)
+        self._window_lag_ns = max(self._window_lag_ns, lag_ns)
+        if lag_ns > self._slow_threshold_ns:
+            self._async_report_slow(LOOP_LAG, lag_ns)
+
+        self._probes += 1
+        if self._probes >= SENSOR_WINDOW:
+            self._async_close_window()
+
+        self._probe_due = now + LAG_PROBE_INTERVAL
+        self._probe_handle = self.hass.loop.call_at(self._probe_due, self._async_probe)
+
+    @callback
+    def _async_close_window(self) -> None:
+        """Publish the worst values of the window to the sensors."""
+        self.loop_lag_ms = round(self._window_lag_ns / 1_000_000, 2)
+        if self._window_handler:
+            self.slowest_handler_ms = round(self._window_handler_ns / 1_000_000, 2)
+            self.slowest_handler = self._window_handler
+        else:
+            self.slowest_handler_ms = 0.0
+            self.slowest_handler = None
+
+        self._probes = 0
+        self._window_lag_ns = 0
+        self._window_handler_ns = 0
+        self._window_handler = ""
+        for update_callback in self._listeners:
+            update_callback()
+
+    @callback
+    def as_dict(self) -> dict[str, Any]:
+        """Return watchdog state for diagnostics."""
+        return {
+            "slow_threshold_ms": self._slow_threshold_ns // 1_000_000,
+            "loop_lag": (
+                self._histograms[LOOP_LAG].as_dict() if LOOP_LAG in self._histograms else None
+            ),
+            "handlers": {
+                name: histogram.as_dict()
+                for name, histogram in sorted(self._histograms.items())
+                if name != LOOP_LAG
+            },
+            "slow_calls_unreported": {
+                name: suppressed for name, (suppressed, _) in self._slow.items() if suppressed
+            },
+        }
+
+
+@callback
+def async_get_watchdog(hass: HomeAssistant) -> QuboWatchdog | None:
+    """Return the running watchdog, if the Fleet entry enabled it."""
+    return hass.data.get(DATA_WATCHDOG)
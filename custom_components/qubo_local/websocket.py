@@ -0,0 +1,94 @@
+"""Websocket API for QUBO fleet dashboards."""
+from __future__ import annotations
+
+import time
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DEFAULT_FLEET_PUSH_RATE, DOMAIN
+from .devicestate import async_get_device_states
+
+ATTR_MAX_RATE = "max_rate"
+
+
+@callback
+def async_setup_websocket(hass: HomeAssistant) -> None:
+    """Register the websocket commands."""
+    websocket_api.async_register_command(hass, ws_subscribe_fleet)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/fleet/subscribe",
+        vol.Optional(ATTR_MAX_RATE, default=DEFAULT_FLEET_PUSH_RATE): vol.All(
+            vol.Coerce(float), vol.Range(min=0.1, max=20)
+        ),
+    }
+)
+@callback
+def ws_subscribe_fleet(
+    hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict[str, Any]
+) -> None:
+    """Send a snapshot of every device, then batches of the devices that changed.
+
+    The first event holds the full record of every device under "snapshot".
+    Later events hold the changed values under "changes", at most max_rate
+    events per second. A device that was added is sent with its full record
+    and a removed device as null.
+    """
+    store = async_get_device_states(hass)
+    interval = 1 / msg[ATTR_MAX_RATE]
+    pending: set[str] = set()
+    # Devices the dashboard already has a full record of
+    known = set(store.devices)
+    flush_handle: Any = None
+    last_sent = 0.0
+
+    @callback
+    def async_flush() -> None:
+        """Send the changes collected since the last batch."""
+        nonlocal flush_handle, last_sent
+        flush_handle = None
+        last_sent = time.monotonic()
+        changes: dict[str, dict[str, Any] | None] = {}
+        for device_uuid in pending:
+            if (device := store.devices.get(device_uuid)) is None:
+                if device_uuid in known:
+                    known.discard(device_uuid)
+                    changes[device_uuid] = None
+            elif device_uuid in known:
+                changes[device_uuid] = device.as_compact(full=False)
+            else:
+                known.add(device_uuid)
+                changes[device_uuid] = device.as_compact()
+        pending.clear()
+        if changes:
+            connection.send_message(websocket_api.event_message(msg["id"], {"changes": changes}))
+
+    @callback
+    def async_device_changed(device_uuid: str) -> None:
+        """Collect a changed device for the next batch."""
+        nonlocal flush_handle
+        pending.add(device_uuid)
+        if flush_handle is None:
+            delay = max(0.0, last_sent + interval - time.monotonic())
+            flush_handle = hass.loop.call_later(delay, async_flush)
+
+    unsub_store = store.async_add_listener(async_device_changed)
+
+    @callback
+    def async_unsubscribe() -> None:
+        """Stop sending changes."""
+        unsub_store()
+        if flush_handle is not None:
+            flush_handle.cancel()
+
+    connection.subscriptions[msg["id"]] = async_unsubscribe
+    connection.send_result(msg["id"])
+    connection.send_message(
+        websocket_api.event_message(msg["id"], {"snapshot": store.snapshot()})
+    )